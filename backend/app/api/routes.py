@@ -1,12 +1,24 @@
 from pathlib import Path
-import traceback
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-import tempfile
 import os
+import traceback
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query, Request
+from starlette.concurrency import run_in_threadpool
 from app.services.csv_parser import CSVParser
-from app.models.models import ImportedData
-from fastapi.responses import StreamingResponse
-from typing import List
+from app.services.ingestion import parser_en_flux
+from app.models.models import Apercu, ImportedData, MetriquesCoalescence, MetriquesOrdonnanceur, RapportValidation
+from app.services.cache import cle_classeur, empreinte_donnees, etag_classeur
+from app.services.coalescence import coalesceur
+from app.services.disk_cache import cache_disque, empreinte_flux
+from app.services.scheduler import cout_octets, cout_upload, ordonnanceur
+from app.services.speculation import generer_classeur_en_cache, speculation
+from app.services.calculs import calculer_apercu
+from app.services.documents import XLSX_MEDIA_TYPE, documents_demandes, generer_dossier
+from app.services.tables import calculer_tables, exporter_tables, resoudre_format
+from app.services.traces import span
+from fastapi.responses import Response, StreamingResponse
+from functools import lru_cache
+from io import BytesIO
+from typing import BinaryIO, Callable, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger("uvicorn.error") 
@@ -16,28 +28,133 @@ TEMPLATE_PATH = BASE_DIR / "resources" / "templates" / "tb_modele_modification_d
 
 # Stockage en mémoire
 current_data: ImportedData = None
+current_empreinte: Optional[str] = None
+
+def _preparer_parser(file: UploadFile) -> Tuple[CSVParser, int]:
+    """Valide le fichier uploadé (CSV éventuellement compressé, ou XLSX), configure le parser
+    et estime le coût du traitement (en lignes) pour le contrôle d'admission"""
+    parser = CSVParser()
+    if CSVParser.is_xlsx(file):
+        CSVParser.validate_xlsx(file)
+        return parser, cout_upload(file)
+
+    dialecte = CSVParser.validate_csv(file)
+    parser.apply_dialect(dialecte)
+    return parser, cout_upload(file, dialecte)
+
+def _lire_upload(file: UploadFile) -> str:
+    """Lit le fichier uploadé une première fois pour calculer son empreinte"""
+    with span("lecture_upload", octets=file.size or 0):
+        return empreinte_flux(file.file)
+
+def _parser_upload(file: UploadFile, empreinte: Optional[str] = None) -> ImportedData:
+    """Parse le fichier uploadé, ou reprend ses données du cache disque (même contenu déjà parsé)"""
+    parser, cout = _preparer_parser(file)
+    if cache_disque is None:
+        empreinte = None
+    elif empreinte is None:
+        empreinte = _lire_upload(file)
+    data = cache_disque.donnees(empreinte) if empreinte else None
+    if data is None:
+        with ordonnanceur.admission(cout):
+            data = parser.parse_upload(file)
+        if empreinte:
+            cache_disque.ajouter_donnees(empreinte, data)
+    return data
+
+TAILLE_BLOC_ENVOI = 64 * 1024
+
+class _ReponseFichierOuvert(Response):
+    """Fichier déjà ouvert (cache disque), envoyé sans être chargé en mémoire : par le
+    serveur lui-même (extension ASGI zerocopysend, sendfile) s'il la propose, sinon par
+    blocs. Le descripteur, ouvert avant une éventuelle éviction, est fermé après l'envoi."""
+
+    def __init__(self, fichier: BinaryIO, media_type: str, headers: dict):
+        self.fichier = fichier
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        headers["Content-Length"] = str(os.fstat(fichier.fileno()).st_size)
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": self.fichier, "more_body": False})
+            else:
+                while bloc := await run_in_threadpool(self.fichier.read, TAILLE_BLOC_ENVOI):
+                    await send({"type": "http.response.body", "body": bloc, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.fichier.close()
+
+def _reponse_fichier(
+    resultat: BinaryIO, filename: str, etag: Optional[str] = None, media_type: str = XLSX_MEDIA_TYPE
+):
+    """Réponse de téléchargement (classeur, archive) : contenu en mémoire, ou fichier du cache disque"""
+    headers = {"ETag": etag} if etag else {}
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if isinstance(resultat, BytesIO):
+        return StreamingResponse(resultat, media_type=media_type, headers=headers)
+    return _ReponseFichierOuvert(resultat, media_type, headers)
+
+def _dossier_partage(
+    etag: str, produire: Callable[[], Tuple[BinaryIO, str, str]]
+) -> Tuple[BinaryIO, str, str]:
+    """Dossier (classeur, ou archive avec les documents) produit une seule fois pour les requêtes
+    simultanées de même ETag : mêmes entrées, mêmes feuilles, même profil"""
+    ouvert = []
+
+    def travail():
+        contenu, filename, media_type = produire()
+        if not isinstance(contenu, BytesIO):
+            # Fichier du cache disque : servi à cette seule requête, les autres l'ouvrent à leur tour
+            ouvert.append(contenu)
+            return None, filename, media_type
+        return contenu.getvalue(), filename, media_type
+
+    contenu, filename, media_type = coalesceur.executer(("dossier", etag), travail)
+    if ouvert:
+        return ouvert[0], filename, media_type
+    if contenu is None:
+        return produire()
+    return BytesIO(contenu), filename, media_type
+
+def _non_modifie(request: Request, etag: str) -> Optional[Response]:
+    """Réponse 304 si le client possède déjà ce classeur (If-None-Match), sans le générer"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    etags = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    if "*" in etags or etag in etags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+def _classeur_courant(request: Request, fichier: str, profil: Optional[str], filename: str):
+    """Feuille demandée des données uploadées, ou 304 si le client l'a déjà"""
+    if current_data is None:
+        raise HTTPException(status_code=400, detail="Aucune donnée. Uploadez d'abord un fichier CSV.")
+
+    etag = etag_classeur(cle_classeur(current_empreinte, [fichier], profil))
+    reponse = _non_modifie(request, etag)
+    if reponse is not None:
+        return reponse
+    file_stream = generer_classeur_en_cache(current_data, [fichier], profil, current_empreinte)
+    return _reponse_fichier(file_stream, filename, etag)
 
 @router.post("/upload")
-async def upload_csv(file: UploadFile = File(...)):
-    """Upload et parse un fichier CSV"""
-    global current_data
-    
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Le fichier doit être un CSV")
+def upload_csv(file: UploadFile = File(...)):
+    """Upload et parse un fichier CSV (éventuellement compressé gzip / zstd) ou XLSX"""
+    global current_data, current_empreinte
     
     try:
-        # Sauvegarder temporairement le fichier
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        # Parser le fichier
-        parser = CSVParser()
-        current_data = parser.parse_file(tmp_path)
-        
-        # Nettoyer
-        os.unlink(tmp_path)
+        current_data = _parser_upload(file)
+        current_empreinte = empreinte_donnees(current_data)
+        # Les feuilles sont presque toujours téléchargées ensuite : on les prépare
+        speculation.lancer(current_data, current_empreinte)
         
         return {
             "success": True,
@@ -46,99 +163,49 @@ async def upload_csv(file: UploadFile = File(...)):
             "etages" : current_data.etages
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-xslx-voix")
-async def generate_xslx_voix():
+def generate_xslx_voix(request: Request, profilCompression: Optional[str] = None):
     """Génère un fichier XLSX pour les voix"""
-    global current_data
-    
-    if current_data is None:
-        raise HTTPException(status_code=400, detail="Aucune donnée. Uploadez d'abord un fichier CSV.")
-    
     try:
-        parser = CSVParser()
-        file_stream = parser.generer_xlxs_voix(current_data)  
-        
-        headers = {
-            "Content-Disposition": 'attachment; filename="Voix.xlsx"'
-        }
-        
-        return StreamingResponse(
-            file_stream, 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers = headers)  
+        return _classeur_courant(request, "Voix", profilCompression, "Voix.xlsx")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
     
 @router.post("/generate-xslx-quot")
-async def generate_xslx_voix():
+def generate_xslx_quot(request: Request, profilCompression: Optional[str] = None):
     """Génère un fichier XLSX pour les Quot P CH2"""
-    global current_data
-    
-    if current_data is None:
-        raise HTTPException(status_code=400, detail="Aucune donnée. Uploadez d'abord un fichier CSV.")
-    
     try:
-        parser = CSVParser()
-        file_stream = parser.generer_xlxs_quotation(current_data)  
-        
-        headers = {
-            "Content-Disposition": 'attachment; filename="Quot_P_CH2.xlsx"'
-        }
-        
-        return StreamingResponse(
-            file_stream, 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers = headers)  
+        return _classeur_courant(request, "Quot P CH2", profilCompression, "Quot_P_CH2.xlsx")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-xslx-ta")
-async def generate_xslx_ta():
+def generate_xslx_ta(request: Request, profilCompression: Optional[str] = None):
     """Génère un fichier XLSX pour le tableau A des contenances"""
-    global current_data
-    
-    if current_data is None:
-        raise HTTPException(status_code=400, detail="Aucune donnée. Uploadez d'abord un fichier CSV.")
-
     try:
-        parser = CSVParser()
-        file_stream = parser.generer_xlxs_ta(current_data)
-        
-        headers = {
-            "Content-Disposition": 'attachment; filename="TA.xlsx"'
-        }
-        
-        return StreamingResponse(
-            file_stream, 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers = headers)  
+        return _classeur_courant(request, "TA", profilCompression, "TA.xlsx")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-xslx-tr-n")
-async def generate_xslx_tn_r():
+def generate_xslx_tn_r(request: Request, profilCompression: Optional[str] = None):
     """Génère un fichier XLSX pour le tableau TR-N des contenances"""
-    global current_data
-    
-    if current_data is None:
-        raise HTTPException(status_code=400, detail="Aucune donnée. Uploadez d'abord un fichier CSV.")
-
     try:
-        parser = CSVParser()
-        file_stream = parser.generer_excel_tr_n(current_data)
-        
-        headers = {
-            "Content-Disposition": 'attachment; filename="TA.xlsx"'
-        }
-        
-        return StreamingResponse(
-            file_stream, 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers = headers)  
+        return _classeur_courant(request, "TR-N", profilCompression, "TR-N.xlsx")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -152,42 +219,170 @@ def get_data():
     
     return current_data
 
+@lru_cache(maxsize=1)
+def modele_octets() -> bytes:
+    """Modèle TB, lu une seule fois par processus (avant le fork des workers avec app.serveur)"""
+    return TEMPLATE_PATH.read_bytes()
+
 @router.get("/modele")
 def get_modele():
     """  Retourne le template à utiliser comme modèle pour la génération des fichiers """
-    file = open(TEMPLATE_PATH, mode="rb")
     headers = {
             "Content-Disposition": 'attachment; filename="TB_template.xlsx"'
     }
-    return StreamingResponse(
-        file,
+    return Response(
+        modele_octets(),
         headers=headers,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
     
 @router.post("/fichiers-copropriete")
 def get_fichiers_copropriete(
+    request: Request,
     fichiersAGenerer: List[str] = Form(...), 
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    profilCompression: Optional[str] = Form(None)
 ): 
     if not fichiersAGenerer or not file:
         raise HTTPException(status_code=400, detail="Vous devez spécifier au moins un fichier à générer et passer un fichier comme entrée")
     
     try:
-        parser = CSVParser()
-        delimiter = CSVParser.validate_csv(file)
-        parser.delimiter = delimiter
-        file_stream = parser.generer_fichiers_copropriete(fichiersAGenerer, file)
-
-        headers = {
-                "Content-Disposition": 'attachment; filename="fichier.xlsx"'
-        }
-        return StreamingResponse (
-            file_stream,
-            headers=headers,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # ETag dérivé du contenu uploadé : un 304 ne parse ni ne génère rien
+        empreinte = _lire_upload(file)
+        etag = etag_classeur(
+            cle_classeur(empreinte, fichiersAGenerer, profilCompression), documents_demandes(fichiersAGenerer)
         )
+        reponse = _non_modifie(request, etag)
+        if reponse is not None:
+            return reponse
+        # Requêtes identiques simultanées (double clic) : un seul parsing et un seul rendu
+        def produire():
+            data = _parser_upload(file, empreinte)
+            return generer_dossier(
+                data,
+                fichiersAGenerer,
+                lambda feuilles, calculs: generer_classeur_en_cache(data, feuilles, profilCompression, calculs=calculs),
+            )
+        file_stream, filename, media_type = _dossier_partage(etag, produire)
+        return _reponse_fichier(file_stream, filename, etag, media_type)
         # return "No error"
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Une erreur est survenue:\n%s", traceback.format_exc())
-        raise HTTPException(status_code = 500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code = 500, detail=str(e))
+
+# Types de contenu acceptés pour l'envoi brut (non multipart) d'un CSV
+CONTENT_TYPES_FLUX = {"text/csv", "text/plain", "application/gzip", "application/x-gzip", "application/zstd", "application/octet-stream"}
+
+@router.post("/fichiers-copropriete/flux")
+async def get_fichiers_copropriete_flux(
+    request: Request,
+    fichiersAGenerer: List[str] = Query(...),
+    profilCompression: Optional[str] = None
+):
+    """Comme /fichiers-copropriete, mais le CSV est envoyé en corps brut et parsé au fil de sa réception.
+
+    Un corps multipart est entièrement mis en tampon par Starlette avant
+    l'appel du handler ; ici le parsing avance pendant le transfert.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in CONTENT_TYPES_FLUX:
+        raise HTTPException(status_code=415, detail=f"Type de contenu non supporté en flux : {content_type or 'absent'} (CSV uniquement)")
+
+    content_encoding = request.headers.get("content-encoding")
+    taille = request.headers.get("content-length")
+    cout = cout_octets(
+        int(taille) if taille and taille.isdigit() else None,
+        compresse=bool(content_encoding) or content_type in {"application/gzip", "application/x-gzip", "application/zstd"},
+    )
+    ticket = await run_in_threadpool(ordonnanceur.acquerir, cout)
+    try:
+        parser = CSVParser()
+        with span("reception_corps", octets=int(taille) if taille and taille.isdigit() else 0):
+            data = await parser_en_flux(parser, request.stream(), content_encoding)
+        # Le corps n'est connu qu'une fois lu : l'ETag dérive des données parsées, le 304 évite le rendu
+        etag = etag_classeur(
+            cle_classeur(await run_in_threadpool(empreinte_donnees, data), fichiersAGenerer, profilCompression),
+            documents_demandes(fichiersAGenerer),
+        )
+        reponse = _non_modifie(request, etag)
+        if reponse is not None:
+            return reponse
+        file_stream, filename, media_type = await run_in_threadpool(
+            _dossier_partage,
+            etag,
+            lambda: generer_dossier(
+                data,
+                fichiersAGenerer,
+                lambda feuilles, calculs: parser.generer_classeur(data, feuilles, profilCompression, calculs=calculs),
+            ),
+        )
+        return _reponse_fichier(file_stream, filename, etag, media_type)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Une erreur est survenue:\n%s", traceback.format_exc())
+        raise HTTPException(status_code = 500, detail=str(e))
+    finally:
+        ordonnanceur.liberer(ticket)
+
+@router.post("/apercu", response_model=Apercu)
+def get_apercu(
+    file: UploadFile = File(...),
+    fichiersAGenerer: Optional[List[str]] = Form(None)
+):
+    """Retourne les tableaux calculés de chaque feuille en JSON, sans générer le classeur XLSX"""
+    try:
+        data = _parser_upload(file)
+        return calculer_apercu(data, fichiersAGenerer or CSVParser.excel_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Une erreur est survenue:\n%s", traceback.format_exc())
+        raise HTTPException(status_code = 500, detail=str(e))
+
+@router.post("/tables")
+def get_tables(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None)
+):
+    """Tables lots et etages des tableaux calculés, en colonnes (Parquet, Arrow IPC ou CSV), dans une archive
+    zip : pour les traitements en aval, sans relire de classeur XLSX"""
+    try:
+        format = resoudre_format(format)
+        data = _parser_upload(file)
+        with span("tables", format=format):
+            archive = exporter_tables(calculer_tables(data), format)
+        return _reponse_fichier(archive, "tables.zip", media_type="application/zip")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Une erreur est survenue:\n%s", traceback.format_exc())
+        raise HTTPException(status_code = 500, detail=str(e))
+
+@router.post("/valider", response_model=RapportValidation)
+def valider_fichier(file: UploadFile = File(...)):
+    """Valide un fichier TB et retourne les erreurs et avertissements, ligne par ligne"""
+    parser, cout = _preparer_parser(file)
+    parser.strict = False
+
+    try:
+        with ordonnanceur.admission(cout):
+            parser.parse_upload(file)
+        return parser.rapport
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Une erreur est survenue:\n%s", traceback.format_exc())
+        raise HTTPException(status_code = 500, detail=str(e))
+
+@router.get("/metrics", response_model=MetriquesOrdonnanceur)
+def get_metrics():
+    """Files d'attente et travaux en cours par voie d'admission (rapide / lourde)"""
+    return ordonnanceur.metriques()
+
+@router.get("/metrics/coalescence", response_model=MetriquesCoalescence)
+def get_metrics_coalescence():
+    """Requêtes identiques simultanées servies par un seul calcul"""
+    return coalesceur.metriques()
@@ -0,0 +1,228 @@
+"""Génération en masse des classeurs, sans le serveur FastAPI
+
+Les fichiers TB (CSV, éventuellement compressés, ou XLSX) désignés par des
+répertoires ou des motifs glob sont répartis sur un pool de processus ; un
+classeur est écrit par titre foncier dans le répertoire de sortie. Les
+sources dont le contenu n'a pas changé depuis la dernière exécution sont
+ignorées.
+
+Avec --surveiller, le dossier donné est surveillé en continu (mode démon) :
+les fichiers déposés ou modifiés sont générés dès la fin de leur écriture.
+
+Avec --tables, aucun classeur n'est écrit : les tableaux calculés de
+toutes les sources sont exportés en colonnes dans deux fichiers, lots et
+etages (Parquet, Arrow IPC ou CSV), pour les chargements en masse.
+
+    cd backend && python -m app.cli archives/2024 "depots/*.csv.gz" -o classeurs --fichiers "Quot P CH2,TA"
+    cd backend && python -m app.cli --surveiller /srv/depot -o /srv/classeurs
+    cd backend && python -m app.cli archives/2024 -o analyses --tables parquet
+"""
+import argparse
+import glob
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from fastapi import HTTPException
+
+from app.services.csv_parser import CSVParser
+from app.services.generation_hors_ligne import (
+    EtatGeneration,
+    Resultat,
+    est_source,
+    generer_source,
+    resultat_interrompu,
+    tables_source,
+)
+from app.services.surveillance import Surveillant
+from app.services.tables import FORMATS_TABLES, SCHEMAS, Tables, ecrire_table, resoudre_format
+from app.services.xlsx_writer import PROFILS_COMPRESSION, resoudre_profil
+
+
+def lister_sources(entrees: Iterable[str]) -> List[Path]:
+    """Fichiers TB désignés par des répertoires (récursivement), des fichiers ou des motifs glob"""
+    sources = {}
+    for entree in entrees:
+        chemin = Path(entree)
+        if chemin.is_dir():
+            candidats = (p for p in chemin.rglob("*") if p.is_file())
+        else:
+            candidats = (Path(p) for p in glob.glob(entree, recursive=True))
+        for candidat in candidats:
+            if est_source(candidat):
+                sources[candidat.resolve()] = candidat
+    return sorted(sources.values())
+
+
+def _fichiers(valeur: str) -> List[str]:
+    fichiers = [f.strip() for f in valeur.split(",") if f.strip()]
+    inconnus = [f for f in fichiers if f not in CSVParser.excel_key]
+    if inconnus or not fichiers:
+        raise argparse.ArgumentTypeError(
+            f"feuilles inconnues : {', '.join(inconnus)} (attendu : {', '.join(CSVParser.excel_key)})"
+        )
+    return fichiers
+
+
+def _soumettre(
+    executeur: ProcessPoolExecutor, args: argparse.Namespace, profil: str, source: Path, empreinte: str
+) -> Future:
+    return executeur.submit(
+        generer_source, str(source), empreinte, args.fichiers, str(args.sortie), profil, not args.non_strict,
+    )
+
+
+def generer_sources(args: argparse.Namespace, profil: str, a_generer: List[Tuple[Path, str]]) -> Iterator[Resultat]:
+    """Résultats de la génération des sources, dans leur ordre, au fil de l'eau.
+
+    Un processus tué (mémoire, signal) casse tout le pool, et avec lui les
+    générations en cours : un nouveau pool est créé, la source attendue est
+    relancée seule puis les suivantes. Une source qui casse aussi le pool
+    relancé est en échec ; les autres sources sont générées.
+    """
+    executeur = ProcessPoolExecutor(max(1, args.workers))
+    try:
+        futures = [_soumettre(executeur, args, profil, source, empreinte) for source, empreinte in a_generer]
+        for i, (source, empreinte) in enumerate(a_generer):
+            try:
+                resultat = futures[i].result()
+            except BrokenProcessPool:
+                executeur.shutdown(cancel_futures=True)
+                executeur = ProcessPoolExecutor(max(1, args.workers))
+                try:
+                    resultat = _soumettre(executeur, args, profil, source, empreinte).result()
+                except BrokenProcessPool:
+                    executeur.shutdown(cancel_futures=True)
+                    executeur = ProcessPoolExecutor(max(1, args.workers))
+                    resultat = resultat_interrompu(source, empreinte)
+                futures[i + 1:] = [_soumettre(executeur, args, profil, s, e) for s, e in a_generer[i + 1:]]
+            yield resultat
+    finally:
+        executeur.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("entrees", nargs="+", help="répertoires, fichiers ou motifs glob de fichiers TB")
+    parser.add_argument("-o", "--sortie", required=True, type=Path, help="répertoire des classeurs générés")
+    parser.add_argument("--fichiers", type=_fichiers, default=list(CSVParser.excel_key),
+                        help="feuilles à générer, séparées par des virgules (défaut : toutes)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processus de génération")
+    parser.add_argument("--profil", choices=list(PROFILS_COMPRESSION), help="profil de compression XLSX")
+    parser.add_argument("--non-strict", action="store_true", help="génère malgré les erreurs de validation")
+    parser.add_argument("--force", action="store_true", help="régénère même les sources à jour")
+    parser.add_argument("--surveiller", action="store_true", help="surveille le dossier donné en continu (démon)")
+    parser.add_argument("--scrutation", action="store_true", help="avec --surveiller : scrutation au lieu d'inotify")
+    parser.add_argument("--tables", choices=list(FORMATS_TABLES),
+                        help="exporte les tables lots / etages dans ce format, sans classeurs")
+    args = parser.parse_args(argv)
+
+    if args.tables:
+        return exporter_tables(parser, args)
+    profil = resoudre_profil(args.profil)
+    if args.surveiller:
+        return surveiller(parser, args, profil)
+
+    args.sortie.mkdir(parents=True, exist_ok=True)
+    etat = EtatGeneration(args.sortie)
+
+    sources = lister_sources(args.entrees)
+    a_generer = []
+    for source in sources:
+        empreinte = etat.empreinte(source, args.fichiers, profil)
+        if args.force or not etat.a_jour(source, empreinte):
+            a_generer.append((source, empreinte))
+
+    debut = time.perf_counter()
+    generes: List[Resultat] = []
+    echecs: List[Resultat] = []
+    # Publication dans l'ordre des sources : en cas de titre foncier en double, la première l'emporte
+    for resultat in generer_sources(args, profil, a_generer):
+        if resultat.erreur is None:
+            resultat = etat.publier(resultat)
+        (echecs if resultat.erreur is not None else generes).append(resultat)
+    duree = time.perf_counter() - debut
+    etat.fermer()
+
+    nb_lots = sum(r.nb_lots for r in generes)
+    octets = sum(r.octets for r in generes + echecs)
+    print(f"{len(sources)} sources : {len(generes)} générées, {len(sources) - len(a_generer)} à jour, {len(echecs)} échecs")
+    if a_generer:
+        print(
+            f"{duree:.1f} s, {len(a_generer) / duree:.1f} fichiers/s, {nb_lots / duree:.0f} lots/s,"
+            f" {octets / duree / 1024 / 1024:.2f} Mo/s ({args.workers} processus)"
+        )
+    for resultat in echecs:
+        print(f"  échec {resultat.source} : {resultat.erreur}", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+def exporter_tables(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    """Tables de toutes les sources, concaténées dans l'ordre des sources : lots.<ext>, etages.<ext>"""
+    try:
+        format = resoudre_format(args.tables)
+    except HTTPException as e:
+        parser.error(e.detail)
+    args.sortie.mkdir(parents=True, exist_ok=True)
+
+    sources = lister_sources(args.entrees)
+    debut = time.perf_counter()
+    tables = Tables()
+    echecs = []
+    with ProcessPoolExecutor(max(1, args.workers)) as executeur:
+        for source, (tables_de_la_source, erreur) in zip(
+            sources, executeur.map(tables_source, map(str, sources), repeat(not args.non_strict))
+        ):
+            if erreur is not None:
+                echecs.append((source, erreur))
+            else:
+                tables.etendre(tables_de_la_source)
+
+    extension, _ = FORMATS_TABLES[format]
+    for nom, colonnes in (("lots", tables.lots), ("etages", tables.etages)):
+        destination = args.sortie / f"{nom}{extension}"
+        temporaire = destination.with_name(f".{destination.name}.tmp")
+        with open(temporaire, "wb") as sortie:
+            ecrire_table(colonnes, SCHEMAS[nom], format, sortie)
+        os.replace(temporaire, destination)
+    duree = time.perf_counter() - debut
+
+    print(
+        f"{len(sources)} sources : {len(sources) - len(echecs)} exportées, {len(echecs)} échecs ;"
+        f" {len(tables)} lots en {duree:.1f} s ({len(tables) / duree:.0f} lots/s, {args.workers} processus)"
+    )
+    for source, erreur in echecs:
+        print(f"  échec {source} : {erreur}", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+def surveiller(parser: argparse.ArgumentParser, args: argparse.Namespace, profil: str) -> int:
+    if len(args.entrees) != 1 or not Path(args.entrees[0]).is_dir():
+        parser.error("--surveiller attend un seul répertoire")
+    repertoire = Path(args.entrees[0]).resolve()
+    if args.sortie.resolve() == repertoire:
+        parser.error("le répertoire de sortie doit être distinct du dossier surveillé")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    surveillant = Surveillant(
+        repertoire, args.sortie, args.fichiers, profil,
+        strict=not args.non_strict, workers=args.workers, scrutation=args.scrutation,
+    )
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, lambda *_: surveillant.arret.set())
+    surveillant.executer()
+    print(f"Arrêt : {surveillant.generes} classeurs générés, {surveillant.echecs} échecs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
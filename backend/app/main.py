@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.services import traces
 
 app = FastAPI(title="Titre Foncier API", version="1.0.0")
 
@@ -11,8 +12,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ETag des classeurs, renvoyé ensuite dans If-None-Match
+    expose_headers=["ETag", "traceparent"],
 )
 
+# Traces par requête (TRACES_FICHIER / TRACES_OTLP_URL), ajoutées après CORS : elles couvrent toute la requête
+if traces.ACTIF:
+    app.add_middleware(traces.MiddlewareTraces)
+
 app.include_router(router)
 
 @app.get("/health")
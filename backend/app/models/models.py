@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from decimal import Decimal
+from typing import Dict, Optional, List
 
 class Lot(BaseModel):
     """Représente un lot dans un étage"""
@@ -26,3 +27,143 @@ class ImportedData(BaseModel):
     """Structure complète des données importées"""
     titre_foncier: str  # Ex: "154311 /05"
     etages: List[Floor]
+
+
+# ========================== Aperçu des tableaux calculés ==========================
+
+class LigneQuotation(BaseModel):
+    """Ligne d'un lot dans le tableau Quot P CH2"""
+    indice_privative: Optional[str] = None
+    indice_commune: Optional[str] = None
+    consistance: str
+    surface_interieure: float
+    surface_avec_surplomb: float
+    quot_part: Optional[Decimal] = None  # Quote-part du terrain (m²), arrondie à 0,01
+    indivision: Optional[Decimal] = None  # Part d'indivision (1/10000), arrondie à l'unité
+    observations: Optional[str] = None
+
+
+class EtageQuotation(BaseModel):
+    """Bloc d'un étage dans le tableau Quot P CH2"""
+    nom: str
+    cotes: str
+    lignes: List[LigneQuotation]
+    total_surface_interieure: Optional[float] = None
+    total_surface_avec_surplomb: Optional[float] = None
+    total_quots_parts: Optional[Decimal] = None  # None si l'étage n'a pas de partie privative
+    total_indivision: Optional[Decimal] = None
+
+
+class Quotation(BaseModel):
+    """Tableau de répartition des quots-parts et dimilième d'indivision (Quot P CH2)"""
+    etages: List[EtageQuotation]
+    total_surface_interieure: float  # Parties privatives uniquement
+    total_surface_avec_surplomb: float
+    total_quots_parts: Decimal
+    total_indivision: Decimal
+
+
+class LigneVoix(BaseModel):
+    """Ligne d'une partie privative dans le tableau des voix"""
+    num_ordre: int
+    indice_privative: str
+    consistance: str
+    surface: float  # Si (m²)
+    nvi: Decimal  # NVi (%), arrondi à 0,01
+
+
+class EtageVoix(BaseModel):
+    nom: str
+    lignes: List[LigneVoix]
+
+
+class Voix(BaseModel):
+    """Nombre de voix des copropriétaires (Voix)"""
+    etages: List[EtageVoix]
+    surface_totale: float  # S
+    somme_nvi: Decimal
+
+
+class TotauxConsistance(BaseModel):
+    """Totaux des surfaces privatives par consistance (m², arrondis à l'unité)"""
+    commerces: Optional[Decimal] = None
+    appartements: Optional[Decimal] = None
+
+
+class EtageTRN(TotauxConsistance):
+    """Ligne d'un étage dans le tableau TR-N"""
+    nom: str
+
+
+class LigneTA(BaseModel):
+    """Ligne d'une partie privative dans le tableau A des contenances"""
+    propriete: str
+    indice_privative: str
+    surface_avec_surplomb: float
+    consistance: str
+    observations: Optional[str] = None
+
+
+class EtageTA(BaseModel):
+    nom: str
+    lignes: List[LigneTA]
+
+
+class Apercu(BaseModel):
+    """Tableaux calculés, sans génération du classeur XLSX"""
+    titre_foncier: str
+    quotation: Optional[Quotation] = None
+    tr_n: Optional[List[EtageTRN]] = None
+    tr_c: Optional[TotauxConsistance] = None
+    ta: Optional[List[EtageTA]] = None
+    voix: Optional[Voix] = None
+
+
+# ========================== Validation ==========================
+
+class AnomalieValidation(BaseModel):
+    """Erreur ou avertissement relevé pendant le parsing"""
+    ligne: Optional[int] = None  # Numéro de ligne dans le fichier source (1 = première ligne)
+    colonne: Optional[int] = None  # Cellule en cause, numérotée comme dans le CSV (1 = première colonne)
+    code: str  # Ex: "indice_duplique", "total_incoherent"
+    message: str
+
+
+class RapportValidation(BaseModel):
+    """Résultat de la validation d'un fichier TB"""
+    valide: bool
+    erreurs: List[AnomalieValidation]
+    avertissements: List[AnomalieValidation]
+
+
+# ========================== Ordonnancement ==========================
+
+class MetriquesVoie(BaseModel):
+    """État d'une voie d'admission (rapide ou lourde)"""
+    en_attente: int
+    cout_en_attente: int  # Lignes estimées des travaux en attente
+    en_cours: int
+    admis: int
+    rejetes: int  # Refus 503, file lourde pleine
+    attente_moyenne_ms: float
+    attente_max_ms: float
+
+
+class MetriquesOrdonnanceur(BaseModel):
+    """Métriques du contrôle d'admission"""
+    budget: int  # Coût total admissible en vol, en lignes
+    cout_en_vol: int
+    seuil_lourd: int
+    lourds_max: int
+    voies: Dict[str, MetriquesVoie]
+
+
+class MetriquesCoalescence(BaseModel):
+    """Regroupement des requêtes identiques simultanées"""
+    en_vol: int  # Travaux en cours, une clé chacun
+    en_attente: int  # Requêtes en attente du résultat d'un travail en vol
+    executes: int  # Travaux exécutés
+    partages: int  # Requêtes servies par le résultat d'une autre
+    echecs_partages: int  # Dont erreurs du travail partagé, propagées
+    attente_moyenne_ms: float
+    attente_max_ms: float
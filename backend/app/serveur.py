@@ -0,0 +1,160 @@
+"""Serveur pré-forké : l'API est chargée et préchauffée une fois, puis partagée par les workers
+
+`uvicorn --workers N` démarre chaque worker dans un nouvel interpréteur
+(spawn) : chacun réimporte openpyxl, FastAPI et pydantic, et sa première
+requête paie encore la construction des styles et les premiers passages
+dans le rendu. Ici le processus maître importe l'application, la
+préchauffe (modèle TB de resources/templates, puis une génération
+complète sur un petit immeuble synthétique, qui remplit aussi le registre
+des styles), ouvre le socket, puis forke les workers : l'état préchauffé
+est partagé en copie sur écriture. Un worker qui s'arrête est reforké,
+déjà chaud.
+
+Les durées d'import et de préchauffage sont journalisées au démarrage, et
+chaque worker journalise la latence de sa première requête.
+
+    cd backend && python -m app.serveur --port 8000 --workers 4
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from io import BytesIO
+from typing import Dict
+
+import uvicorn
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def prechauffer() -> Dict[str, float]:
+    """Exécute une fois chaque chemin coûteux au premier appel ; durée de chaque étape (ms)"""
+    from openpyxl import load_workbook
+
+    from app.api.routes import modele_octets
+    from app.services import csv_parser
+    from app.services.cache import empreinte_donnees
+    from app.services.calculs import calculer_apercu
+    from app.services.dialect import detecter_dialecte_prefixe
+    from app.utils.synthetic import generer_csv
+
+    durees = {}
+
+    debut = time.perf_counter()
+    load_workbook(BytesIO(modele_octets()), read_only=True).close()
+    durees["modele"] = (time.perf_counter() - debut) * 1000
+
+    debut = time.perf_counter()
+    contenu = generer_csv(4, 5).encode("utf-8")
+    parser = csv_parser.CSVParser()
+    parser.apply_dialect(detecter_dialecte_prefixe(contenu))
+    data = parser.parse_stream(BytesIO(contenu))
+    empreinte_donnees(data)
+    calculer_apercu(data, csv_parser.CSVParser.excel_key)
+    # Toutes les feuilles : remplit le registre des styles et les mémos d'exposants.
+    # Rendu séquentiel : aucun pool ni thread ne doit exister au moment du fork
+    parser.generer_classeur(data, csv_parser.CSVParser.excel_key, parallele=False)
+    durees["generation"] = (time.perf_counter() - debut) * 1000
+    return durees
+
+
+class _PremiereRequete:
+    """Application ASGI qui journalise la latence de la première requête HTTP du worker"""
+
+    def __init__(self, app):
+        self.app = app
+        self.mesuree = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.mesuree:
+            return await self.app(scope, receive, send)
+        self.mesuree = True
+        debut = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            logger.info(
+                "Worker %d : première requête %s %s en %.0f ms",
+                os.getpid(), scope["method"], scope["path"], (time.perf_counter() - debut) * 1000,
+            )
+
+
+def _worker(config: uvicorn.Config, sock) -> None:
+    """Corps d'un worker forké ; ne revient pas"""
+    from app.services.disk_cache import cache_disque
+
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, signal.SIG_DFL)
+    if cache_disque is not None:
+        cache_disque.apres_fork()
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.serveur", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--sans-prechauffage", action="store_true", help="forke sans préchauffer (comparaison)")
+    args = parser.parse_args(argv)
+
+    debut = time.perf_counter()
+    from app.main import app
+    imports = (time.perf_counter() - debut) * 1000
+
+    config = uvicorn.Config(_PremiereRequete(app), host=args.host, port=args.port, log_level=args.log_level)
+    config.load()
+    durees = {} if args.sans_prechauffage else prechauffer()
+    logger.info(
+        "Imports %.0f ms, préchauffage %s",
+        imports, ", ".join(f"{etape} {duree:.0f} ms" for etape, duree in durees.items()) or "désactivé",
+    )
+
+    sock = config.bind_socket()
+    # L'état chargé passe en génération permanente : le ramasse-miettes des workers
+    # n'y touche plus, les pages restent partagées
+    gc.freeze()
+
+    arret = False
+    workers = set()
+
+    def arreter(signum, _frame):
+        nonlocal arret
+        arret = True
+        for pid in workers:
+            os.kill(pid, signum)
+
+    def lancer():
+        pid = os.fork()
+        if pid == 0:
+            _worker(config, sock)
+        workers.add(pid)
+
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, arreter)
+    for _ in range(max(1, args.workers)):
+        lancer()
+    logger.info("%d workers forkés sur http://%s:%d", len(workers), args.host, args.port)
+
+    while workers:
+        pid, statut = os.wait()
+        workers.discard(pid)
+        if not arret:
+            logger.warning("Worker %d arrêté (statut %d), relancé", pid, statut)
+            time.sleep(1)
+            lancer()
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Cache en mémoire des classeurs XLSX générés.
+
+Clé : empreinte des données parsées, feuilles demandées (ordre de
+CSVParser.excel_key) et profil de compression. Les classeurs sont gardés
+sérialisés (octets) et évincés du moins récemment utilisé au plus ancien
+au-delà d'une taille totale.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Iterable, Optional, Tuple
+
+from app.models.models import ImportedData
+from app.services.csv_parser import CSVParser
+from app.services.xlsx_writer import resoudre_profil
+
+CleClasseur = Tuple[str, Tuple[str, ...], str]
+
+# Taille maximale du cache en mémoire (Mo)
+TAILLE_MAX_MO = float(os.getenv("CACHE_CLASSEURS_MO", "64"))
+
+# Versions portées par les clés du cache disque, qui survit aux redémarrages et aux déploiements.
+# Rendu des classeurs et des documents PV / Règlement : à incrémenter quand les octets générés
+# changent (invalide aussi les ETag)
+VERSION_RENDU = "2"
+# Parsing des fichiers TB : à incrémenter quand les données parsées d'un même fichier changent
+VERSION_PARSEUR = "1"
+
+
+def empreinte_donnees(data: ImportedData) -> str:
+    """Empreinte stable des données parsées"""
+    return hashlib.sha256(data.model_dump_json().encode("utf-8")).hexdigest()
+
+
+def cle_classeur(empreinte: str, fichiers: Iterable[str], profil: Optional[str]) -> CleClasseur:
+    fichiers = set(fichiers)
+    return empreinte, tuple(f for f in CSVParser.excel_key if f in fichiers), resoudre_profil(profil)
+
+
+def nom_cle(cle: CleClasseur) -> str:
+    """Clé textuelle versionnée, pour l'index du cache disque"""
+    empreinte, fichiers, profil = cle
+    return f"xlsx:{VERSION_RENDU}:{empreinte}:{'|'.join(fichiers)}:{profil}"
+
+
+def nom_cle_donnees(empreinte_upload: str) -> str:
+    """Clé textuelle versionnée des données parsées d'un fichier uploadé, pour le cache disque"""
+    return f"tb:{VERSION_PARSEUR}:{empreinte_upload}"
+
+
+def etag_classeur(cle: CleClasseur, documents: Iterable[str] = ()) -> str:
+    """ETag fort d'un classeur (et des documents PV / Règlement qui l'accompagnent), dérivé
+    de ses entrées : la génération est déterministe, les mêmes entrées donnent les mêmes octets.
+
+    Dérivé de la clé du cache disque (versionnée par le rendu) : un changement de version
+    change à la fois l'ETag et les octets servis. La version du parsing y entre aussi,
+    l'empreinte pouvant être celle du fichier uploadé, avant parsing."""
+    entrees = f"{nom_cle(cle)}:{VERSION_PARSEUR}"
+    if documents:
+        entrees += f":{'|'.join(documents)}"
+    return f'"{hashlib.sha256(entrees.encode("utf-8")).hexdigest()[:32]}"'
+
+
+class CacheClasseurs:
+    """LRU borné en octets, partagé entre threads"""
+
+    def __init__(self, taille_max: int):
+        self.taille_max = taille_max
+        self._classeurs: "OrderedDict[CleClasseur, bytes]" = OrderedDict()
+        self._taille = 0
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+
+    def obtenir(self, cle: CleClasseur) -> Optional[BytesIO]:
+        with self._verrou:
+            contenu = self._classeurs.get(cle)
+            if contenu is None:
+                self.echecs += 1
+                return None
+            self._classeurs.move_to_end(cle)
+            self.succes += 1
+        return BytesIO(contenu)
+
+    def contient(self, cle: CleClasseur) -> bool:
+        with self._verrou:
+            return cle in self._classeurs
+
+    def ajouter(self, cle: CleClasseur, contenu: bytes):
+        if len(contenu) > self.taille_max:
+            return
+        with self._verrou:
+            ancien = self._classeurs.pop(cle, None)
+            if ancien is not None:
+                self._taille -= len(ancien)
+            self._classeurs[cle] = contenu
+            self._taille += len(contenu)
+            while self._taille > self.taille_max:
+                _, evince = self._classeurs.popitem(last=False)
+                self._taille -= len(evince)
+
+
+cache_classeurs = CacheClasseurs(int(TAILLE_MAX_MO * 1024 * 1024))
@@ -0,0 +1,260 @@
+"""Calculs des tableaux de copropriété, indépendants du rendu XLSX"""
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Iterable, List, Optional
+
+from app.models.models import (
+    Apercu,
+    EtageQuotation,
+    EtageTA,
+    EtageTRN,
+    EtageVoix,
+    ImportedData,
+    LigneQuotation,
+    LigneTA,
+    LigneVoix,
+    Lot,
+    Quotation,
+    TotauxConsistance,
+    Voix,
+)
+
+UNITE = Decimal("1")
+
+# Catégories de consistance des totaux TR-N / TR-C
+COMMERCE = "commerce"
+APPARTEMENT = "appartement"
+
+# Les surfaces sont calculées en centièmes de m², en entiers : sommes et
+# quotients sont exacts, seul l'arrondi final produit la valeur affichée.
+# Quots-parts, indivisions et NVi arrondissent au plus proche, moitiés vers
+# le haut ; les totaux TR-N / TR-C en m² gardent l'arrondi au pair du
+# classeur d'origine (voir _total_surfaces).
+ECHELLE = 100
+
+# Écart, en centièmes de m², au-delà duquel une surface a plus de 2 décimales
+TOLERANCE_CENTIEMES = 1e-6
+
+
+def en_centiemes(surface: Optional[float]) -> int:
+    """Surface en m² (précision 0,01 m²) convertie en centièmes de m².
+
+    Une surface plus précise est arrondie au centième le plus proche ; le
+    Validateur le signale (avertissement surface_arrondie)."""
+    return round(surface * ECHELLE) if surface else 0
+
+
+def depasse_centieme(surface: Optional[float]) -> bool:
+    """Vrai si la surface a plus de 2 décimales : en_centiemes l'arrondit"""
+    return bool(surface) and abs(surface * ECHELLE - round(surface * ECHELLE)) > TOLERANCE_CENTIEMES
+
+
+def somme_surfaces(surfaces: Iterable[Optional[float]]) -> float:
+    """Somme exacte de surfaces en m², sans accumuler l'erreur des flottants"""
+    return sum(en_centiemes(surface) for surface in surfaces) / ECHELLE
+
+
+def _diviser_arrondi(numerateur: int, denominateur: int) -> int:
+    """Quotient entier arrondi au plus proche, moitiés en s'éloignant de zéro (ROUND_HALF_UP).
+
+    Dénominateur nul (surface totale nulle, rejetée par le Validateur sauf en
+    mode non strict) : quotient 0."""
+    if denominateur == 0:
+        return 0
+    if denominateur < 0:
+        numerateur, denominateur = -numerateur, -denominateur
+    if numerateur < 0:
+        return -((2 * -numerateur + denominateur) // (2 * denominateur))
+    return (2 * numerateur + denominateur) // (2 * denominateur)
+
+
+def _decimal(entier: int, decimales: int) -> Decimal:
+    """Entier en unités de 10^-decimales, en Decimal à `decimales` chiffres après la virgule"""
+    return Decimal(entier).scaleb(-decimales)
+
+
+def _lots_prives(lots: Iterable[Lot]) -> List[Lot]:
+    return [lot for lot in lots if lot.indice_privative]
+
+
+def calculer_quotation(data: ImportedData) -> Quotation:
+    """Quots-parts du terrain et parts d'indivision (Quot P CH2).
+
+    Quote-part d'un lot : s x T / S (s : surface avec surplomb du lot,
+    T : surface intérieure de son étage, S : surface avec surplomb des
+    parties privatives) ; indivision : s x 10000 / S.
+    """
+    total_surface_interieure = 0
+    total_surface_avec_surplomb = 0
+    for etage in data.etages:
+        for lot in _lots_prives(etage.lots):
+            total_surface_interieure += en_centiemes(lot.surface_interieure)
+            total_surface_avec_surplomb += en_centiemes(lot.surface_avec_surplomb)
+
+    # Numérateurs sur le dénominateur commun S (centièmes de m²)
+    total_quots_parts = 0
+    total_indivision = 0
+    etages: List[EtageQuotation] = []
+
+    for etage in data.etages:
+        surface_etage = en_centiemes(etage.total_surface_interieure)
+        surfaces_privees_etage = 0
+        lignes: List[LigneQuotation] = []
+
+        for lot in etage.lots:
+            quot = indivision = None
+            if lot.indice_privative:
+                surface = en_centiemes(lot.surface_avec_surplomb)
+                surfaces_privees_etage += surface
+                quot = _decimal(_diviser_arrondi(surface * surface_etage, total_surface_avec_surplomb), 2)
+                indivision = Decimal(_diviser_arrondi(surface * 10000, total_surface_avec_surplomb))
+
+            lignes.append(LigneQuotation(
+                indice_privative=lot.indice_privative,
+                indice_commune=lot.indice_commune,
+                consistance=lot.consistance,
+                surface_interieure=lot.surface_interieure,
+                surface_avec_surplomb=lot.surface_avec_surplomb,
+                quot_part=quot,
+                indivision=indivision,
+                observations=lot.observations,
+            ))
+
+        quots_etage = surfaces_privees_etage * surface_etage
+        indivision_etage = surfaces_privees_etage * 10000
+        total_quots_parts += quots_etage
+        total_indivision += indivision_etage
+
+        etages.append(EtageQuotation(
+            nom=etage.nom,
+            cotes=etage.cotes,
+            lignes=lignes,
+            total_surface_interieure=etage.total_surface_interieure,
+            total_surface_avec_surplomb=etage.total_surface_avec_surplomb,
+            total_quots_parts=_decimal(_diviser_arrondi(quots_etage, total_surface_avec_surplomb), 2) if quots_etage > 0 else None,
+            total_indivision=Decimal(_diviser_arrondi(indivision_etage, total_surface_avec_surplomb)) if indivision_etage > 0 else None,
+        ))
+
+    return Quotation(
+        etages=etages,
+        total_surface_interieure=total_surface_interieure / ECHELLE,
+        total_surface_avec_surplomb=total_surface_avec_surplomb / ECHELLE,
+        # Total non arrondi : une seule division, en fin de calcul
+        total_quots_parts=(
+            _decimal(total_quots_parts, 2) / total_surface_avec_surplomb
+            if total_quots_parts and total_surface_avec_surplomb
+            else Decimal(0)
+        ),
+        total_indivision=Decimal(_diviser_arrondi(total_indivision, total_surface_avec_surplomb)) if total_indivision else Decimal(0),
+    )
+
+
+def calculer_voix(data: ImportedData) -> Voix:
+    """Nombre de voix des copropriétaires : NVi = (Si / S) x 100"""
+    surface_totale = 0
+    for etage in data.etages:
+        for lot in _lots_prives(etage.lots):
+            surface_totale += en_centiemes(lot.surface_avec_surplomb)
+
+    somme_surfaces_lots = 0
+    num_ordre = 1
+    etages: List[EtageVoix] = []
+
+    for etage in data.etages:
+        lignes: List[LigneVoix] = []
+        for lot in _lots_prives(etage.lots):
+            surface = en_centiemes(lot.surface_avec_surplomb)
+            lignes.append(LigneVoix(
+                num_ordre=num_ordre,
+                indice_privative=lot.indice_privative,
+                consistance=lot.consistance,
+                surface=lot.surface_avec_surplomb,
+                # NVi en centièmes de % : Si x 100 x 100 / S
+                nvi=_decimal(_diviser_arrondi(surface * 10000, surface_totale), 2),
+            ))
+            somme_surfaces_lots += surface
+            num_ordre += 1
+
+        if lignes:
+            etages.append(EtageVoix(nom=etage.nom, lignes=lignes))
+
+    return Voix(
+        etages=etages,
+        surface_totale=surface_totale / ECHELLE,
+        somme_nvi=Decimal(somme_surfaces_lots * 100) / surface_totale if somme_surfaces_lots and surface_totale else Decimal(0),
+    )
+
+
+def _total_surfaces(lots: List[Lot]) -> Optional[Decimal]:
+    """Total des surfaces avec surplomb, arrondi à l'unité (None si aucun lot).
+
+    Arrondi au pair (ROUND_HALF_EVEN), volontairement : c'est l'arrondi par
+    défaut de Decimal.quantize du classeur d'origine, que les golden figent."""
+    if not lots:
+        return None
+    total = _decimal(sum(en_centiemes(lot.surface_avec_surplomb) for lot in lots), 2)
+    return total.quantize(UNITE, rounding=ROUND_HALF_EVEN)
+
+
+def categorie_consistance(consistance: str) -> Optional[str]:
+    """Catégorie d'une consistance dans les totaux TR-N / TR-C : commerce, appartement, sinon None"""
+    consistance = consistance.lower()
+    if "commerc" in consistance:
+        return COMMERCE
+    if "appartement" in consistance:
+        return APPARTEMENT
+    return None
+
+
+def calculer_totaux_consistance(lots: Iterable[Lot]) -> TotauxConsistance:
+    """Totaux des parties privatives par consistance (commerces / appartements)"""
+    lots_prives = _lots_prives(lots)
+    categories = [categorie_consistance(lot.consistance) for lot in lots_prives]
+    return TotauxConsistance(
+        commerces=_total_surfaces([lot for lot, c in zip(lots_prives, categories) if c == COMMERCE]),
+        appartements=_total_surfaces([lot for lot, c in zip(lots_prives, categories) if c == APPARTEMENT]),
+    )
+
+
+def calculer_tr_n(data: ImportedData) -> List[EtageTRN]:
+    """Tableau détaillé des superficies par niveau (TR-N)"""
+    return [
+        EtageTRN(nom=etage.nom, **calculer_totaux_consistance(etage.lots).model_dump())
+        for etage in data.etages
+    ]
+
+
+def calculer_tr_c(data: ImportedData) -> TotauxConsistance:
+    """Tableau récapitulatif des superficies totales par consistance (TR-C)"""
+    return calculer_totaux_consistance(lot for etage in data.etages for lot in etage.lots)
+
+
+def calculer_ta(data: ImportedData) -> List[EtageTA]:
+    """Tableau A des contenances : parties privatives regroupées par étage"""
+    etages: List[EtageTA] = []
+    for etage in data.etages:
+        lignes = [
+            LigneTA(
+                propriete=lot.propriete,
+                indice_privative=lot.indice_privative,
+                surface_avec_surplomb=lot.surface_avec_surplomb,
+                consistance=lot.consistance,
+                observations=lot.observations,
+            )
+            for lot in _lots_prives(etage.lots)
+        ]
+        if lignes:
+            etages.append(EtageTA(nom=etage.nom, lignes=lignes))
+    return etages
+
+
+def calculer_apercu(data: ImportedData, fichiers: Iterable[str]) -> Apercu:
+    """Calcule les tableaux demandés (clés de CSVParser.excel_key) sans passer par openpyxl"""
+    fichiers = set(fichiers)
+    return Apercu(
+        titre_foncier=data.titre_foncier,
+        quotation=calculer_quotation(data) if "Quot P CH2" in fichiers else None,
+        tr_n=calculer_tr_n(data) if "TR-N" in fichiers else None,
+        tr_c=calculer_tr_c(data) if "TR-C" in fichiers else None,
+        ta=calculer_ta(data) if "TA" in fichiers else None,
+        voix=calculer_voix(data) if "Voix" in fichiers else None,
+    )
@@ -0,0 +1,91 @@
+"""Regroupement des requêtes identiques simultanées (single-flight).
+
+Un double clic sur « Générer », ou plusieurs personnes qui ouvrent le même
+dossier, envoient ensemble des requêtes identiques : chacune rendait tout
+le classeur. La première requête pour une clé (empreinte des entrées et
+feuilles demandées) exécute le travail ; les suivantes, arrivées avant la
+fin, attendent et reçoivent le même résultat, ou la même exception.
+
+Les résultats partagés doivent être immuables (octets, chemin) : chaque
+appelant en fait son propre flux.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+
+from app.models.models import MetriquesCoalescence
+from app.services.traces import attribuer, span
+
+T = TypeVar("T")
+
+
+class Coalesceur:
+    """Travaux en vol par clé ; les doublons attendent le résultat du premier"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._en_vol: Dict[Hashable, Future] = {}
+        self._en_attente = 0
+        self.executes = 0
+        self.partages = 0
+        self.echecs_partages = 0
+        self.attente_totale = 0.0
+        self.attente_max = 0.0
+
+    def executer(self, cle: Hashable, travail: Callable[[], T]) -> T:
+        """Résultat de `travail`, exécuté une seule fois pour toutes les requêtes simultanées de même clé"""
+        with self._verrou:
+            future = self._en_vol.get(cle)
+            meneur = future is None
+            if meneur:
+                future = self._en_vol[cle] = Future()
+                self.executes += 1
+            else:
+                self._en_attente += 1
+
+        if meneur:
+            try:
+                resultat = travail()
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(resultat)
+                return resultat
+            finally:
+                # Les requêtes suivantes trouvent le résultat dans les caches, ou recalculent
+                with self._verrou:
+                    del self._en_vol[cle]
+
+        debut = time.perf_counter()
+        try:
+            with span("coalescence"):
+                return future.result()
+        except BaseException:
+            with self._verrou:
+                self.echecs_partages += 1
+            raise
+        finally:
+            attente = time.perf_counter() - debut
+            attribuer(coalescee=True)
+            with self._verrou:
+                self._en_attente -= 1
+                self.partages += 1
+                self.attente_totale += attente
+                self.attente_max = max(self.attente_max, attente)
+
+    def metriques(self) -> MetriquesCoalescence:
+        with self._verrou:
+            return MetriquesCoalescence(
+                en_vol=len(self._en_vol),
+                en_attente=self._en_attente,
+                executes=self.executes,
+                partages=self.partages,
+                echecs_partages=self.echecs_partages,
+                attente_moyenne_ms=self.attente_totale / self.partages * 1000 if self.partages else 0.0,
+                attente_max_ms=self.attente_max * 1000,
+            )
+
+
+coalesceur = Coalesceur()
@@ -0,0 +1,129 @@
+import gzip
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional
+
+from fastapi import HTTPException
+
+try:
+    import zstandard
+except ImportError:  # dépendance optionnelle
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+SIGNATURES = (
+    (b"\x1f\x8b", GZIP),
+    (b"\x28\xb5\x2f\xfd", ZSTD),
+)
+
+# Valeurs de Content-Encoding acceptées
+CONTENT_ENCODINGS = {
+    "gzip": GZIP,
+    "x-gzip": GZIP,
+    "zstd": ZSTD,
+}
+
+EXTENSIONS = (".gz", ".zst")
+
+ERREURS_DECOMPRESSION = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def detecter_compression(stream: BinaryIO, content_encoding: Optional[str] = None) -> Optional[str]:
+    """Détecte la compression d'un upload par ses octets magiques, puis par Content-Encoding"""
+    signature = stream.read(4)
+    stream.seek(0)
+    for magic, compression in SIGNATURES:
+        if signature.startswith(magic):
+            return compression
+
+    if content_encoding:
+        return CONTENT_ENCODINGS.get(content_encoding.strip().lower())
+    return None
+
+
+def taille_decompressee(stream: BinaryIO, compression: Optional[str]) -> Optional[int]:
+    """Taille du contenu décompressé, lue sans décompresser (None si inconnue).
+
+    gzip la stocke modulo 2^32 dans ses 4 derniers octets (ISIZE) ; zstd
+    dans l'en-tête de trame quand le compresseur l'a renseignée.
+    """
+    position = stream.tell()
+    try:
+        if compression is None:
+            return stream.seek(0, 2)
+        if compression == GZIP:
+            if stream.seek(0, 2) < 18:
+                return None
+            stream.seek(-4, 2)
+            return int.from_bytes(stream.read(4), "little")
+        if compression == ZSTD and zstandard is not None:
+            stream.seek(0)
+            taille = zstandard.frame_content_size(stream.read(18))
+            return taille if taille >= 0 else None
+    except ERREURS_DECOMPRESSION + (ValueError,):
+        return None
+    finally:
+        stream.seek(position)
+    return None
+
+
+def _decompresseur(stream: BinaryIO, compression: str) -> BinaryIO:
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+
+    if compression == ZSTD:
+        if zstandard is None:
+            raise HTTPException(415, "Compression zstd non supportée : le paquet zstandard n'est pas installé")
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=False)
+
+    raise HTTPException(415, f"Compression non supportée : {compression}")
+
+
+def decompresser_prefixe(prefixe: bytes, compression: Optional[str], taille_max: int) -> bytes:
+    """Décompresse le début d'un contenu, même tronqué (détection du dialecte)"""
+    if compression is None:
+        return prefixe[:taille_max]
+
+    try:
+        if compression == GZIP:
+            return zlib.decompressobj(wbits=31).decompress(prefixe, taille_max)
+        if compression == ZSTD and zstandard is not None:
+            # Lecture en flux : seuls les taille_max premiers octets sont décompressés
+            reader = zstandard.ZstdDecompressor().stream_reader(BytesIO(prefixe), closefd=False)
+            blocs, lus = [], 0
+            while lus < taille_max:
+                bloc = reader.read(taille_max - lus)
+                if not bloc:
+                    break
+                blocs.append(bloc)
+                lus += len(bloc)
+            return b"".join(blocs)
+    except ERREURS_DECOMPRESSION:
+        raise HTTPException(400, f"Contenu compressé ({compression}) invalide")
+    # Laisse _decompresseur signaler la compression non supportée
+    _decompresseur(BytesIO(prefixe), compression)
+    return b""
+
+
+@contextmanager
+def flux_decompresse(stream: BinaryIO, compression: Optional[str], rembobiner: bool = True) -> Iterator[BinaryIO]:
+    """Ouvre le flux, décompressé à la volée si nécessaire.
+
+    Le contenu n'est jamais décompressé entièrement en mémoire : le lecteur
+    renvoyé décompresse au fur et à mesure des lectures du parser. Avec
+    `rembobiner=False`, le flux (non rembobinable) est lu depuis sa position.
+    """
+    if rembobiner:
+        stream.seek(0)
+    if compression is None:
+        yield stream
+        return
+
+    reader = _decompresseur(stream, compression)
+    try:
+        yield reader
+    finally:
+        reader.close()
@@ -1,25 +1,97 @@
 import csv
 import re
-from typing import List, Optional
-from app.models.models import Lot, Floor, ImportedData
-from openpyxl import Workbook
+import sys
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.models.models import (
+    Apercu,
+    EtageQuotation,
+    EtageTA,
+    EtageTRN,
+    Floor,
+    ImportedData,
+    Lot,
+    Quotation,
+    RapportValidation,
+    TotauxConsistance,
+    Voix,
+)
+from app.services.calculs import (
+    calculer_apercu,
+    calculer_quotation,
+    calculer_ta,
+    calculer_tr_c,
+    calculer_tr_n,
+    calculer_voix,
+    somme_surfaces,
+)
+from app.services.compression import ERREURS_DECOMPRESSION, EXTENSIONS, flux_decompresse
+from app.services.dialect import Dialecte, detecter_dialecte_flux, erreurs_decodage
+from app.services.nombres import convertir_colonne, nombre
+from app.services.rendu_parallele import abandonner_executeur, executeur_rendu, rendre_blocs_paralleles
+from app.services.traces import attribuer_donnees, span
+from app.services.validation import Validateur
+from app.services.xlsx_writer import save_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment
 from openpyxl.styles.borders import Side, Border
 from openpyxl.utils import column_index_from_string, get_column_letter
 from fastapi import UploadFile, HTTPException
 from io import BytesIO, TextIOWrapper
-from decimal import ROUND_HALF_UP, Decimal
+
+EXPOSANT_A = "\u1D43"
+
+# Colonnes du tableau TB exporté en CSV, de la première (vide) aux observations
+COLONNES_TB = 9
+
+
+@lru_cache(maxsize=4096)
+def en_exposant(texte: str) -> str:
+    """« 13-13a » -> « 13-13ᵃ ». Mémorisé : les mêmes indices et observations reviennent d'un étage à l'autre"""
+    return texte.replace("a", EXPOSANT_A)
+
+
+@lru_cache(maxsize=4096)
+def observation_ta(texte: str) -> str:
+    """Observation du tableau A : « m2 » -> « m² », puis indices en exposant"""
+    return en_exposant(texte.replace("m2", "m²"))
+
+
+# Registre des styles : les styles openpyxl sont comparés par valeur et jamais modifiés
+# après création, une instance par combinaison est partagée par tous les classeurs
+
+@lru_cache(maxsize=None)
+def police(name: str, size: int = 12, bold: bool = False, underline=None) -> Font:
+    return Font(name=name, size=size, bold=bold, underline=underline)
+
+
+@lru_cache(maxsize=None)
+def alignement_centre(wrap_text: bool = False) -> Alignment:
+    return Alignment(vertical="center", horizontal="center", wrap_text=wrap_text)
+
+
+@lru_cache(maxsize=None)
+def bordure_pleine(style: str = "thin") -> Border:
+    borderSide = Side(style=style, border_style=None, color='FF000000')
+    return Border(left=borderSide, top=borderSide, bottom=borderSide, right=borderSide)
 
 
 class CSVParser:
     """Parser pour fichiers CSV de titres fonciers"""
-    unicode = "\u1D43"
+    unicode = EXPOSANT_A
     
     """ Les fichiers excel """
     excel_key = ["Quot P CH2", "TR-N", "TR-C", "TA", "Voix"]
     
-    def __init__(self, delimiter: str = ';'):
+    def __init__(self, delimiter: str = ';', encoding: str = "utf-8", compression: Optional[str] = None, strict: bool = True):
         self._delimiter = delimiter
+        self._encoding = encoding
+        self._compression = compression
+        # En mode strict, un fichier avec des erreurs de validation est rejeté
+        self.strict = strict
+        self.rapport: Optional[RapportValidation] = None
 
     @property
     def delimiter(self):
@@ -28,16 +100,59 @@ class CSVParser:
     @delimiter.setter
     def delimiter(self, value: str):
         self._delimiter = value
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value: str):
+        self._encoding = value
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @compression.setter
+    def compression(self, value: Optional[str]):
+        self._compression = value
+
+    def apply_dialect(self, dialecte: Dialecte):
+        self.delimiter = dialecte.delimiter
+        self.encoding = dialecte.encoding
+        self.compression = dialecte.compression
         
     def parse_file(self, file: UploadFile) -> ImportedData:
-        """Parse un fichier CSV de titre foncier"""
-        files_bytes = BytesIO(file.file.read())
-        files_bytes.seek(0)
-        
-        wrapper = TextIOWrapper(files_bytes, encoding="utf-8")
-        reader = csv.reader(wrapper, delimiter=self.delimiter)
-        rows = [row for row in reader]
-        return self._parse_rows(rows)
+        """Parse un fichier CSV de titre foncier.
+
+        Le contenu est décompressé (gzip, zstd) et décodé en flux directement
+        depuis le fichier uploadé, sans copie intermédiaire en mémoire.
+        """
+        with flux_decompresse(file.file, self.compression) as flux:
+            return self._parse_flux(flux)
+
+    def parse_stream(self, stream: BinaryIO) -> ImportedData:
+        """Parse un flux CSV non rembobinable (upload reçu bloc par bloc).
+
+        Le dialecte doit avoir été détecté au préalable sur les premiers octets.
+        """
+        with span("parse", format="csv"), flux_decompresse(stream, self.compression, rembobiner=False) as flux:
+            data = self._parse_flux(flux)
+            attribuer_donnees(data)
+            return data
+
+    def _parse_flux(self, flux: BinaryIO) -> ImportedData:
+        wrapper = TextIOWrapper(flux, encoding=self.encoding, errors=erreurs_decodage(self.encoding), newline="")
+        try:
+            reader = csv.reader(wrapper, delimiter=self.delimiter)
+            return self._parse_rows(reader, lambda: reader.line_num)
+        except UnicodeDecodeError:
+            raise HTTPException(400, f"Contenu CSV invalide : encodage {self.encoding} incohérent")
+        except ERREURS_DECOMPRESSION:
+            raise HTTPException(400, f"Contenu compressé ({self.compression}) invalide")
+        finally:
+            # Ne pas fermer le flux sous-jacent avec le wrapper
+            wrapper.detach()
     
     def parse_content(self, content: str) -> ImportedData:
         """Parse le contenu CSV en string"""
@@ -47,104 +162,208 @@ class CSVParser:
         
         return self._parse_rows(rows)
     
-    def _parse_rows(self, rows: List[List[str]]) -> ImportedData:
-        """Parse les lignes du CSV"""
+    def parse_xlsx(self, file: UploadFile) -> ImportedData:
+        """Parse directement un fichier XLSX rempli à partir du modèle TB.
+
+        Le classeur est ouvert en lecture seule : les lignes sont lues en flux
+        et passées une à une à l'automate étages / lots, sans passer par le CSV.
+        """
+        file.file.seek(0)
+        wb = load_workbook(file.file, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()
+            return self._parse_rows(self._iter_xlsx_rows(ws))
+        finally:
+            wb.close()
+
+    def parse_upload(self, file: UploadFile) -> ImportedData:
+        """Parse un fichier uploadé, CSV ou XLSX selon son extension"""
+        xlsx = self.is_xlsx(file)
+        with span("parse", format="xlsx" if xlsx else "csv"):
+            data = self.parse_xlsx(file) if xlsx else self.parse_file(file)
+            attribuer_donnees(data)
+            return data
+
+    def _iter_xlsx_rows(self, ws) -> Iterator[List[str]]:
+        """Itère sur les lignes d'une feuille en les alignant sur le format CSV.
+
+        Dans le modèle, les données commencent en colonne C alors que le CSV
+        attend la désignation en deuxième colonne : le décalage est déduit de
+        la cellule contenant "Titre foncier". Les cellules vides de fin de
+        ligne, omises par openpyxl, sont complétées comme dans l'export CSV.
+        """
+        decalage = None
+        for values in ws.iter_rows(values_only=True):
+            row = [self._xlsx_cell_to_str(value) for value in values]
+            if decalage is None:
+                col = next((c for c, cell in enumerate(row) if "Titre foncier" in cell), None)
+                if col is None:
+                    # Conservée telle quelle pour garder la numérotation des lignes
+                    yield row
+                    continue
+                decalage = col - 1
+            if decalage > 0:
+                row = row[decalage:]
+            elif decalage < 0:
+                row = [""] + row
+            if len(row) < COLONNES_TB:
+                row += [""] * (COLONNES_TB - len(row))
+            yield row
+
+    @staticmethod
+    def _xlsx_cell_to_str(value) -> str:
+        """Convertit une valeur de cellule XLSX en texte, comme dans un export CSV"""
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _parse_rows(self, rows: Iterable[List[str]], line_num: Optional[Callable[[], int]] = None) -> ImportedData:
+        """Parse les lignes du CSV.
+
+        Les lignes sont consommées en une seule passe : `rows` peut être une
+        liste comme un flux (lecteur CSV, feuille XLSX en lecture seule).
+        Les contrôles de validation sont faits au fil de l'eau ; en mode strict,
+        un fichier comportant des erreurs est rejeté (422) avant toute génération.
+        `line_num` donne le numéro de ligne physique (champs multi-lignes du CSV).
+        Les lignes de lots d'un étage sont mises de côté jusqu'à sa clôture :
+        les colonnes de surfaces sont alors converties en lot.
+        """
         titre_foncier = ""
         etages: List[Floor] = []
-        
-        i = 0
+        validateur = Validateur(nombre)
+        rows = self._numeroter(rows, line_num)
 
         # Extraire le titre foncier
-        while i < len(rows):
-            row = rows[i]
+        for n, row in rows:
             if len(row) > 1 and "Titre foncier" in row[1]:
                 # Ex: "Modification successives du Titre foncier  :154311 /05"
                 titre_foncier = row[1].split(":")[-1].strip()
-                i += 1
+                validateur.titre(n, titre_foncier)
                 break
-            i += 1
-        
-        # Sauter jusqu'aux données réelles
-        while i < len(rows):
-            row = rows[i]
+
+        # Sauter jusqu'aux données réelles (en-tête sur 3 lignes)
+        for n, row in rows:
             if len(row) > 1 and row[1] and "Propriété dite" in row[1]:
-                i += 3
+                validateur.entete(n)
+                next(rows, None)
+                next(rows, None)
                 break
-            i += 1
 
         # Parser les étages et lots
-        while i < len(rows):
-            row = rows[i]
-            if len(row) > 0 and row[1] and ":" in row[1] and any(c.isalpha() for c in row[1]):
+        etage_name = None
+        cotes = ""
+        lots: List[Lot] = []
+        # (ligne, cellules, ligne de lot) de l'étage en cours, pas encore converties
+        en_attente: List[Tuple[int, List[str], bool]] = []
+
+        for n, row in rows:
+            # Nouvel étage
+            if len(row) > 1 and row[1] and ":" in row[1] and any(c.isalpha() for c in row[1]):
+                self._convertir_lots(en_attente, lots, validateur)
+                self._append_floor(etages, etage_name, cotes, lots)
                 parts = row[1].split(":")
+                validateur.debut_etage(n, parts[0].strip(), lots)
                 etage_name = parts[0].strip()  # "Rez-de-chaussée"
                 cotes = parts[1].strip() if len(parts) > 1 else ""  # "Des côtes +0.10m et +1,10m à la côte 4,10m"
-                    
-                lots: List[Lot] = []
-                i += 1
-               
-                # Parser les lots de cet étage
-                total_surf_int = 0
-                total_surf_surp = 0
-                
-                while i < len(rows):
-                    row = rows[i]
-
-                    # Arrêt si nouvel étage
-                    if len(row) > 0 and row[1] and ":" in row[1] and any(c.isalpha() for c in row[1]):
-                        break
-                    
-                    # Arrêt si fin des données
-                    if not row or not any(cell.strip() for cell in row):
-                        i += 1
-                        continue
-                    
-                    # Total row
-                    if len(row) > 1 and "Total" in row[2]:
-                        i += 1
-                        break
-                    
-                    # Parser un lot
-                    if len(row) > 3 and row[5]: # Propriété et Surface interieure du titre
-                        lot = self._parse_lot(row)
-                        if lot:
-                            lots.append(lot)
-                            total_surf_int += lot.surface_interieure or 0
-                            total_surf_surp += lot.surface_avec_surplomb or 0
-                    
-                    i += 1
-
-                if lots:
-                    floor = Floor(
-                        nom=etage_name,
-                        cotes=cotes,
-                        lots=lots,
-                        total_surface_interieure=total_surf_int,
-                        total_surface_avec_surplomb=total_surf_surp
-                    )
-                    etages.append(floor)
-            else:
-                i += 1
-
-        return ImportedData(
+                lots = []
+                continue
+
+            # Ligne vide
+            if not row or not any(cell.strip() for cell in row):
+                continue
+
+            # Lignes hors étage (après un Total)
+            if etage_name is None:
+                validateur.ligne_hors_etage(n, row)
+                continue
+
+            # Total row
+            if len(row) > 2 and "Total" in row[2]:
+                self._convertir_lots(en_attente, lots, validateur)
+                validateur.total(n, row, lots)
+                self._append_floor(etages, etage_name, cotes, lots)
+                etage_name = None
+                continue
+
+            # Lot (Propriété et Surface interieure du titre), converti à la clôture de l'étage
+            en_attente.append((n, row, len(row) > 5 and bool(row[5])))
+
+        self._convertir_lots(en_attente, lots, validateur)
+        self._append_floor(etages, etage_name, cotes, lots)
+        validateur.fin_etage(lots)
+
+        data = ImportedData(
             titre_foncier=titre_foncier,
             etages=etages
         )
+
+        self.rapport = validateur.rapport(data)
+        if self.strict and not self.rapport.valide:
+            raise HTTPException(422, detail={"message": "Fichier TB invalide", **self.rapport.model_dump()})
+
+        return data
+
+    @staticmethod
+    def _numeroter(rows: Iterable[List[str]], line_num: Optional[Callable[[], int]]) -> Iterator[Tuple[int, List[str]]]:
+        for index, row in enumerate(rows, start=1):
+            yield (line_num() if line_num else index), row
+
+    def _append_floor(self, etages: List[Floor], etage_name: Optional[str], cotes: str, lots: List[Lot]):
+        """Ajoute l'étage en cours s'il contient des lots"""
+        if etage_name is None or not lots:
+            return
+        etages.append(Floor(
+            nom=etage_name,
+            cotes=cotes,
+            lots=lots,
+            total_surface_interieure=somme_surfaces(lot.surface_interieure for lot in lots),
+            total_surface_avec_surplomb=somme_surfaces(lot.surface_avec_surplomb for lot in lots)
+        ))
     
-    def _parse_lot(self, row: List[str]) -> Optional[Lot]:
-        """Parse une ligne représentant un lot"""
+    def _convertir_lots(self, en_attente: List[Tuple[int, List[str], bool]], lots: List[Lot], validateur: Validateur):
+        """Convertit les surfaces des lignes en attente colonne par colonne, puis crée et
+        contrôle les lots dans l'ordre des lignes"""
+        if not en_attente:
+            return
+        lignes_lots = [row for _, row, est_lot in en_attente if est_lot]
+        interieures = convertir_colonne([row[5] for row in lignes_lots])
+        # Colonne absente : surface avec surplomb nulle
+        avec_surplomb = convertir_colonne([row[6] if len(row) > 6 else "0" for row in lignes_lots])
+        # Cellules illisibles de chaque lot, (colonne, contenu), signalées par le Validateur
+        invalides: Dict[int, List[Tuple[int, str]]] = {}
+        for colonne, conversion in ((6, interieures), (7, avec_surplomb)):
+            for position, cellule in conversion.invalides:
+                invalides.setdefault(position, []).append((colonne, cellule))
+
+        i = 0
+        for n, row, est_lot in en_attente:
+            if not est_lot:
+                validateur.ligne_sans_surface(n, row)
+                continue
+            lot = self._parse_lot(row, interieures.valeurs[i], avec_surplomb.valeurs[i])
+            validateur.lot(n, row, lot, invalides.get(i, ()))
+            i += 1
+            if lot:
+                lots.append(lot)
+        en_attente.clear()
+
+    def _parse_lot(
+        self, row: List[str], surface_interieure: Optional[float], surface_avec_surplomb: Optional[float]
+    ) -> Optional[Lot]:
+        """Parse une ligne représentant un lot, dont les surfaces sont déjà converties"""
 
         try:
-            propriete = row[1].strip() if len(row) > 0 else ""
+            # Valeurs répétées d'un lot à l'autre : une seule chaîne en mémoire par valeur
+            propriete = sys.intern(row[1].strip()) if len(row) > 0 else ""
             titre_num = row[2].strip() if len(row) > 1 else ""
 
             indice_privative = row[3].strip() if len(row) > 3 else None
             indice_commune = row[4].strip() if len(row) > 4 else None
 
-            surface_interieure = self._parse_float(row[5]) if len(row) > 5 else 0
-            surface_avec_surplomb = self._parse_float(row[6]) if len(row) > 6 else 0
-            
-            consistance = row[7].strip() if len(row) > 7 else ""
+            consistance = sys.intern(row[7].strip()) if len(row) > 7 else ""
             observations = row[8].strip() if len(row) > 8 else None
             
             # Valider que c'est un lot valide (au moins propriete et indice)
@@ -165,14 +384,8 @@ class CSVParser:
         return None
     
     def _parse_float(self, value: str) -> Optional[float]:
-        """Parse une valeur float en gérant les formats différents"""
-        if not value or not value.strip():
-            return None
-        value = value.strip()
-        try:
-            return float(value)
-        except ValueError:
-            return None
+        """Parse une valeur float en gérant les formats différents (voir app.services.nombres)"""
+        return nombre(value)
 
     def _style_cell(self, cell, font: Font =  None, alignment: Alignment = None, border: Border = None):
         if font:
@@ -189,12 +402,7 @@ class CSVParser:
         bold: bool = False,
         underline = None
     ) -> Font:
-        return Font(
-            name = name,
-            size = size,
-            bold= bold,
-            underline= underline
-        )
+        return police(name, size, bold, underline)
         
     def _create_arial_font(
         self,
@@ -219,13 +427,12 @@ class CSVParser:
         return self._create_font("Times New Roman", size, bold, underline)
     
     def _fully_centered(self, wrap_text = False) -> Alignment:
-        return Alignment(vertical="center", horizontal="center", wrap_text=wrap_text)
+        return alignement_centre(wrap_text)
     
     def _solid_black_border(self, style: str = "thin"): 
-        borderSide = Side(style = style, border_style=None, color='FF000000')
-        return Border(left=borderSide, top=borderSide, bottom=borderSide, right=borderSide)
+        return bordure_pleine(style)
         
-    def generer_xlxs_voix(self, data: ImportedData, wb: Workbook):
+    def generer_xlxs_voix(self, data: ImportedData, wb: Workbook, voix: Optional[Voix] = None):
         ws = wb.create_sheet("Voix")
 
         ws.column_dimensions["C"].width = 30
@@ -337,61 +544,46 @@ class CSVParser:
         for i in range (21,24):
             ws.row_dimensions[i].height = 25
 
-        surface_totale_partie_privative = 0
-        somme_des_nvi = 0
-        num_ordre = 1
+        voix = voix or calculer_voix(data)
         current_line = 24
         
-        for etage in data.etages:
-             for lot in etage.lots:
-                if(lot.indice_privative):
-                    surface_totale_partie_privative += lot.surface_avec_surplomb
-        
-        for etage in data.etages:
+        for etage in voix.etages:
             start_merge = current_line
-            nb_de_lignes_a_merger = 0
             
-            for lot in etage.lots:
-                if lot.indice_privative: 
-                    ws.row_dimensions[current_line].height = 30
-                    cell = ws[f"B{current_line}"]
-                    cell.value = num_ordre
-                    cell.alignment = Alignment(vertical="center", horizontal="center")
-                    cell.font = fontArial
-                    
-                    cell = ws[f"C{current_line}"] 
-                    cell.value = lot.indice_privative
-                    cell.alignment = Alignment(vertical="center", horizontal="center")
-                    cell.font = fontArial
-                    
-                    cell = ws[f"E{current_line}"] 
-                    cell.value = lot.consistance
-                    cell.alignment = Alignment(vertical="center", horizontal="center")
-                    cell.font = fontArial
-                    
-                    cell = ws[f"F{current_line}"] 
-                    cell.value = lot.surface_avec_surplomb
-                    cell.alignment = Alignment(vertical="center", horizontal="center")
-                    cell.font = fontArialBold
-                    
-                    cell = ws[f"G{current_line}"]
-                    nvi = Decimal(lot.surface_avec_surplomb) / Decimal (surface_totale_partie_privative) * Decimal(100)
-                    cell.value = nvi.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                    cell.alignment = Alignment(vertical="center", horizontal="center")
-                    cell.font = fontArial
-                    
-                    somme_des_nvi += nvi
-                    nb_de_lignes_a_merger += 1
-                    current_line += 1
-                    num_ordre += 1
-                    
-    
-            if any(lot.indice_privative for lot in etage.lots):
-                cell = ws[f"D{start_merge}"] 
-                cell.value = etage.nom
+            for ligne in etage.lignes:
+                ws.row_dimensions[current_line].height = 30
+                cell = ws[f"B{current_line}"]
+                cell.value = ligne.num_ordre
+                cell.alignment = Alignment(vertical="center", horizontal="center")
+                cell.font = fontArial
+                
+                cell = ws[f"C{current_line}"] 
+                cell.value = ligne.indice_privative
+                cell.alignment = Alignment(vertical="center", horizontal="center")
+                cell.font = fontArial
+                
+                cell = ws[f"E{current_line}"] 
+                cell.value = ligne.consistance
+                cell.alignment = Alignment(vertical="center", horizontal="center")
+                cell.font = fontArial
+                
+                cell = ws[f"F{current_line}"] 
+                cell.value = ligne.surface
+                cell.alignment = Alignment(vertical="center", horizontal="center")
+                cell.font = fontArialBold
+                
+                cell = ws[f"G{current_line}"]
+                cell.value = ligne.nvi
                 cell.alignment = Alignment(vertical="center", horizontal="center")
                 cell.font = fontArial
-                ws.merge_cells(f"D{start_merge}:D{start_merge + nb_de_lignes_a_merger-1}")
+                
+                current_line += 1
+    
+            cell = ws[f"D{start_merge}"] 
+            cell.value = etage.nom
+            cell.alignment = Alignment(vertical="center", horizontal="center")
+            cell.font = fontArial
+            ws.merge_cells(f"D{start_merge}:D{current_line-1}")
               
         
         ws.merge_cells(f"B{current_line}:E{current_line}")
@@ -402,31 +594,30 @@ class CSVParser:
         ws.row_dimensions[current_line].height = 30
         
         current_cell = ws[f"F{current_line}"]
-        current_cell.value = surface_totale_partie_privative
+        current_cell.value = voix.surface_totale
         current_cell.font = fontArialBold
         current_cell.alignment = Alignment(vertical= "center", horizontal="center")
         
         current_cell = ws[f"G{current_line}"]
-        current_cell.value = somme_des_nvi
+        current_cell.value = voix.somme_nvi
         current_cell.font = fontArialBold
         current_cell.alignment = Alignment(vertical= "center", horizontal="center")
         
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+        return ws
     
-    def generer_xlxs_quotation(self, data: ImportedData, wb: Workbook):
+    def generer_xlxs_quotation(
+        self,
+        data: ImportedData,
+        wb: Workbook,
+        executeur: Optional[Executor] = None,
+        quotation: Optional[Quotation] = None,
+    ):
         ws = wb.create_sheet("Quot P CH2")
       
         # ========================== FONT ==========================
         fontTimes16Bold = self._create_times_new_roman_font(16, True)
-        fontTimes14Bold = self._create_times_new_roman_font(14, True)
         fontTimes14 = self._create_times_new_roman_font(14, False)
         fontArial12Bold = self._create_arial_font(12, True)
-        fontArial12 = self._create_arial_font(12, False)
-        fontArial14RedBold = Font(name="Arial", size=14, bold=True, color="FF0000")
         fontArial14Bold = self._create_arial_font(14, True)
 
         # ========================== FONT ========================== 
@@ -543,132 +734,15 @@ class CSVParser:
             for cell in row:
                 cell.border = self._solid_black_border("thin")
                 
+        quotation = quotation or calculer_quotation(data)
         current_line = 10
-        totaux_generaux_surface_interieure = 0
-        totaux_generaux_surface_avec_surplomb = 0
-        totaux_generaux_quots_parts = 0 
-        totaux_generaux_part_d_indivision = 0
-        
-        for etage in data.etages:
-            start_merge = current_line        
-            ws.merge_cells(f"B{start_merge}:J{start_merge}")
-            cell = ws[f"B{start_merge}"]
-            cell.value = f"{etage.nom} : {etage.cotes}"
-            cell.font = fontTimes16Bold
-            cell.alignment = self._fully_centered()
-            
-            ws.row_dimensions[current_line].height = 30
-            self._apply_border_to_range(ws=ws, type="thin", range=f"B{start_merge}:J{start_merge}")
-            
-            
-            for lot in etage.lots:
-                current_line += 1
-                ws.row_dimensions[current_line].height = 30
-                #Privative
-                cell = ws[f"B{current_line}"]
-                cell.font = fontArial12Bold
-                cell.alignment = self._fully_centered()
-                cell.value = lot.indice_privative.replace("a", self.unicode) if lot.indice_privative else ""
-                
-                 #Commune
-                cell = ws[f"C{current_line}"]
-                cell.font = fontArial12
-                cell.alignment = self._fully_centered()
-                cell.value = lot.indice_commune.replace("a", self.unicode) if lot.indice_commune else ""
-                
-                #Consistance
-                ws.merge_cells(f"D{current_line}:E{current_line}")
-                cell = ws[f"D{current_line}"]
-                cell.value = lot.consistance
-                cell.font =  fontArial12Bold if lot.indice_privative else fontTimes14
-                cell.alignment = self._fully_centered()
-                
-               #Interieure du titre
-                cell = ws[f"F{current_line}"]
-                cell.font = fontArial12Bold
-                cell.alignment = self._fully_centered()
-                cell.value = lot.surface_interieure
-                
-                #Total avec surplomb du titre
-                cell = ws[f"G{current_line}"]
-                cell.font = fontArial12Bold
-                cell.alignment = self._fully_centered()
-                cell.value = lot.surface_avec_surplomb
-                
-                #Observations 
-                cell = ws[f"J{current_line}"]
-                cell.font = self._create_arial_narrow_font(10, False)
-                cell.alignment = self._fully_centered()
-                cell.value = lot.observations.replace("a", self.unicode) if lot.observations else ""
-                
-                if lot.indice_privative:
-                    totaux_generaux_surface_interieure += lot.surface_interieure
-                    totaux_generaux_surface_avec_surplomb += lot.surface_avec_surplomb
-            
-            #Total
-            current_line += 1
-            ws.row_dimensions[current_line].height = 30
-            ws.merge_cells(f"B{current_line}:E{current_line}")
-            cell = ws[f"B{current_line}"]
-            cell.font = fontArial12Bold
-            cell.alignment = self._fully_centered()
-            cell.value = "Total"
-            
-            cell = ws[f"F{current_line}"]
-            cell.font = fontArial12Bold
-            cell.alignment = self._fully_centered()
-            cell.value = etage.total_surface_interieure
-            
-            cell = ws[f"G{current_line}"]
-            cell.font = fontArial12Bold
-            cell.alignment = self._fully_centered()
-            cell.value = etage.total_surface_avec_surplomb
-            
-            current_line += 1
-            
-        current_line = 10
-        
-        #Calcul quots-parts et part d'indivision
-        for etage in data.etages: 
-            current_line += 1
-            totaux_quots_etage = Decimal(0)
-            totaux_indivision_etage = Decimal(0)
-            
-            for lot in etage.lots:
-                if(lot.indice_privative):
-                    quot = Decimal(lot.surface_avec_surplomb) * Decimal(etage.total_surface_interieure) / Decimal(totaux_generaux_surface_avec_surplomb) 
-                    indivision = Decimal(lot.surface_avec_surplomb)  * Decimal(10000) / Decimal(totaux_generaux_surface_avec_surplomb)
+        etages = list(zip(data.etages, quotation.etages))
 
-                    totaux_quots_etage += quot
-                    totaux_indivision_etage += indivision
-                
-                    totaux_generaux_part_d_indivision += indivision
-                    totaux_generaux_quots_parts += quot
-                    
-                    cell = ws[f"H{current_line}"]
-                    cell.font = fontArial14Bold
-                    cell.alignment = self._fully_centered()
-                    cell.value = quot.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) 
-                    
-                    cell = ws[f"I{current_line}"]
-                    cell.font = fontArial14Bold
-                    cell.alignment = self._fully_centered()
-                    cell.value = indivision.quantize(Decimal("1"), rounding=ROUND_HALF_UP)
-                
-                current_line += 1
-                
-            #Total etage
-            cell = ws[f"H{current_line}"]
-            cell.font = fontArial14RedBold
-            cell.alignment = self._fully_centered()
-            cell.value = totaux_quots_etage.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) if totaux_quots_etage > 0 else ""
-                    
-            cell = ws[f"I{current_line}"]
-            cell.font = fontArial14RedBold
-            cell.alignment = self._fully_centered()
-            cell.value = totaux_indivision_etage.quantize(Decimal("1"), rounding=ROUND_HALF_UP) if totaux_indivision_etage > 0 else ""
-            
-            current_line += 1
+        if executeur is not None:
+            current_line = rendre_blocs_paralleles(ws, executeur, "_bloc_etage_quotation", etages, current_line)
+        else:
+            for etage, etage_quotation in etages:
+                current_line = self._bloc_etage_quotation(ws, (etage, etage_quotation), current_line)
             
         # Totaux généraux
         ws.merge_cells(f"B{current_line}:E{current_line}")
@@ -683,40 +757,147 @@ class CSVParser:
         cell = ws[f"F{current_line}"]  
         cell.font = fontArial12Bold
         cell.alignment = self._fully_centered()
-        cell.value = totaux_generaux_surface_interieure
+        cell.value = quotation.total_surface_interieure
         cell.border = self._solid_black_border("thin")
         
         cell = ws[f"G{current_line}"]  
         cell.font = fontArial12Bold
         cell.alignment = self._fully_centered()
-        cell.value = totaux_generaux_surface_avec_surplomb
+        cell.value = quotation.total_surface_avec_surplomb
         cell.border = self._solid_black_border("thin")
         
         cell = ws[f"H{current_line}"]  
         cell.font = fontArial14Bold
         cell.alignment = self._fully_centered()
-        cell.value = totaux_generaux_quots_parts
+        cell.value = quotation.total_quots_parts
         cell.border = self._solid_black_border("thin")
         
         cell = ws[f"I{current_line}"]  
         cell.font = fontArial14Bold
         cell.alignment = self._fully_centered()
-        cell.value = totaux_generaux_part_d_indivision.quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+        cell.value = quotation.total_indivision
         cell.border = self._solid_black_border("thin")
         
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+        return ws
         # ========================== Headers ==========================
         
+    def _bloc_etage_quotation(self, ws, etage_et_quotation: Tuple[Floor, EtageQuotation], current_line: int) -> int:
+        """Lignes d'un étage de Quot P CH2 à partir de current_line ; retourne la ligne suivante"""
+        etage, quotation = etage_et_quotation
+        fontTimes16Bold = self._create_times_new_roman_font(16, True)
+        fontTimes14 = self._create_times_new_roman_font(14, False)
+        fontArial12Bold = self._create_arial_font(12, True)
+        fontArial12 = self._create_arial_font(12, False)
+        fontArial14RedBold = Font(name="Arial", size=14, bold=True, color="FF0000")
+        fontArial14Bold = self._create_arial_font(14, True)
+
+        start_merge = current_line        
+        ws.merge_cells(f"B{start_merge}:J{start_merge}")
+        cell = ws[f"B{start_merge}"]
+        cell.value = f"{etage.nom} : {etage.cotes}"
+        cell.font = fontTimes16Bold
+        cell.alignment = self._fully_centered()
+        
+        ws.row_dimensions[current_line].height = 30
+        self._apply_border_to_range(ws=ws, type="thin", range=f"B{start_merge}:J{start_merge}")
+        
+        
+        for lot, ligne in zip(etage.lots, quotation.lignes):
+            current_line += 1
+            ws.row_dimensions[current_line].height = 30
+            #Privative
+            cell = ws[f"B{current_line}"]
+            cell.font = fontArial12Bold
+            cell.alignment = self._fully_centered()
+            cell.value = en_exposant(lot.indice_privative) if lot.indice_privative else ""
+            
+             #Commune
+            cell = ws[f"C{current_line}"]
+            cell.font = fontArial12
+            cell.alignment = self._fully_centered()
+            cell.value = en_exposant(lot.indice_commune) if lot.indice_commune else ""
+            
+            #Consistance
+            ws.merge_cells(f"D{current_line}:E{current_line}")
+            cell = ws[f"D{current_line}"]
+            cell.value = lot.consistance
+            cell.font =  fontArial12Bold if lot.indice_privative else fontTimes14
+            cell.alignment = self._fully_centered()
+            
+           #Interieure du titre
+            cell = ws[f"F{current_line}"]
+            cell.font = fontArial12Bold
+            cell.alignment = self._fully_centered()
+            cell.value = lot.surface_interieure
+            
+            #Total avec surplomb du titre
+            cell = ws[f"G{current_line}"]
+            cell.font = fontArial12Bold
+            cell.alignment = self._fully_centered()
+            cell.value = lot.surface_avec_surplomb
+
+            #Quots-parts et part d'indivision
+            if ligne.quot_part is not None:
+                cell = ws[f"H{current_line}"]
+                cell.font = fontArial14Bold
+                cell.alignment = self._fully_centered()
+                cell.value = ligne.quot_part
+                
+                cell = ws[f"I{current_line}"]
+                cell.font = fontArial14Bold
+                cell.alignment = self._fully_centered()
+                cell.value = ligne.indivision
+            
+            #Observations 
+            cell = ws[f"J{current_line}"]
+            cell.font = self._create_arial_narrow_font(10, False)
+            cell.alignment = self._fully_centered()
+            cell.value = en_exposant(lot.observations) if lot.observations else ""
+        
+        #Total
+        current_line += 1
+        ws.row_dimensions[current_line].height = 30
+        ws.merge_cells(f"B{current_line}:E{current_line}")
+        cell = ws[f"B{current_line}"]
+        cell.font = fontArial12Bold
+        cell.alignment = self._fully_centered()
+        cell.value = "Total"
+        
+        cell = ws[f"F{current_line}"]
+        cell.font = fontArial12Bold
+        cell.alignment = self._fully_centered()
+        cell.value = etage.total_surface_interieure
+        
+        cell = ws[f"G{current_line}"]
+        cell.font = fontArial12Bold
+        cell.alignment = self._fully_centered()
+        cell.value = etage.total_surface_avec_surplomb
+        
+        #Total etage
+        cell = ws[f"H{current_line}"]
+        cell.font = fontArial14RedBold
+        cell.alignment = self._fully_centered()
+        cell.value = quotation.total_quots_parts if quotation.total_quots_parts is not None else ""
+                
+        cell = ws[f"I{current_line}"]
+        cell.font = fontArial14RedBold
+        cell.alignment = self._fully_centered()
+        cell.value = quotation.total_indivision if quotation.total_indivision is not None else ""
+        
+        return current_line + 1
+
     def _apply_border_to_range(self, ws, type: str = "thin", range: str= ""): 
         for row in ws[range]:
             for cell in row:
                 cell.border = self._solid_black_border(type)
                 
-    def generer_xlxs_ta(self, data: ImportedData, wb: Workbook):
+    def generer_xlxs_ta(
+        self,
+        data: ImportedData,
+        wb: Workbook,
+        executeur: Optional[Executor] = None,
+        ta: Optional[List[EtageTA]] = None,
+    ):
         ws = wb.create_sheet("TA")
 
         for i in range (1,8):
@@ -731,8 +912,6 @@ class CSVParser:
         # =========FONT============
         arial14bold = self._create_arial_font(14, True)
         arial12bold = self._create_arial_font(12, True)
-        arial12 = self._create_arial_font(12, False)
-        arialNarrow12 = self._create_arial_narrow_font(12, False)
         
         # ==============TABLE TITLE ============
         ws.merge_cells("A3:H3")
@@ -801,51 +980,58 @@ class CSVParser:
         cell.alignment = self._fully_centered(wrap_text=True)
         
         current_line = 8
-        for etage in data.etages:
-            merge_start = current_line +1
-            for lot in etage.lots:
-                if (lot.indice_privative):
-                    current_line += 1
-                    ws.row_dimensions[current_line].height = 20
-                    cell = ws[f"A{current_line}"]
-                    cell.value = lot.propriete
-                    cell.alignment = self._fully_centered()
-                    cell.font = arial12bold
-                    
-                    cell = ws[f"C{current_line}"]
-                    cell.value = lot.indice_privative.replace("a", self.unicode)
-                    cell.alignment = self._fully_centered()
-                    cell.font = arial12
-                    
-                    cell = ws[f"D{current_line}"]
-                    cell.value = lot.surface_avec_surplomb
-                    cell.alignment = self._fully_centered()
-                    cell.font = arial12bold
-                    
-                    cell = ws[f"F{current_line}"]
-                    cell.value = lot.consistance
-                    cell.alignment = self._fully_centered()
-                    cell.font = arial12
-                    
-                    cell = ws[f"G{current_line}"]
-                    cell.value = lot.observations.replace("m2","m²").replace("a", self.unicode)
-                    cell.alignment = self._fully_centered()
-                    cell.font = arialNarrow12
-                    
-            if any(lot.indice_privative for lot in etage.lots):
-                ws.merge_cells(f"E{merge_start}:E{current_line}")
-                cell = ws[f"E{merge_start}"]
-                cell.value = etage.nom
-                cell.alignment = self._fully_centered()
-                cell.font = arial12
+        etages = ta if ta is not None else calculer_ta(data)
+        if executeur is not None:
+            rendre_blocs_paralleles(ws, executeur, "_bloc_etage_ta", etages, current_line + 1)
+        else:
+            for etage in etages:
+                current_line = self._bloc_etage_ta(ws, etage, current_line + 1) - 1
                 
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+        return ws
+
+    def _bloc_etage_ta(self, ws, etage: EtageTA, current_line: int) -> int:
+        """Lignes d'un étage du tableau A à partir de current_line ; retourne la ligne suivante"""
+        arial12bold = self._create_arial_font(12, True)
+        arial12 = self._create_arial_font(12, False)
+        arialNarrow12 = self._create_arial_narrow_font(12, False)
+
+        merge_start = current_line
+        for ligne in etage.lignes:
+            ws.row_dimensions[current_line].height = 20
+            cell = ws[f"A{current_line}"]
+            cell.value = ligne.propriete
+            cell.alignment = self._fully_centered()
+            cell.font = arial12bold
+            
+            cell = ws[f"C{current_line}"]
+            cell.value = en_exposant(ligne.indice_privative)
+            cell.alignment = self._fully_centered()
+            cell.font = arial12
+            
+            cell = ws[f"D{current_line}"]
+            cell.value = ligne.surface_avec_surplomb
+            cell.alignment = self._fully_centered()
+            cell.font = arial12bold
+            
+            cell = ws[f"F{current_line}"]
+            cell.value = ligne.consistance
+            cell.alignment = self._fully_centered()
+            cell.font = arial12
+            
+            cell = ws[f"G{current_line}"]
+            cell.value = observation_ta(ligne.observations) if ligne.observations else ""
+            cell.alignment = self._fully_centered()
+            cell.font = arialNarrow12
+            current_line += 1
+                
+        ws.merge_cells(f"E{merge_start}:E{current_line - 1}")
+        cell = ws[f"E{merge_start}"]
+        cell.value = etage.nom
+        cell.alignment = self._fully_centered()
+        cell.font = arial12
+        return current_line
         
-    def generer_excel_tr_n(self, data: ImportedData, wb: Workbook):
+    def generer_excel_tr_n(self, data: ImportedData, wb: Workbook, tr_n: Optional[List[EtageTRN]] = None):
         ws = wb.create_sheet(title="TR-N")
         
         for i in range (2,11):
@@ -966,15 +1152,11 @@ class CSVParser:
         cell.border = self._solid_black_border(style="thin")
         
         current_line = 11
-        for etage in data.etages:
+        for etage in tr_n if tr_n is not None else calculer_tr_n(data):
             start_merge = current_line + 1
             nb_ligne_merge = 0
-            
-            lots_prives = [lot for lot in etage.lots if lot.indice_privative]
-            commerce_lots = [lot for lot in lots_prives if "commerc" in lot.consistance.lower()]
-            appartements_lots = [lot for lot in lots_prives if "appartement" in lot.consistance.lower()]
                 
-            if(len(commerce_lots) > 0):
+            if etage.commerces is not None:
                 current_line += 1
                 nb_ligne_merge += 1
                 ws.row_dimensions[current_line].height = 30
@@ -985,11 +1167,11 @@ class CSVParser:
                 cell.font = arial12
                 
                 cell = ws[f"J{current_line}"]
-                cell.value = f"{Decimal(sum(lot.surface_avec_surplomb for lot in commerce_lots)).quantize(Decimal("1"))} m²"
+                cell.value = f"{etage.commerces} m²"
                 cell.alignment = self._fully_centered()
                 cell.font = arial12
                 
-            if(len(appartements_lots) > 0):
+            if etage.appartements is not None:
                 current_line += 1
                 nb_ligne_merge += 1
                 ws.row_dimensions[current_line].height = 30
@@ -1000,26 +1182,22 @@ class CSVParser:
                 cell.font = arial12
                 
                 cell = ws[f"J{current_line}"]
-                cell.value = f"{Decimal(sum(lot.surface_avec_surplomb for lot in appartements_lots)).quantize(Decimal("1"))} m²"
+                cell.value = f"{etage.appartements} m²"
                 cell.alignment = self._fully_centered()
                 cell.font = arial12
                             
             if(nb_ligne_merge >= 2):
                 ws.merge_cells(f"B{start_merge}:B{start_merge+nb_ligne_merge-1}")
                 
-            if(len(appartements_lots) > 0 or len(commerce_lots) > 0):    
+            if nb_ligne_merge > 0:    
                 cell = ws[f"B{start_merge}"]
                 cell.value = etage.nom
                 cell.alignment = self._fully_centered()
                 cell.font = arial12bold  
         
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+        return ws
     
-    def generate_excel_tr_c(self, data: ImportedData, wb: Workbook):
+    def generate_excel_tr_c(self, data: ImportedData, wb: Workbook, totaux: Optional[TotauxConsistance] = None):
         ws = wb.create_sheet(title="TR-C")
         
         for i in range (2,11):
@@ -1132,11 +1310,9 @@ class CSVParser:
         cell.border = self._solid_black_border(style="thin")
         
         current_line = 11
-        lots_prives = [lot for etage in data.etages for lot in etage.lots if lot.indice_privative]
-        commerce_lots = [lot for lot in lots_prives if "commerc" in lot.consistance.lower()]
-        appartements_lots = [lot for lot in lots_prives if "appartement" in lot.consistance.lower()]
+        totaux = totaux or calculer_tr_c(data)
                 
-        if(len(commerce_lots) > 0):
+        if totaux.commerces is not None:
                 current_line += 1
                 ws.row_dimensions[current_line].height = 30
                 ws.merge_cells(f"B{current_line}:D{current_line}")
@@ -1146,11 +1322,11 @@ class CSVParser:
                 cell.font = arial12
                 
                 cell = ws[f"I{current_line}"]
-                cell.value = f"{Decimal(sum(lot.surface_avec_surplomb for lot in commerce_lots)).quantize(Decimal("1"))} m²"
+                cell.value = f"{totaux.commerces} m²"
                 cell.alignment = self._fully_centered()
                 cell.font = arial12
                 
-        if(len(appartements_lots) > 0):
+        if totaux.appartements is not None:
                 current_line += 1
                 ws.row_dimensions[current_line].height = 30
                 ws.merge_cells(f"B{current_line}:D{current_line}")
@@ -1160,66 +1336,120 @@ class CSVParser:
                 cell.font = arial12
                 
                 cell = ws[f"I{current_line}"]
-                cell.value = f"{Decimal(sum(lot.surface_avec_surplomb for lot in appartements_lots)).quantize(Decimal("1"))} m²"
+                cell.value = f"{totaux.appartements} m²"
                 cell.alignment = self._fully_centered()
                 cell.font = arial12
                         
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+        return ws
     
-    def generer_fichiers_copropriete(self, listFichier: list[str], file: UploadFile):
-        data = self.parse_file(file)
-        xlxs_a_generer = list(set(listFichier) & set(self.excel_key))
-        
-        if xlxs_a_generer:
-            wb = Workbook()
-            for f in xlxs_a_generer:
+    def generer_fichiers_copropriete(self, listFichier: list[str], file: UploadFile, profil: Optional[str] = None):
+        data = self.parse_upload(file)
+        return self.generer_classeur(data, listFichier, profil)
+
+    def generer_classeur(
+        self,
+        data: ImportedData,
+        listFichier: list[str],
+        profil: Optional[str] = None,
+        parallele: Optional[bool] = None,
+        calculs: Optional[Apercu] = None,
+    ) -> BytesIO:
+        """Génère les feuilles demandées dans un seul classeur, sérialisé une seule fois.
+
+        Pour les très grands immeubles (ou si `parallele` est vrai), les blocs
+        d'étages de Quot P CH2 et TA sont rendus en parallèle ; si le pool de
+        rendu casse, le classeur est rendu séquentiellement. Les tableaux
+        déjà présents dans `calculs` (partagés avec les documents PV /
+        Règlement) ne sont pas recalculés.
+        """
+        # Ordre stable des feuilles, celui de excel_key
+        xlxs_a_generer = [f for f in self.excel_key if f in listFichier]
+        if not xlxs_a_generer:
+            raise HTTPException(400, "Aucun fichier XLSX valide à générer")
+
+        if calculs is None:
+            # Tableaux calculés avant le rendu : phase distincte dans les traces
+            with span("calculs", feuilles=len(xlxs_a_generer)):
+                attribuer_donnees(data)
+                calculs = calculer_apercu(data, xlxs_a_generer)
+
+        executeur = executeur_rendu(len(data.etages), parallele)
+        if executeur is None:
+            return self._rendre_classeur(data, xlxs_a_generer, profil, None, calculs)
+        try:
+            return self._rendre_classeur(data, xlxs_a_generer, profil, executeur, calculs)
+        except BrokenProcessPool:
+            abandonner_executeur()
+            return self._rendre_classeur(data, xlxs_a_generer, profil, None, calculs)
+
+    def _rendre_classeur(
+        self,
+        data: ImportedData,
+        xlxs_a_generer: List[str],
+        profil: Optional[str],
+        executeur: Optional[Executor],
+        calculs: Apercu,
+    ) -> BytesIO:
+        wb = Workbook()
+        for f in xlxs_a_generer:
+            with span("rendu", feuille=f, parallele=executeur is not None):
                 match f:
                     case "Quot P CH2":
-                       self.generer_xlxs_quotation(data, wb)
+                        self.generer_xlxs_quotation(data, wb, executeur, calculs.quotation)
                     case "TR-N":
-                        self.generer_excel_tr_n(data, wb)
+                        self.generer_excel_tr_n(data, wb, calculs.tr_n)
                     case "TR-C":
-                        self.generate_excel_tr_c(data, wb)
+                        self.generate_excel_tr_c(data, wb, calculs.tr_c)
                     case "TA":
-                        self.generer_xlxs_ta(data, wb)
+                        self.generer_xlxs_ta(data, wb, executeur, calculs.ta)
                     case "Voix":
-                        self.generer_xlxs_voix(data, wb)
-                    case _:
-                        # cas par défaut si jamais f n’est pas dans excel_key
-                        print(f"Clé inconnue: {f}")
+                        self.generer_xlxs_voix(data, wb, calculs.voix)
 
         # Supprimer la feuille par défaut vide créée automatiquement
         if "Sheet" in wb.sheetnames:
             wb.remove(wb["Sheet"])
-            
-            buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
+
+        with span("serialisation", profil=profil or "serveur", feuilles=len(xlxs_a_generer)):
+            return save_workbook(wb, profil)
       
-    def validate_csv(file: UploadFile) -> str:
-        if not file.filename.lower().endswith(".csv"):
+    def validate_csv(file: UploadFile, content_encoding: Optional[str] = None) -> Dialecte:
+        filename = file.filename.lower()
+        compressed = filename.endswith(EXTENSIONS)
+        if compressed:
+            filename = filename.rsplit(".", 1)[0]
+
+        if not filename.endswith(".csv"):
             raise HTTPException(400, "Extension invalide")
 
-        if file.content_type not in ("text/csv", "application/vnd.ms-excel"):
+        content_types = ["text/csv", "application/vnd.ms-excel"]
+        if compressed or content_encoding:
+            content_types += ["application/gzip", "application/x-gzip", "application/zstd", "application/octet-stream"]
+        if file.content_type not in content_types:
             raise HTTPException(400, "Type MIME invalide")
 
         try:
-            file_bytes = BytesIO(file.file.read())
-            file_bytes.seek(0)
-            
-            wrapper = TextIOWrapper(file_bytes, encoding="utf-8")
-            sample = wrapper.read(2048)
-            try:
-                dialect = csv.Sniffer().sniff(sample)
-                file.file.seek(0)
-                return dialect.delimiter
-            except csv.Error:
-                return ";"
+            return detecter_dialecte_flux(file.file, content_encoding or file.headers.get("content-encoding"))
+        except HTTPException:
+            raise
         except Exception:
-            raise HTTPException(400, "Contenu CSV invalide")
\ No newline at end of file
+            raise HTTPException(400, "Contenu CSV invalide")
+
+    @staticmethod
+    def is_xlsx(file: UploadFile) -> bool:
+        return file.filename.lower().endswith(".xlsx")
+
+    @staticmethod
+    def validate_xlsx(file: UploadFile) -> None:
+        if not CSVParser.is_xlsx(file):
+            raise HTTPException(400, "Extension invalide")
+
+        if file.content_type not in (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "application/octet-stream",
+        ):
+            raise HTTPException(400, "Type MIME invalide")
+
+        signature = file.file.read(4)
+        file.file.seek(0)
+        if signature != b"PK\x03\x04":
+            raise HTTPException(400, "Contenu XLSX invalide")
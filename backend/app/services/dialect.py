@@ -0,0 +1,164 @@
+import codecs
+import csv
+import logging
+from dataclasses import dataclass, replace
+from io import BytesIO
+from typing import BinaryIO, List, Optional
+
+from app.services.compression import decompresser_prefixe, detecter_compression, flux_decompresse, taille_decompressee
+from app.services.traces import span
+
+logger = logging.getLogger("uvicorn.error")
+
+# Taille maximale lue pour la détection (une seule lecture)
+TAILLE_ECHANTILLON = 64 * 1024
+
+# Délimiteurs candidats, par ordre de préférence
+DELIMITEURS = (";", ",", "\t", "|")
+
+# Libellés des lignes d'en-tête du modèle TB (deuxième colonne)
+LIBELLES_ENTETE = ("Titre foncier", "Propriété dite")
+
+# Gestionnaire d'erreurs de décodage UTF-8 : octets invalides lus en cp1252
+REPLI_CP1252 = "repli_cp1252"
+
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+@dataclass(frozen=True)
+class Dialecte:
+    """Encodage, délimiteur et compression détectés pour un fichier CSV"""
+    encoding: str
+    delimiter: str
+    compression: Optional[str] = None
+    # Nombre de lignes extrapolé de l'échantillon, pour estimer le coût du traitement
+    lignes_estimees: Optional[int] = None
+
+
+def detecter_encodage(sample: bytes) -> str:
+    """Détecte l'encodage à partir d'un échantillon d'octets.
+
+    Ordre : BOM, puis UTF-8 validé de façon incrémentale (un caractère
+    multi-octets coupé en fin d'échantillon n'est pas une erreur), puis
+    cp1252 (export Excel Windows) et enfin latin-1 qui accepte tout octet.
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _repli_cp1252(erreur: UnicodeDecodeError):
+    """Décode en cp1252 les octets qui ne sont pas de l'UTF-8 valide (latin-1 pour les 5 octets
+    que cp1252 ne définit pas), puis reprend le décodage UTF-8 après eux"""
+    octets = erreur.object[erreur.start:erreur.end]
+    return "".join(bytes((octet,)).decode("cp1252", errors="ignore") or chr(octet) for octet in octets), erreur.end
+
+
+codecs.register_error(REPLI_CP1252, _repli_cp1252)
+
+
+def erreurs_decodage(encoding: str) -> str:
+    """Gestionnaire d'erreurs du décodage complet du fichier.
+
+    L'encodage est détecté sur les 64 premiers Ko : un fichier dont ils sont
+    en ASCII est lu en UTF-8, même si des octets cp1252 (export Excel
+    Windows) apparaissent plus loin. Ces octets sont alors lus en cp1252
+    plutôt que de rejeter le fichier ; les autres encodages restent stricts.
+    """
+    return REPLI_CP1252 if encoding == "utf-8" else "strict"
+
+
+def detecter_delimiteur(texte: str) -> Optional[str]:
+    """Déduit le délimiteur de la structure connue du tableau TB.
+
+    Les lignes "Titre foncier" et "Propriété dite" portent leur libellé dans
+    la deuxième colonne : le bon délimiteur est celui qui l'y place.
+    """
+    for line in texte.splitlines():
+        if not any(libelle in line for libelle in LIBELLES_ENTETE):
+            continue
+        for delimiter in DELIMITEURS:
+            row = next(csv.reader([line], delimiter=delimiter), [])
+            if len(row) > 1 and any(libelle in row[1] for libelle in LIBELLES_ENTETE):
+                return delimiter
+    return None
+
+
+def _delimiteur_le_plus_regulier(lines: List[str]) -> Optional[str]:
+    """Repli : délimiteur présent avec le même nombre d'occurrences sur le plus de lignes"""
+    meilleur, meilleur_score = None, 0
+    for delimiter in DELIMITEURS:
+        comptes = [line.count(delimiter) for line in lines if line.strip()]
+        comptes = [c for c in comptes if c > 0]
+        if not comptes:
+            continue
+        score = max(comptes.count(c) for c in set(comptes))
+        if score > meilleur_score:
+            meilleur, meilleur_score = delimiter, score
+    return meilleur
+
+
+def detecter_dialecte(sample: bytes) -> Dialecte:
+    """Détecte encodage et délimiteur à partir d'un seul échantillon borné"""
+    encoding = detecter_encodage(sample)
+    texte = codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample, final=False)
+
+    delimiter = detecter_delimiteur(texte)
+    if delimiter is None:
+        # On ignore la dernière ligne, potentiellement tronquée
+        delimiter = _delimiteur_le_plus_regulier(texte.splitlines()[:-1]) or ";"
+        logger.warning("En-tête TB introuvable, délimiteur déduit par fréquence : %r", delimiter)
+
+    return Dialecte(encoding=encoding, delimiter=delimiter)
+
+
+def estimer_lignes(sample: bytes, taille: Optional[int]) -> Optional[int]:
+    """Extrapole le nombre de lignes du fichier à partir de celles de l'échantillon"""
+    lignes = sample.count(b"\n")
+    if len(sample) < TAILLE_ECHANTILLON:
+        # Fichier lu en entier
+        return lignes + (1 if sample and not sample.endswith(b"\n") else 0)
+    if not taille or not lignes:
+        return None
+    return round(lignes * taille / len(sample))
+
+
+def detecter_dialecte_flux(stream: BinaryIO, content_encoding: Optional[str] = None) -> Dialecte:
+    """Détecte le dialecte d'un flux binaire, éventuellement compressé, puis le rembobine"""
+    with span("detection_dialecte") as courant:
+        compression = detecter_compression(stream, content_encoding)
+        with flux_decompresse(stream, compression) as flux:
+            sample = flux.read(TAILLE_ECHANTILLON)
+        stream.seek(0)
+        lignes = estimer_lignes(sample, taille_decompressee(stream, compression))
+        dialecte = replace(detecter_dialecte(sample), compression=compression, lignes_estimees=lignes)
+        if courant is not None:
+            courant.attribuer(compression=compression or "aucune", encodage=dialecte.encoding)
+        return dialecte
+
+
+def detecter_dialecte_prefixe(prefixe: bytes, content_encoding: Optional[str] = None) -> Dialecte:
+    """Détecte le dialecte à partir des premiers octets reçus d'un flux non rembobinable"""
+    with span("detection_dialecte") as courant:
+        compression = detecter_compression(BytesIO(prefixe[:4]), content_encoding)
+        sample = decompresser_prefixe(prefixe, compression, TAILLE_ECHANTILLON)
+        dialecte = replace(detecter_dialecte(sample), compression=compression)
+        if courant is not None:
+            courant.attribuer(compression=compression or "aucune", encodage=dialecte.encoding)
+        return dialecte
@@ -0,0 +1,219 @@
+"""Cache persistant sur disque des classeurs générés et des jeux de données parsés.
+
+Les contenus sont stockés sous un nom dérivé de leur empreinte SHA-256
+(objets/ab/abcd….xlsx) : deux clés au contenu identique partagent le même
+fichier. L'index (clé -> contenu, taille, dernier accès) est une base
+SQLite ; au démarrage seul l'index est lu, jamais les fichiers. Les
+écritures passent par un fichier temporaire renommé atomiquement, et les
+contenus les moins récemment utilisés sont évincés au-delà d'une taille.
+
+Le répertoire (CACHE_DISQUE_DIR, par défaut dans le cache XDG de
+l'utilisateur, hors des sources) et l'index ne sont créés qu'au premier
+accès : importer l'application n'écrit rien sur disque.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from app.models.models import ImportedData
+from app.services.cache import nom_cle_donnees
+
+logger = logging.getLogger("uvicorn.error")
+
+
+
+def _repertoire_par_defaut() -> Path:
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "titre-foncier-api"
+
+
+# Répertoire du cache (vide : cache désactivé) et taille maximale (Mo)
+REPERTOIRE = os.getenv("CACHE_DISQUE_DIR", str(_repertoire_par_defaut()))
+TAILLE_MAX_MO = float(os.getenv("CACHE_DISQUE_MO", "512"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entrees (
+    cle TEXT PRIMARY KEY,
+    contenu TEXT NOT NULL,
+    taille INTEGER NOT NULL,
+    dernier_acces REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entrees_acces ON entrees (dernier_acces);
+CREATE INDEX IF NOT EXISTS entrees_contenu ON entrees (contenu);
+"""
+
+
+def empreinte_flux(stream: BinaryIO) -> str:
+    """Empreinte SHA-256 d'un fichier uploadé, lu par blocs puis rembobiné"""
+    stream.seek(0)
+    empreinte = hashlib.sha256()
+    for bloc in iter(lambda: stream.read(1024 * 1024), b""):
+        empreinte.update(bloc)
+    stream.seek(0)
+    return empreinte.hexdigest()
+
+
+class CacheDisque:
+    """Cache clé -> fichier adressé par son contenu, indexé dans SQLite"""
+
+    def __init__(self, repertoire: Path, taille_max: int):
+        self.repertoire = repertoire
+        self.taille_max = taille_max
+        self.objets = repertoire / "objets"
+
+        self._verrou = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._taille = 0
+        self.indisponible = False
+
+    def _connecter(self) -> sqlite3.Connection:
+        # Plusieurs workers peuvent partager le cache : SQLite sérialise les écritures
+        db = sqlite3.connect(self.repertoire / "index.sqlite3", check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.commit()
+        return db
+
+    def _index(self) -> Optional[sqlite3.Connection]:
+        """Connexion à l'index, ouverte au premier accès ; None si le cache est indisponible.
+        Appelée sous le verrou."""
+        if self._db is None and not self.indisponible:
+            try:
+                self.objets.mkdir(parents=True, exist_ok=True)
+                self._db = self._connecter()
+                # Démarrage à chaud : seul l'index est lu
+                self._taille = self._taille_totale()
+            except (OSError, sqlite3.Error):
+                logger.exception("Cache disque indisponible (%s), désactivé", self.repertoire)
+                self._db = None
+                self.indisponible = True
+            else:
+                logger.info("Cache disque %s : %d Ko indexés", self.repertoire, self._taille // 1024)
+        return self._db
+
+    def apres_fork(self):
+        """Le processus forké ouvre sa propre connexion au premier accès : celle héritée
+        du parent ne doit pas y être utilisée (ni fermée)"""
+        self._verrou = threading.Lock()
+        self._db = None
+
+    def _taille_totale(self) -> int:
+        (taille,) = self._db.execute(
+            "SELECT COALESCE(SUM(taille), 0) FROM (SELECT DISTINCT contenu, taille FROM entrees)"
+        ).fetchone()
+        return taille
+
+    def contient(self, cle: str) -> bool:
+        """Clé présente dans l'index, sans lire le contenu ni mettre à jour son dernier accès"""
+        with self._verrou:
+            db = self._index()
+            return db is not None and db.execute("SELECT 1 FROM entrees WHERE cle = ?", (cle,)).fetchone() is not None
+
+    def ouvrir(self, cle: str) -> Optional[BinaryIO]:
+        """Fichier associé à la clé (et mise à jour de son dernier accès), None si absent.
+
+        Ouvert sous le verrou de l'index : une éviction concurrente (`ajouter`)
+        peut supprimer le fichier, le descripteur reste lisible jusqu'à sa fermeture.
+        """
+        with self._verrou:
+            db = self._index()
+            ligne = db.execute("SELECT contenu FROM entrees WHERE cle = ?", (cle,)).fetchone() if db else None
+            if ligne is None:
+                return None
+            try:
+                fichier = open(self._fichier(ligne[0]), "rb")
+            except FileNotFoundError:
+                # Fichier supprimé hors du cache : l'entrée est obsolète
+                db.execute("DELETE FROM entrees WHERE cle = ?", (cle,))
+                db.commit()
+                return None
+            db.execute("UPDATE entrees SET dernier_acces = ? WHERE cle = ?", (time.time(), cle))
+            db.commit()
+        return fichier
+
+    def _fichier(self, contenu: str) -> Path:
+        # Le nom stocké porte l'extension : "<sha256>.xlsx"
+        return self.objets / contenu[:2] / contenu
+
+    def lire(self, cle: str) -> Optional[bytes]:
+        fichier = self.ouvrir(cle)
+        if fichier is None:
+            return None
+        with fichier:
+            return fichier.read()
+
+    def ajouter(self, cle: str, donnees: bytes, extension: str = "") -> Optional[Path]:
+        """Écrit le contenu (s'il n'existe pas déjà) puis l'associe à la clé"""
+        with self._verrou:
+            if self._index() is None:
+                return None
+        contenu = hashlib.sha256(donnees).hexdigest() + extension
+        chemin = self._fichier(contenu)
+        if not chemin.exists():
+            chemin.parent.mkdir(exist_ok=True)
+            descripteur, temporaire = tempfile.mkstemp(dir=chemin.parent, suffix=".tmp")
+            try:
+                with os.fdopen(descripteur, "wb") as fichier:
+                    fichier.write(donnees)
+                    fichier.flush()
+                    os.fsync(fichier.fileno())
+                os.replace(temporaire, chemin)
+            except BaseException:
+                os.unlink(temporaire)
+                raise
+
+        with self._verrou:
+            db = self._index()
+            nouveau = db.execute("SELECT 1 FROM entrees WHERE contenu = ? LIMIT 1", (contenu,)).fetchone() is None
+            remplace = db.execute("SELECT contenu, taille FROM entrees WHERE cle = ?", (cle,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entrees (cle, contenu, taille, dernier_acces) VALUES (?, ?, ?, ?)",
+                (cle, contenu, len(donnees), time.time()),
+            )
+            db.commit()
+            if nouveau:
+                self._taille += len(donnees)
+            if remplace is not None and remplace[0] != contenu:
+                self._liberer(db, *remplace)
+            if self._taille > self.taille_max:
+                self._evincer()
+        return chemin
+
+    def _liberer(self, db: sqlite3.Connection, contenu: str, taille: int):
+        """Supprime un contenu qui n'est plus associé à aucune clé. Appelée sous le verrou."""
+        if db.execute("SELECT 1 FROM entrees WHERE contenu = ? LIMIT 1", (contenu,)).fetchone() is None:
+            self._fichier(contenu).unlink(missing_ok=True)
+            self._taille -= taille
+
+    def _evincer(self):
+        """Supprime les contenus les moins récemment utilisés jusqu'à repasser sous la taille maximale"""
+        self._taille = self._taille_totale()
+        contenus = self._db.execute(
+            "SELECT contenu, taille FROM entrees GROUP BY contenu ORDER BY MAX(dernier_acces)"
+        ).fetchall()
+        for contenu, taille in contenus:
+            if self._taille <= self.taille_max:
+                break
+            self._db.execute("DELETE FROM entrees WHERE contenu = ?", (contenu,))
+            self._fichier(contenu).unlink(missing_ok=True)
+            self._taille -= taille
+        self._db.commit()
+
+    # Jeux de données parsés, indexés par l'empreinte du fichier uploadé et la version du parsing
+
+    def donnees(self, empreinte_upload: str) -> Optional[ImportedData]:
+        contenu = self.lire(nom_cle_donnees(empreinte_upload))
+        if contenu is None:
+            return None
+        return ImportedData.model_validate_json(contenu)
+
+    def ajouter_donnees(self, empreinte_upload: str, data: ImportedData):
+        self.ajouter(nom_cle_donnees(empreinte_upload), data.model_dump_json().encode("utf-8"), ".json")
+
+
+cache_disque = CacheDisque(Path(REPERTOIRE), int(TAILLE_MAX_MO * 1024 * 1024)) if REPERTOIRE else None
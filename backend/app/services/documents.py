@@ -0,0 +1,323 @@
+"""Documents de copropriété (PV, Règlement) générés depuis les données parsées.
+
+Les gabarits sont le XML WordprocessingML du corps du document
+(resources/templates/*.document.xml), avec des balises de substitution :
+
+    {{ chemin.vers.valeur }}            valeur échappée (nombres à la française)
+    {{ chemin | filtre }}               filtres : nombre, entier, exposant
+    {% pour lot dans etage.lignes %}    boucle
+    {% si ligne.quot_part %}            condition (valeur non vide)
+    {% fin %}                           fin de boucle ou de condition
+
+Les gabarits ne contiennent que les données et tableaux calculés : chaque
+clause juridique est un emplacement « [À COMPLÉTER — …] » surligné, dont la
+rédaction est fournie et relue par le propriétaire du modèle.
+
+Ils sont compilés une fois, à l'import (avant le fork des workers avec
+app.serveur), puis remplis à chaque requête par substitution en flux : le
+XML produit est écrit au fil du rendu dans l'archive .docx, sans être
+assemblé en mémoire. Les tableaux (quots-parts, voix, totaux) viennent de
+l'Apercu calculé une seule fois pour la requête et partagé avec les
+feuilles XLSX.
+"""
+import re
+from decimal import ROUND_HALF_UP, Decimal
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from fastapi import HTTPException
+
+from app.models.models import Apercu, ImportedData
+from app.services.calculs import calculer_apercu
+from app.services.csv_parser import CSVParser, en_exposant
+from app.services.traces import span
+from app.services.xlsx_writer import DATE_ZIP
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "resources" / "templates"
+
+# Documents proposés à côté des feuilles de CSVParser.excel_key, et leur gabarit
+GABARITS_DOCUMENTS = {
+    "PV": "pv_copropriete.document.xml",
+    "Reglement": "reglement_copropriete.document.xml",
+}
+DOCUMENTS = list(GABARITS_DOCUMENTS)
+
+# Feuilles dont les tableaux calculés sont repris dans les documents
+CALCULS_DOCUMENTS = ("Quot P CH2", "TR-C", "Voix")
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Taille des blocs écrits dans l'archive pendant le rendu (caractères)
+TAILLE_BLOC = 64 * 1024
+
+BALISE = re.compile(r"\{\{\s*(.*?)\s*\}\}|\{%\s*(.*?)\s*%\}", re.S)
+POUR = re.compile(r"pour\s+(\w+)\s+dans\s+([\w.]+)$")
+SI = re.compile(r"si\s+([\w.]+)$")
+VARIABLE = re.compile(r"([\w.]+)(?:\s*\|\s*(\w+))?$")
+
+# Espaces de mise en forme du gabarit, entre deux balises XML
+ESPACES_ENTRE_BALISES = re.compile(r">\s+<")
+
+
+def _nombre(valeur, decimales: int = 2) -> str:
+    """1234.5 -> « 1 234,50 » (arrondi au plus proche, moitiés vers le haut)"""
+    if valeur is None or valeur == "":
+        return ""
+    quantum = Decimal(1).scaleb(-decimales)
+    arrondi = Decimal(str(valeur)).quantize(quantum, rounding=ROUND_HALF_UP)
+    texte = f"{arrondi:,.{decimales}f}"
+    return texte.replace(",", " ").replace(".", ",")
+
+
+FILTRES: Dict[str, Callable[[Any], str]] = {
+    "nombre": _nombre,
+    "entier": lambda valeur: _nombre(valeur, 0),
+    "exposant": lambda valeur: en_exposant(str(valeur)) if valeur is not None else "",
+}
+
+
+def _texte(valeur) -> str:
+    if valeur is None:
+        return ""
+    if isinstance(valeur, (Decimal, float)):
+        return _nombre(valeur)
+    return str(valeur)
+
+
+# Nœuds compilés : ("texte", xml) | ("valeur", chemin, filtre) | ("pour", nom, chemin, enfants) | ("si", chemin, enfants)
+Noeud = Tuple[Any, ...]
+
+
+class Gabarit:
+    """Gabarit compilé : arbre de nœuds, rendu en flux de fragments XML"""
+
+    def __init__(self, source: str, nom: str = "gabarit"):
+        self.nom = nom
+        self.noeuds = self._compiler(source)
+
+    def _erreur(self, source: str, position: int, message: str) -> ValueError:
+        ligne = source.count("\n", 0, position) + 1
+        return ValueError(f"{self.nom}, ligne {ligne} : {message}")
+
+    @staticmethod
+    def _chemin(expression: str) -> Tuple[str, ...]:
+        return tuple(expression.split("."))
+
+    def _compiler(self, source: str) -> List[Noeud]:
+        racine: List[Noeud] = []
+        # Pile des blocs ouverts : (liste des enfants, position d'ouverture)
+        pile: List[Tuple[List[Noeud], int]] = [(racine, 0)]
+        position = 0
+        for m in BALISE.finditer(source):
+            self._ajouter_texte(pile[-1][0], source[position:m.start()])
+            position = m.end()
+            if m.group(1) is not None:
+                variable = VARIABLE.match(m.group(1))
+                if variable is None:
+                    raise self._erreur(source, m.start(), f"expression invalide : {m.group(1)!r}")
+                filtre = variable.group(2)
+                if filtre is not None and filtre not in FILTRES:
+                    raise self._erreur(source, m.start(), f"filtre inconnu : {filtre}")
+                pile[-1][0].append(("valeur", self._chemin(variable.group(1)), filtre))
+                continue
+
+            instruction = m.group(2)
+            if instruction == "fin":
+                if len(pile) == 1:
+                    raise self._erreur(source, m.start(), "{% fin %} sans bloc ouvert")
+                pile.pop()
+            elif (pour := POUR.match(instruction)) is not None:
+                enfants: List[Noeud] = []
+                pile[-1][0].append(("pour", pour.group(1), self._chemin(pour.group(2)), enfants))
+                pile.append((enfants, m.start()))
+            elif (si := SI.match(instruction)) is not None:
+                enfants = []
+                pile[-1][0].append(("si", self._chemin(si.group(1)), enfants))
+                pile.append((enfants, m.start()))
+            else:
+                raise self._erreur(source, m.start(), f"instruction inconnue : {instruction!r}")
+        if len(pile) > 1:
+            raise self._erreur(source, pile[-1][1], "bloc non fermé par {% fin %}")
+        self._ajouter_texte(racine, source[position:])
+        return racine
+
+    @staticmethod
+    def _ajouter_texte(noeuds: List[Noeud], texte: str):
+        # La mise en forme du gabarit (retours à la ligne, indentation) n'est pas du contenu
+        texte = ESPACES_ENTRE_BALISES.sub("><", texte)
+        if texte[:1].isspace() and texte.lstrip()[:1] == "<":
+            texte = texte.lstrip()
+        if texte[-1:].isspace() and texte.rstrip()[-1:] == ">":
+            texte = texte.rstrip()
+        if texte:
+            noeuds.append(("texte", texte))
+
+    @staticmethod
+    def _resoudre(contexte: Dict[str, Any], chemin: Tuple[str, ...]):
+        valeur = contexte[chemin[0]]
+        for attribut in chemin[1:]:
+            if valeur is None:
+                return None
+            valeur = valeur[attribut] if isinstance(valeur, dict) else getattr(valeur, attribut)
+        return valeur
+
+    def rendre(self, contexte: Dict[str, Any]) -> Iterator[str]:
+        """Fragments XML du document, dans l'ordre"""
+        return self._rendre(self.noeuds, contexte)
+
+    def _rendre(self, noeuds: List[Noeud], contexte: Dict[str, Any]) -> Iterator[str]:
+        for noeud in noeuds:
+            genre = noeud[0]
+            if genre == "texte":
+                yield noeud[1]
+            elif genre == "valeur":
+                valeur = self._resoudre(contexte, noeud[1])
+                texte = FILTRES[noeud[2]](valeur) if noeud[2] else _texte(valeur)
+                yield escape(texte)
+            elif genre == "pour":
+                for element in self._resoudre(contexte, noeud[2]) or ():
+                    yield from self._rendre(noeud[3], {**contexte, noeud[1]: element})
+            elif self._resoudre(contexte, noeud[1]):
+                yield from self._rendre(noeud[2], contexte)
+
+
+def _charger_gabarits() -> Dict[str, Gabarit]:
+    return {
+        document: Gabarit((TEMPLATES_DIR / fichier).read_text(encoding="utf-8"), fichier)
+        for document, fichier in GABARITS_DOCUMENTS.items()
+    }
+
+
+# Compilés au démarrage : une erreur de gabarit empêche le serveur de démarrer
+GABARITS = _charger_gabarits()
+
+
+# Parties fixes du paquet .docx, autour de word/document.xml
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+RELATIONS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1"'
+    ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"'
+    ' Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _entree(nom: str) -> ZipInfo:
+    """Entrée d'archive à date fixe : même document, mêmes octets"""
+    entree = ZipInfo(nom, date_time=DATE_ZIP)
+    entree.create_system = 3
+    entree.external_attr = 0o644 << 16
+    entree.compress_type = ZIP_DEFLATED
+    return entree
+
+
+def contexte_documents(data: ImportedData, calculs: Apercu) -> Dict[str, Any]:
+    """Variables des gabarits : données parsées et tableaux déjà calculés"""
+    lots = [lot for etage in data.etages for lot in etage.lots]
+    return {
+        "titre_foncier": data.titre_foncier,
+        "nb_etages": len(data.etages),
+        "nb_lots": sum(1 for lot in lots if lot.indice_privative),
+        "etages": data.etages,
+        "quotation": calculs.quotation,
+        "voix": calculs.voix,
+        "tr_c": calculs.tr_c,
+    }
+
+
+def ecrire_docx(gabarit: Gabarit, contexte: Dict[str, Any]) -> bytes:
+    """Document .docx rempli ; le XML du corps est écrit dans l'archive au fil du rendu"""
+    buffer = BytesIO()
+    with ZipFile(buffer, "w", compression=ZIP_DEFLATED) as archive:
+        archive.writestr(_entree("[Content_Types].xml"), CONTENT_TYPES)
+        archive.writestr(_entree("_rels/.rels"), RELATIONS)
+        with archive.open(_entree("word/document.xml"), "w") as document:
+            bloc: List[str] = []
+            taille = 0
+            for fragment in gabarit.rendre(contexte):
+                bloc.append(fragment)
+                taille += len(fragment)
+                if taille >= TAILLE_BLOC:
+                    document.write("".join(bloc).encode("utf-8"))
+                    bloc, taille = [], 0
+            document.write("".join(bloc).encode("utf-8"))
+    return buffer.getvalue()
+
+
+def generer_documents(data: ImportedData, documents: Iterable[str], calculs: Apercu) -> Dict[str, bytes]:
+    """Documents demandés (clés de DOCUMENTS), dans l'ordre de DOCUMENTS"""
+    documents = set(documents)
+    contexte = contexte_documents(data, calculs)
+    resultat = {}
+    for document in DOCUMENTS:
+        if document in documents:
+            with span("document", document=document):
+                resultat[f"{document}.docx"] = ecrire_docx(GABARITS[document], contexte)
+    return resultat
+
+
+def assembler_dossier(classeur: Optional[BinaryIO], documents: Dict[str, bytes]) -> BytesIO:
+    """Archive zip du classeur XLSX (s'il y a des feuilles) et des documents"""
+    if classeur is None and not documents:
+        raise HTTPException(400, "Aucun fichier valide à générer")
+    buffer = BytesIO()
+    with ZipFile(buffer, "w", compression=ZIP_DEFLATED) as archive:
+        if classeur is not None:
+            # Le classeur est déjà compressé (profil choisi) : stocké tel quel
+            entree = _entree("fichier.xlsx")
+            entree.compress_type = ZIP_STORED
+            with classeur:
+                archive.writestr(entree, classeur.read())
+        for nom, contenu in documents.items():
+            archive.writestr(_entree(nom), contenu)
+    buffer.seek(0)
+    return buffer
+
+
+def documents_demandes(fichiers: Iterable[str]) -> List[str]:
+    """Documents (PV, Règlement) parmi les fichiers demandés, dans l'ordre de DOCUMENTS"""
+    fichiers = set(fichiers)
+    return [document for document in DOCUMENTS if document in fichiers]
+
+
+# Génère le classeur XLSX des feuilles données, à partir des tableaux déjà calculés s'il y en a
+GenerateurClasseur = Callable[[List[str], Optional[Apercu]], BinaryIO]
+
+
+def generer_dossier(
+    data: ImportedData, fichiers: Iterable[str], classeur: GenerateurClasseur
+) -> Tuple[BinaryIO, str, str]:
+    """Fichiers demandés : (contenu, nom, type de contenu).
+
+    Sans PV ni Règlement, le classeur seul, comme avant. Sinon, les
+    tableaux sont calculés une fois pour les feuilles et les documents, et
+    le tout est renvoyé dans une archive zip.
+    """
+    fichiers = list(fichiers)
+    documents = documents_demandes(fichiers)
+    if not documents:
+        return classeur(fichiers, None), "fichier.xlsx", XLSX_MEDIA_TYPE
+
+    feuilles = [f for f in fichiers if f in CSVParser.excel_key]
+    with span("calculs", feuilles=len(feuilles), documents=len(documents)):
+        calculs = calculer_apercu(data, set(feuilles) | set(CALCULS_DOCUMENTS))
+    dossier = assembler_dossier(
+        classeur(feuilles, calculs) if feuilles else None,
+        generer_documents(data, documents, calculs),
+    )
+    return dossier, "fichiers_copropriete.zip", ZIP_MEDIA_TYPE
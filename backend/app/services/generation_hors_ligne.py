@@ -0,0 +1,238 @@
+"""Génération hors ligne des classeurs depuis des fichiers TB sur disque (CLI, dossier surveillé).
+
+Un classeur est écrit par titre foncier dans le répertoire de sortie. Un
+état SQLite, dans ce même répertoire, associe chaque fichier source à
+l'empreinte de son contenu (et des feuilles / du profil demandés) : une
+source dont l'empreinte n'a pas changé et dont le classeur existe encore
+n'est pas régénérée ; le contenu n'est même pas relu si la taille et la
+date de modification du fichier sont inchangées.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.services.cache import cle_classeur, nom_cle
+from app.services.csv_parser import CSVParser
+from app.models.models import ImportedData
+from app.services.compression import EXTENSIONS
+from app.services.dialect import detecter_dialecte_flux
+from app.services.tables import Tables, calculer_tables
+
+NOM_ETAT = ".copro-etat.sqlite3"
+
+# Fichiers TB acceptés : CSV (éventuellement compressés) et XLSX
+SUFFIXES_SOURCES = tuple(".csv" + extension for extension in ("",) + EXTENSIONS) + (".xlsx",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    empreinte TEXT NOT NULL,
+    sortie TEXT NOT NULL,
+    titre_foncier TEXT NOT NULL,
+    genere_le REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contenus (
+    source TEXT PRIMARY KEY,
+    taille INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+def est_source(chemin: Path) -> bool:
+    return chemin.name.lower().endswith(SUFFIXES_SOURCES) and not chemin.name.startswith(".")
+
+
+def empreinte_contenu(chemin: Path) -> str:
+    """Empreinte SHA-256 du contenu du fichier"""
+    empreinte = hashlib.sha256()
+    with open(chemin, "rb") as fichier:
+        for bloc in iter(lambda: fichier.read(1024 * 1024), b""):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def nom_classeur(titre_foncier: str, source: Path) -> str:
+    """Nom du classeur d'un titre foncier (« 154311 /05 » -> 154311-05.xlsx)"""
+    nom = re.sub(r"[^\w-]+", "-", titre_foncier).strip("-")
+    return f"{nom or source.name.split('.')[0]}.xlsx"
+
+
+@dataclass
+class Resultat:
+    """Issue du traitement d'un fichier source"""
+    source: str
+    empreinte: str
+    temporaire: Optional[str] = None  # Classeur écrit, à renommer en `sortie`
+    sortie: Optional[str] = None
+    titre_foncier: str = ""
+    nb_lots: int = 0
+    octets: int = 0
+    erreur: Optional[str] = None
+
+
+# Processus du pool tué pendant la génération (mémoire insuffisante, signal)
+ERREUR_PROCESSUS = "processus de génération interrompu (mémoire insuffisante ou signal)"
+
+
+def resultat_interrompu(source: Path, empreinte: str) -> Resultat:
+    """Échec d'une source dont le processus de génération a été tué"""
+    return Resultat(source=str(source), empreinte=empreinte, erreur=ERREUR_PROCESSUS)
+
+
+def parser_source(parser: CSVParser, chemin: Path) -> ImportedData:
+    """Parse un fichier TB sur disque, CSV (dialecte détecté) ou XLSX"""
+    with open(chemin, "rb") as fichier:
+        upload = UploadFile(fichier, filename=chemin.name)
+        if not CSVParser.is_xlsx(upload):
+            parser.apply_dialect(detecter_dialecte_flux(fichier))
+        return parser.parse_upload(upload)
+
+
+def message_erreur(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail.get("message", e.detail)) if isinstance(e.detail, dict) else str(e.detail)
+    return f"{type(e).__name__} : {e}"
+
+
+def tables_source(source: str, strict: bool = True) -> Tuple[Optional[Tables], Optional[str]]:
+    """Tables lots / etages d'un fichier TB, sans classeur ; (None, erreur) en cas d'échec"""
+    try:
+        return calculer_tables(parser_source(CSVParser(strict=strict), Path(source))), None
+    except Exception as e:
+        return None, message_erreur(e)
+
+
+def generer_source(
+    source: str,
+    empreinte: str,
+    fichiers: List[str],
+    repertoire_sortie: str,
+    profil: Optional[str] = None,
+    strict: bool = True,
+) -> Resultat:
+    """Parse un fichier TB et écrit son classeur dans un fichier temporaire du répertoire de sortie.
+
+    Exécuté dans un processus du pool : le renommage vers le nom définitif
+    est laissé à l'appelant, qui détecte les titres fonciers en double.
+    """
+    chemin = Path(source)
+    resultat = Resultat(source=source, empreinte=empreinte, octets=chemin.stat().st_size)
+    parser = CSVParser(strict=strict)
+    try:
+        data = parser_source(parser, chemin)
+        # Déjà dans un worker du pool : pas de pool de rendu imbriqué
+        contenu = parser.generer_classeur(data, fichiers, profil, parallele=False).getvalue()
+    except Exception as e:
+        resultat.erreur = message_erreur(e)
+        return resultat
+
+    descripteur, temporaire = tempfile.mkstemp(dir=repertoire_sortie, prefix=".", suffix=".tmp")
+    with os.fdopen(descripteur, "wb") as sortie:
+        sortie.write(contenu)
+    resultat.temporaire = temporaire
+    resultat.sortie = str(Path(repertoire_sortie) / nom_classeur(data.titre_foncier, chemin))
+    resultat.titre_foncier = data.titre_foncier
+    resultat.nb_lots = sum(len(etage.lots) for etage in data.etages)
+    return resultat
+
+
+class EtatGeneration:
+    """Sources déjà générées dans un répertoire de sortie, avec l'empreinte de leur contenu"""
+
+    def __init__(self, repertoire_sortie: Path):
+        self.repertoire_sortie = repertoire_sortie
+        self._verrou = threading.Lock()
+        self._db = sqlite3.connect(repertoire_sortie / NOM_ETAT, check_same_thread=False, timeout=30)
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def empreinte(self, source: Path, fichiers: List[str], profil: Optional[str]) -> str:
+        """Empreinte du contenu de la source, des feuilles demandées et du profil de compression.
+
+        Le contenu n'est relu que si la taille ou la date de modification du
+        fichier ont changé depuis le dernier calcul.
+        """
+        chemin = str(source.resolve())
+        stat = source.stat()
+        with self._verrou:
+            ligne = self._db.execute(
+                "SELECT sha256 FROM contenus WHERE source = ? AND taille = ? AND mtime_ns = ?",
+                (chemin, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if ligne is not None:
+            sha256 = ligne[0]
+        else:
+            sha256 = empreinte_contenu(source)
+            with self._verrou:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO contenus (source, taille, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                    (chemin, stat.st_size, stat.st_mtime_ns, sha256),
+                )
+                self._db.commit()
+        return nom_cle(cle_classeur(sha256, fichiers, profil))
+
+    def a_jour(self, source: Path, empreinte: str) -> bool:
+        """Vrai si la source a déjà été générée avec ce contenu et que son classeur existe"""
+        with self._verrou:
+            ligne = self._db.execute(
+                "SELECT empreinte, sortie FROM sources WHERE source = ?", (str(source.resolve()),)
+            ).fetchone()
+        return ligne is not None and ligne[0] == empreinte and Path(ligne[1]).exists()
+
+    def sources_de(self, sortie: str) -> List[str]:
+        """Sources qui ont produit ce classeur"""
+        with self._verrou:
+            lignes = self._db.execute("SELECT source FROM sources WHERE sortie = ?", (sortie,)).fetchall()
+        return [source for (source,) in lignes]
+
+    def enregistrer(self, resultat: Resultat):
+        with self._verrou:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (source, empreinte, sortie, titre_foncier, genere_le)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (str(Path(resultat.source).resolve()), resultat.empreinte, resultat.sortie,
+                 resultat.titre_foncier, time.time()),
+            )
+            self._db.commit()
+
+    def oublier(self, source: Path):
+        with self._verrou:
+            self._db.execute("DELETE FROM sources WHERE source = ?", (str(source.resolve()),))
+            self._db.commit()
+
+    def publier(self, resultat: Resultat) -> Resultat:
+        """Renomme le classeur temporaire vers son nom définitif et met l'état à jour.
+
+        Un titre foncier déjà produit par un autre fichier source, toujours
+        présent, n'est pas écrasé : le résultat passe en échec.
+        """
+        source = str(Path(resultat.source).resolve())
+        autres = [autre for autre in self.sources_de(resultat.sortie) if autre != source]
+        for autre in autres:
+            if Path(autre).exists():
+                os.unlink(resultat.temporaire)
+                resultat.temporaire = None
+                resultat.erreur = f"titre foncier {resultat.titre_foncier} déjà généré depuis {autre}"
+                return resultat
+
+        os.replace(resultat.temporaire, resultat.sortie)
+        resultat.temporaire = None
+        # Le classeur appartient désormais à cette source
+        for autre in autres:
+            self.oublier(Path(autre))
+        self.enregistrer(resultat)
+        return resultat
+
+    def fermer(self):
+        self._db.close()
@@ -0,0 +1,131 @@
+import asyncio
+import io
+import queue
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.models.models import ImportedData
+from app.services.csv_parser import CSVParser
+from app.services.dialect import TAILLE_ECHANTILLON, detecter_dialecte_prefixe
+
+# Nombre maximal de blocs reçus en attente de parsing (mémoire bornée)
+BLOCS_EN_ATTENTE = 64
+
+
+class FluxBlocs(io.RawIOBase):
+    """Flux binaire alimenté bloc par bloc par la boucle asyncio et lu par le thread de parsing.
+
+    La lecture bloque tant que le bloc suivant n'est pas arrivé : le parser
+    avance au rythme du réseau au lieu d'attendre la fin du transfert.
+    """
+
+    def __init__(self, taille_file: int = BLOCS_EN_ATTENTE):
+        self._blocs: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=taille_file)
+        self._courant = memoryview(b"")
+        self._termine = False
+        self._ferme = False
+        self._interrompu = False
+
+    def readable(self) -> bool:
+        return True
+
+    def alimenter(self, bloc: Optional[bytes]):
+        """Ajoute un bloc (None marque la fin) ; abandonné si le lecteur a fermé le flux"""
+        while not self._ferme:
+            try:
+                self._blocs.put(bloc, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def interrompre(self):
+        """Corps abandonné (client déconnecté) : le lecteur lève une erreur au lieu de voir une fin de fichier"""
+        self._interrompu = True
+        try:
+            # Débloque un lecteur en attente ; file pleine : il n'attend pas
+            self._blocs.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def readinto(self, b) -> int:
+        while not self._courant:
+            if self._interrompu:
+                raise ConnectionAbortedError("Corps de requête interrompu")
+            if self._termine:
+                return 0
+            bloc = self._blocs.get()
+            if bloc is None:
+                if self._interrompu:
+                    raise ConnectionAbortedError("Corps de requête interrompu")
+                self._termine = True
+                return 0
+            self._courant = memoryview(bloc)
+
+        n = min(len(b), len(self._courant))
+        b[:n] = self._courant[:n]
+        self._courant = self._courant[n:]
+        return n
+
+    def close(self):
+        self._ferme = True
+        super().close()
+
+
+async def _alimenter(flux: FluxBlocs, bloc: Optional[bytes]):
+    try:
+        flux._blocs.put_nowait(bloc)
+    except queue.Full:
+        # File pleine : on attend le parser sans bloquer la boucle
+        await run_in_threadpool(flux.alimenter, bloc)
+
+
+async def parser_en_flux(
+    parser: CSVParser,
+    blocs: AsyncIterator[bytes],
+    content_encoding: Optional[str] = None,
+) -> ImportedData:
+    """Parse un corps de requête CSV au fil de sa réception.
+
+    Les premiers octets (jusqu'à TAILLE_ECHANTILLON) servent à détecter le
+    dialecte ; le parsing démarre ensuite dans un thread pendant que la
+    suite du corps est transmise bloc par bloc.
+    """
+    prefixe = bytearray()
+    async for bloc in blocs:
+        prefixe += bloc
+        if len(prefixe) >= TAILLE_ECHANTILLON:
+            break
+
+    if not prefixe:
+        raise HTTPException(400, "Contenu CSV vide")
+    parser.apply_dialect(detecter_dialecte_prefixe(bytes(prefixe), content_encoding))
+
+    flux = FluxBlocs()
+    flux.alimenter(bytes(prefixe))
+
+    def parse() -> ImportedData:
+        try:
+            return parser.parse_stream(io.BufferedReader(flux))
+        finally:
+            flux.close()
+
+    tache = asyncio.ensure_future(run_in_threadpool(parse))
+    recu = False
+    try:
+        async for bloc in blocs:
+            if tache.done():
+                break
+            await _alimenter(flux, bloc)
+        recu = True
+    finally:
+        if recu:
+            await _alimenter(flux, None)
+        else:
+            # Client déconnecté ou requête annulée : le parser ne conclut pas sur
+            # un corps tronqué, et son thread est attendu avant de rendre la main
+            flux.interrompre()
+            await asyncio.gather(tache, return_exceptions=True)
+
+    return await tache
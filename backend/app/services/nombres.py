@@ -0,0 +1,126 @@
+"""Conversion des cellules numériques (surfaces) du fichier TB.
+
+Les exports de tableurs français écrivent « 12,50 » ou « 1 234,50 » là
+où float() attend « 12.50 » : ces surfaces étaient lues comme absentes.
+Formats acceptés :
+
+    12.5   -3   1e-05        nombres simples
+    12,50                    virgule décimale
+    1 234,50   1.234,50      séparateurs de milliers : espace, espace
+    1'234,50                 insécable, espace fine, apostrophe, point
+    1,234.50   1,234,567     milliers à l'anglaise
+    1 234.50                 espace de milliers, point décimal
+
+« 1,234 » est lu à la française (1,234 m²). nan, inf et les tirets bas,
+acceptés par float(), sont refusés.
+
+Chemin rapide : float(), implémenté en C, puis refus de ce qu'il accepte
+en trop (nan, inf, tirets bas) ; les formats locaux ne passent par les
+regex qu'en cas d'échec. Les colonnes entières se convertissent en lot
+(convertir_colonne) : la colonne est normalisée en une fois (virgules,
+séparateurs de milliers) puis convertie par map(float) ; ce n'est qu'en
+cas d'échec qu'elle est reprise cellule par cellule, avec la position
+des cellules invalides.
+"""
+import re
+from dataclasses import dataclass, field
+from math import isfinite
+from typing import List, Optional, Sequence, Tuple
+
+SIMPLE = re.compile(r"[ \t]*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[ \t]*")
+
+# Séparateur de milliers entre deux chiffres, suivi d'un groupe de trois
+ESPACE_MILLIERS = re.compile(r"(?<=\d)[ \u00a0\u202f'](?=\d{3}(?:\D|$))")
+LOCAL = re.compile(
+    r"([+-]?)(?:"
+    r"(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d+))?"  # 1.234,50  1234,50
+    r"|(\d{1,3}(?:,\d{3})+)(?:\.(\d+))?"  # 1,234.50  1,234,567
+    r")"
+)
+
+
+def _fini(valeur: float, cellule: str) -> bool:
+    """Écarte nan, inf et les tirets bas (1_000), acceptés par float()"""
+    return isfinite(valeur) and "_" not in cellule
+
+
+def _nombre_local(cellule: str) -> Optional[float]:
+    if "." not in cellule and cellule.count(",") == 1:
+        # 12,50 : cas le plus courant, sans regex
+        try:
+            valeur = float(cellule.replace(",", "."))
+        except ValueError:
+            pass
+        else:
+            return valeur if _fini(valeur, cellule) else None
+    cellule = ESPACE_MILLIERS.sub("", cellule)
+    if SIMPLE.fullmatch(cellule):
+        # 1 234.50
+        return float(cellule)
+    m = LOCAL.fullmatch(cellule)
+    if m is None:
+        return None
+    signe, entier_fr, decimales_fr, entier_en, decimales_en = m.groups()
+    if entier_fr is not None:
+        entier, decimales = entier_fr.replace(".", ""), decimales_fr
+    else:
+        entier, decimales = entier_en.replace(",", ""), decimales_en
+    return float(f"{signe}{entier}.{decimales or 0}")
+
+
+def nombre(cellule: Optional[str]) -> Optional[float]:
+    """Valeur d'une cellule numérique, None si elle est vide ou invalide"""
+    if not cellule:
+        return None
+    try:
+        valeur = float(cellule)
+    except ValueError:
+        cellule = cellule.strip()
+        return _nombre_local(cellule) if cellule else None
+    return valeur if _fini(valeur, cellule) else None
+
+
+@dataclass
+class ColonneNumerique:
+    """Colonne convertie : une valeur par cellule (None si vide ou invalide)"""
+    valeurs: List[Optional[float]]
+    # (position dans la colonne, contenu) des cellules non vides invalides
+    invalides: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def _colonne_rapide(cellules: Sequence[str]) -> Optional[List[float]]:
+    """Toute la colonne normalisée puis convertie en une fois ; None si une cellule résiste"""
+    texte = "\n".join(cellules)
+    if "_" in texte:
+        return None
+    if "," in texte or " " in texte or "'" in texte or not texte.isascii():
+        texte = ESPACE_MILLIERS.sub("", texte)
+        # Milliers à l'anglaise (1,234.50) : chemin cellule par cellule
+        if "," in texte and "." in texte:
+            return None
+        texte = texte.replace(",", ".")
+    normalisees = texte.split("\n")
+    # Saut de ligne à l'intérieur d'une cellule : le découpage ne correspond plus
+    if len(normalisees) != len(cellules):
+        return None
+    try:
+        valeurs = list(map(float, normalisees))
+    except ValueError:
+        return None
+    return valeurs if all(map(isfinite, valeurs)) else None
+
+
+def convertir_colonne(cellules: Sequence[str]) -> ColonneNumerique:
+    """Convertit une colonne entière de cellules numériques"""
+    valeurs = _colonne_rapide(cellules) if cellules else []
+    if valeurs is not None:
+        return ColonneNumerique(valeurs)
+
+    valeurs = []
+    invalides = []
+    for position, cellule in enumerate(cellules):
+        valeur = nombre(cellule)
+        if valeur is None and cellule and not cellule.isspace():
+            invalides.append((position, cellule))
+        valeurs.append(valeur)
+    return ColonneNumerique(valeurs, invalides)
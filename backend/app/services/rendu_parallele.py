@@ -0,0 +1,214 @@
+"""Rendu parallèle des blocs d'étages d'une feuille (Quot P CH2, TA) pour les très grands immeubles.
+
+Le nombre de lignes de chaque étage est connu d'avance (structure étages /
+lots) : la ligne de départ de chaque bloc est calculée, puis les blocs sont
+rendus en XML de feuille par des processus séparés, avec les mêmes méthodes
+_bloc_etage_* que le rendu séquentiel. Les fragments sont ensuite insérés
+dans la partie XML de la feuille à la sérialisation (xlsx_writer), avec les
+cellules fusionnées ; les styles de chaque bloc sont renumérotés dans ceux
+du classeur.
+
+Le mode automatique (SEUIL_ETAGES) ne s'applique que dans le processus
+principal : les workers des pools de la CLI et de la surveillance rendent
+déjà un fichier chacun, un pool de rendu par worker multiplierait les
+processus. Si le pool de rendu casse (processus tué), le classeur est
+rendu de nouveau séquentiellement et le pool recréé à la demande suivante.
+"""
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, List, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell._writer import write_cell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.xml.functions import xmlfile
+
+# Nombre d'étages à partir duquel le rendu parallèle est utilisé (0 : jamais automatiquement)
+SEUIL_ETAGES = int(os.getenv("RENDU_PARALLELE_SEUIL_ETAGES", "100"))
+# Processus de rendu (0 : nombre de cœurs)
+WORKERS = int(os.getenv("RENDU_PARALLELE_WORKERS", "0")) or os.cpu_count() or 1
+# Nombre de blocs par processus, pour équilibrer les étages de tailles inégales
+BLOCS_PAR_WORKER = 4
+
+_executeur: Optional[ProcessPoolExecutor] = None
+
+logger = logging.getLogger(__name__)
+
+# Attribut s="…" d'une cellule écrite par openpyxl (<c r="B12" s="3" …>)
+STYLE_CELLULE = re.compile(r'(<c r="[A-Z]+[0-9]+" s=")([0-9]+)"')
+
+
+@dataclass
+class BlocXML:
+    """Lignes d'un bloc d'étages rendues en XML, avec leurs fusions et leurs styles"""
+    debut: int
+    fin: int
+    xml: str
+    fusions: List[str]
+    # Pour chaque style du bloc : (police, remplissage, bordure, format, protection, alignement, pivotButton, quotePrefix)
+    styles: List[Tuple[Any, ...]]
+
+
+def executeur_rendu(nb_etages: int, parallele: Optional[bool] = None) -> Optional[Executor]:
+    """Pool de processus de rendu si le mode parallèle s'applique, sinon None"""
+    if parallele is None:
+        parallele = (
+            SEUIL_ETAGES > 0
+            and nb_etages >= SEUIL_ETAGES
+            and WORKERS > 1
+            and multiprocessing.parent_process() is None
+        )
+    if not parallele:
+        return None
+
+    global _executeur
+    if _executeur is None:
+        # spawn : pas de fork d'un serveur multi-thread
+        _executeur = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executeur
+
+
+def abandonner_executeur():
+    """Pool cassé : arrêté sans attendre, un nouveau sera créé à la prochaine demande"""
+    global _executeur
+    if _executeur is not None:
+        logger.warning("Pool de rendu parallèle cassé, rendu séquentiel")
+        _executeur.shutdown(wait=False, cancel_futures=True)
+        _executeur = None
+
+
+def _lignes_bloc(methode: str, etage: Any) -> int:
+    if methode == "_bloc_etage_quotation":
+        # Titre de l'étage, un lot par ligne, Total
+        return len(etage[0].lots) + 2
+    return len(etage.lignes)
+
+
+def _decouper(methode: str, etages: Sequence[Any], debut: int, nb_blocs: int) -> List[Tuple[int, list]]:
+    """Découpe les étages en blocs consécutifs de tailles voisines, avec leur ligne de départ"""
+    total = sum(_lignes_bloc(methode, etage) for etage in etages)
+    cible = max(1, total // nb_blocs)
+    blocs: List[Tuple[int, list]] = []
+    courant: list = []
+    ligne = debut
+    depart = debut
+    for etage in etages:
+        if courant and sum(_lignes_bloc(methode, e) for e in courant) >= cible:
+            blocs.append((depart, courant))
+            depart, courant = ligne, []
+        courant.append(etage)
+        ligne += _lignes_bloc(methode, etage)
+    if courant:
+        blocs.append((depart, courant))
+    return blocs
+
+
+def rendre_bloc(methode: str, etages: list, debut: int) -> BlocXML:
+    """Exécuté dans un processus de rendu : rend les étages dans une feuille vierge puis en XML"""
+    from app.services.csv_parser import CSVParser
+
+    parser = CSVParser()
+    wb = Workbook()
+    ws = wb.active
+    ligne = debut
+    for etage in etages:
+        ligne = getattr(parser, methode)(ws, etage, ligne)
+
+    lignes = {}
+    for (row, _), cell in sorted(ws._cells.items()):
+        lignes.setdefault(row, []).append(cell)
+    for row in ws.row_dimensions.keys() - lignes.keys():
+        lignes[row] = []
+
+    # Même sérialisation que WorksheetWriter.write_row
+    out = BytesIO()
+    with xmlfile(out) as xf:
+        for row, cells in sorted(lignes.items()):
+            attrs = {"r": f"{row}"}
+            attrs.update(ws.row_dimensions.get(row, {}))
+            with xf.element("row", attrs):
+                for cell in cells:
+                    if cell._value is None and not cell.has_style and not cell._comment:
+                        continue
+                    write_cell(xf, ws, cell, cell.has_style)
+
+    styles = []
+    for style in wb._cell_styles:
+        format_nombre = style.numFmtId
+        if format_nombre >= BUILTIN_FORMATS_MAX_SIZE:
+            format_nombre = wb._number_formats[format_nombre - BUILTIN_FORMATS_MAX_SIZE]
+        styles.append((
+            wb._fonts[style.fontId],
+            wb._fills[style.fillId],
+            wb._borders[style.borderId],
+            format_nombre,
+            wb._protections[style.protectionId],
+            wb._alignments[style.alignmentId],
+            style.pivotButton,
+            style.quotePrefix,
+        ))
+
+    return BlocXML(
+        debut=debut,
+        fin=ligne - 1,
+        xml=out.getvalue().decode("utf-8"),
+        fusions=[str(fusion) for fusion in ws.merged_cells],
+        styles=styles,
+    )
+
+
+def rendre_blocs_paralleles(ws, executeur: Executor, methode: str, etages: Sequence[Any], debut: int) -> int:
+    """Lance le rendu des blocs d'étages ; ils seront insérés dans la feuille à la sérialisation.
+
+    Retourne la ligne qui suit le dernier bloc.
+    """
+    blocs: List[Future] = [
+        executeur.submit(rendre_bloc, methode, bloc, depart)
+        for depart, bloc in _decouper(methode, etages, debut, WORKERS * BLOCS_PAR_WORKER)
+    ]
+    ws._blocs_paralleles = getattr(ws, "_blocs_paralleles", []) + blocs
+    return debut + sum(_lignes_bloc(methode, etage) for etage in etages)
+
+
+def _style_classeur(wb, style: Tuple[Any, ...]) -> int:
+    """Enregistre le style d'un bloc dans le classeur et retourne son identifiant"""
+    police, remplissage, bordure, format_nombre, protection, alignement, pivot, prefixe = style
+    if isinstance(format_nombre, str):
+        format_nombre = wb._number_formats.add(format_nombre) + BUILTIN_FORMATS_MAX_SIZE
+    return wb._cell_styles.add(StyleArray([
+        wb._fonts.add(police),
+        wb._fills.add(remplissage),
+        wb._borders.add(bordure),
+        format_nombre,
+        wb._protections.add(protection),
+        wb._alignments.add(alignement),
+        pivot,
+        prefixe,
+        0,
+    ]))
+
+
+def blocs_en_attente(ws) -> List[BlocXML]:
+    """Attend les blocs de la feuille, enregistre leurs styles et leurs fusions dans le classeur"""
+    futures = getattr(ws, "_blocs_paralleles", None)
+    if not futures:
+        return []
+
+    blocs = []
+    for future in futures:
+        bloc = future.result()
+        ids = [_style_classeur(ws.parent, style) for style in bloc.styles]
+        bloc.xml = STYLE_CELLULE.sub(lambda m: f'{m.group(1)}{ids[int(m.group(2))]}"', bloc.xml)
+        for fusion in bloc.fusions:
+            # Sans créer de MergedCell : les cellules du bloc sont déjà dans le XML
+            ws.merged_cells.add(MergedCellRange(ws, fusion))
+        blocs.append(bloc)
+    ws._blocs_paralleles = []
+    return sorted(blocs, key=lambda bloc: bloc.debut)
@@ -0,0 +1,224 @@
+"""Contrôle d'admission des traitements (parsing + génération) selon leur coût estimé.
+
+Le coût d'une requête est exprimé en lignes du tableau TB, estimées à bas
+prix (taille de l'upload, ou lignes comptées dans l'échantillon de détection
+du dialecte). Deux voies :
+
+    rapide : petits travaux, admis en priorité (plus court d'abord)
+    lourde : gros travaux, nombre d'exécutions et file d'attente bornés
+
+Un travail est admis tant que la somme des coûts en cours reste sous un
+budget global (mémoire / CPU), plutôt que selon un nombre fixe de workers.
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.models.models import ImportedData, MetriquesOrdonnanceur, MetriquesVoie
+from app.services.dialect import Dialecte
+from app.services.traces import span
+
+RAPIDE = "rapide"
+LOURDE = "lourde"
+
+# Taille moyenne d'une ligne du tableau TB, en octets (CSV / XLSX)
+OCTETS_PAR_LIGNE_CSV = 80
+OCTETS_PAR_LIGNE_XLSX = 40
+# Taux de compression supposé quand la taille décompressée est inconnue
+RATIO_COMPRESSION = 6
+
+# Attente au-delà de laquelle un travail n'est plus doublé par de plus petits (s)
+VIEILLISSEMENT = float(os.getenv("ADMISSION_VIEILLISSEMENT", "10"))
+
+
+class _Ticket:
+    __slots__ = ("cout", "voie", "arrivee", "admis")
+
+    def __init__(self, cout: int, voie: str):
+        self.cout = cout
+        self.voie = voie
+        self.arrivee = time.perf_counter()
+        self.admis = False
+
+
+class _StatsVoie:
+    def __init__(self):
+        self.en_cours = 0
+        self.admis = 0
+        self.rejetes = 0
+        self.attente_totale = 0.0
+        self.attente_max = 0.0
+
+
+class Ordonnanceur:
+    """Admission par budget de coût en vol, plus court d'abord, avec voie lourde bornée"""
+
+    def __init__(self, budget: int, seuil_lourd: int, lourds_max: int, file_lourde_max: int):
+        self.budget = budget
+        self.seuil_lourd = seuil_lourd
+        self.lourds_max = lourds_max
+        self.file_lourde_max = file_lourde_max
+
+        self._condition = threading.Condition()
+        self._attente: List[tuple] = []
+        self._sequence = itertools.count()
+        self._cout_en_vol = 0
+        self._stats: Dict[str, _StatsVoie] = {RAPIDE: _StatsVoie(), LOURDE: _StatsVoie()}
+
+    @classmethod
+    def depuis_env(cls) -> "Ordonnanceur":
+        return cls(
+            budget=int(os.getenv("ADMISSION_BUDGET_LIGNES", "20000")),
+            seuil_lourd=int(os.getenv("ADMISSION_SEUIL_LOURD", "500")),
+            lourds_max=int(os.getenv("ADMISSION_LOURDS_MAX", "2")),
+            file_lourde_max=int(os.getenv("ADMISSION_FILE_LOURDE_MAX", "8")),
+        )
+
+    def voie(self, cout: int) -> str:
+        return LOURDE if cout > self.seuil_lourd else RAPIDE
+
+    def _voie_lourde_pleine(self, ticket: _Ticket) -> bool:
+        return ticket.voie == LOURDE and self._stats[LOURDE].en_cours >= self.lourds_max
+
+    def _admissible(self, ticket: _Ticket) -> bool:
+        if self._voie_lourde_pleine(ticket):
+            return False
+        # Un travail plus gros que le budget passe seul
+        return self._cout_en_vol == 0 or self._cout_en_vol + ticket.cout <= self.budget
+
+    def _admettre_suivants(self):
+        """Admet les travaux qui tiennent dans le budget : ceux qui attendent depuis plus de
+        VIEILLISSEMENT d'abord, par ordre d'arrivée, puis du plus court au plus long"""
+        maintenant = time.perf_counter()
+
+        def priorite(entree: tuple) -> tuple:
+            cout, sequence, ticket = entree
+            if maintenant - ticket.arrivee > VIEILLISSEMENT:
+                return 0, sequence
+            return 1, cout, sequence
+
+        for entree in sorted(self._attente, key=priorite):
+            ticket = entree[2]
+            if self._admissible(ticket):
+                ticket.admis = True
+                self._cout_en_vol += ticket.cout
+                self._stats[ticket.voie].en_cours += 1
+            elif priorite(entree)[0] == 0 and not self._voie_lourde_pleine(ticket):
+                # Réserve le budget du travail ancien : les plus petits ne le doublent plus
+                break
+        self._attente = [entree for entree in self._attente if not entree[2].admis]
+        self._condition.notify_all()
+
+    def acquerir(self, cout: int) -> _Ticket:
+        """Bloque jusqu'à l'admission du travail ; 503 si la file lourde est pleine"""
+        cout = max(1, cout)
+        ticket = _Ticket(cout, self.voie(cout))
+        stats = self._stats[ticket.voie]
+        with span("admission", cout=cout, voie=ticket.voie), self._condition:
+            if ticket.voie == LOURDE:
+                en_attente = sum(1 for _, _, t in self._attente if t.voie == LOURDE)
+                if en_attente >= self.file_lourde_max:
+                    stats.rejetes += 1
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Serveur saturé par des fichiers volumineux, réessayez plus tard",
+                        headers={"Retry-After": "10"},
+                    )
+            self._attente.append((cout, next(self._sequence), ticket))
+            self._admettre_suivants()
+            while not ticket.admis:
+                # Réveil périodique : le vieillissement peut changer l'ordre d'admission
+                self._condition.wait(timeout=1)
+                if not ticket.admis:
+                    self._admettre_suivants()
+
+            attente = time.perf_counter() - ticket.arrivee
+            stats.admis += 1
+            stats.attente_totale += attente
+            stats.attente_max = max(stats.attente_max, attente)
+        return ticket
+
+    def essayer_acquerir(self, cout: int) -> Optional[_Ticket]:
+        """Admission sans attente, pour le travail facultatif : refusée dès qu'un travail attend
+        ou que le budget restant ne suffit pas"""
+        cout = max(1, cout)
+        ticket = _Ticket(cout, self.voie(cout))
+        with self._condition:
+            if self._attente or self._cout_en_vol + cout > self.budget or not self._admissible(ticket):
+                return None
+            ticket.admis = True
+            self._cout_en_vol += cout
+            self._stats[ticket.voie].en_cours += 1
+        return ticket
+
+    def occupe(self) -> bool:
+        """Vrai si des travaux attendent leur admission"""
+        with self._condition:
+            return bool(self._attente)
+
+    def liberer(self, ticket: _Ticket):
+        with self._condition:
+            self._cout_en_vol -= ticket.cout
+            self._stats[ticket.voie].en_cours -= 1
+            self._admettre_suivants()
+
+    @contextmanager
+    def admission(self, cout: int) -> Iterator[_Ticket]:
+        ticket = self.acquerir(cout)
+        try:
+            yield ticket
+        finally:
+            self.liberer(ticket)
+
+    def metriques(self) -> MetriquesOrdonnanceur:
+        with self._condition:
+            voies = {}
+            for nom, stats in self._stats.items():
+                attente = [t for _, _, t in self._attente if t.voie == nom]
+                voies[nom] = MetriquesVoie(
+                    en_attente=len(attente),
+                    cout_en_attente=sum(t.cout for t in attente),
+                    en_cours=stats.en_cours,
+                    admis=stats.admis,
+                    rejetes=stats.rejetes,
+                    attente_moyenne_ms=stats.attente_totale / stats.admis * 1000 if stats.admis else 0.0,
+                    attente_max_ms=stats.attente_max * 1000,
+                )
+            return MetriquesOrdonnanceur(
+                budget=self.budget,
+                cout_en_vol=self._cout_en_vol,
+                seuil_lourd=self.seuil_lourd,
+                lourds_max=self.lourds_max,
+                voies=voies,
+            )
+
+
+def cout_octets(taille: Optional[int], compresse: bool = False, octets_par_ligne: int = OCTETS_PAR_LIGNE_CSV) -> int:
+    """Estime le nombre de lignes d'après la taille en octets d'un upload"""
+    if not taille:
+        return 1
+    if compresse:
+        taille *= RATIO_COMPRESSION
+    return taille // octets_par_ligne + 1
+
+
+def cout_upload(file: UploadFile, dialecte: Optional[Dialecte] = None) -> int:
+    """Coût d'un fichier uploadé : lignes comptées à la détection du dialecte, sinon taille"""
+    if dialecte is not None:
+        if dialecte.lignes_estimees is not None:
+            return dialecte.lignes_estimees
+        return cout_octets(file.size, dialecte.compression is not None)
+    return cout_octets(file.size, octets_par_ligne=OCTETS_PAR_LIGNE_XLSX)
+
+
+def cout_donnees(data: ImportedData) -> int:
+    """Coût d'une génération à partir de données déjà parsées"""
+    return sum(len(etage.lots) for etage in data.etages) or 1
+
+
+ordonnanceur = Ordonnanceur.depuis_env()
@@ -0,0 +1,145 @@
+"""Pré-génération spéculative des classeurs après un upload.
+
+Dans le parcours en deux temps (/api/upload puis /api/generate-*), les
+feuilles sont presque toujours téléchargées juste après l'upload : on les
+génère en tâche de fond, une par une, dans le cache des classeurs.
+
+La spéculation ne passe jamais avant le travail demandé : chaque feuille
+n'est générée que si l'ordonnanceur l'admet sans attente, et les feuilles
+d'un jeu de données remplacé par un nouvel upload sont abandonnées.
+"""
+import logging
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterable, Optional
+
+from app.models.models import Apercu, ImportedData
+from app.services.cache import CleClasseur, cache_classeurs, cle_classeur, empreinte_donnees, nom_cle
+from app.services.coalescence import coalesceur
+from app.services.csv_parser import CSVParser
+from app.services.disk_cache import cache_disque
+from app.services.scheduler import cout_donnees, ordonnanceur
+from app.services.traces import attribuer
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def _classeur_disque(cle: CleClasseur) -> Optional[BinaryIO]:
+    # Fichier ouvert, servi sans copie en mémoire
+    return cache_disque.ouvrir(nom_cle(cle)) if cache_disque is not None else None
+
+
+def _sur_disque(cle: CleClasseur) -> bool:
+    return cache_disque is not None and cache_disque.contient(nom_cle(cle))
+
+
+def _memoriser(cle: CleClasseur, contenu: bytes):
+    """Met le classeur en cache, en mémoire et sur disque"""
+    cache_classeurs.ajouter(cle, contenu)
+    if cache_disque is not None:
+        cache_disque.ajouter(nom_cle(cle), contenu, ".xlsx")
+
+
+class Speculation:
+    """Génère en arrière-plan une feuille par classeur, pour chaque type de feuille"""
+
+    def __init__(self):
+        self._executeur = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculation")
+        # Réentrant : Future.cancel() appelle _oublier dans le thread appelant
+        self._verrou = threading.RLock()
+        # Jeu de données du dernier upload : seul à être spéculé
+        self._empreinte: Optional[str] = None
+        self._en_cours: Dict[CleClasseur, Future] = {}
+        self.terminees = 0
+        self.abandonnees = 0
+
+    def lancer(self, data: ImportedData, empreinte: str, profil: Optional[str] = None):
+        """Planifie la génération de chaque feuille ; annule les spéculations précédentes"""
+        with self._verrou:
+            self._empreinte = empreinte
+            for cle, future in list(self._en_cours.items()):
+                if cle[0] != empreinte and future.cancel():
+                    self.abandonnees += 1
+
+            for fichier in CSVParser.excel_key:
+                cle = cle_classeur(empreinte, [fichier], profil)
+                if cle in self._en_cours or cache_classeurs.contient(cle) or _sur_disque(cle):
+                    continue
+                future = self._executeur.submit(self._generer, cle, data)
+                self._en_cours[cle] = future
+                future.add_done_callback(lambda _, cle=cle: self._oublier(cle))
+
+    def _oublier(self, cle: CleClasseur):
+        with self._verrou:
+            self._en_cours.pop(cle, None)
+
+    def _generer(self, cle: CleClasseur, data: ImportedData) -> Optional[bytes]:
+        if cle[0] != self._empreinte:
+            self.abandonnees += 1
+            return None
+
+        # Serveur chargé : la feuille sera générée à la demande
+        ticket = ordonnanceur.essayer_acquerir(cout_donnees(data))
+        if ticket is None:
+            self.abandonnees += 1
+            return None
+        try:
+            contenu = CSVParser().generer_classeur(data, list(cle[1]), cle[2]).getvalue()
+        except Exception:
+            logger.exception("Échec de la pré-génération de %s", cle[1])
+            return None
+        finally:
+            ordonnanceur.liberer(ticket)
+
+        _memoriser(cle, contenu)
+        self.terminees += 1
+        return contenu
+
+    def attendre(self, cle: CleClasseur) -> Optional[BytesIO]:
+        """Résultat d'une génération spéculative déjà démarrée pour cette clé, sinon None.
+
+        Une spéculation encore en file est annulée : la requête génère
+        elle-même la feuille plutôt que d'attendre les autres.
+        """
+        with self._verrou:
+            future = self._en_cours.get(cle)
+        if future is None or future.cancel():
+            return None
+        try:
+            contenu = future.result()
+        except CancelledError:
+            return None
+        return BytesIO(contenu) if contenu is not None else None
+
+
+speculation = Speculation()
+
+
+def generer_classeur_en_cache(
+    data: ImportedData,
+    fichiers: Iterable[str],
+    profil: Optional[str] = None,
+    empreinte: Optional[str] = None,
+    calculs: Optional[Apercu] = None,
+) -> BinaryIO:
+    """Classeur depuis le cache (mémoire, puis disque : fichier ouvert) ou la spéculation
+    en cours, sinon généré (avec admission) puis mis en cache. Les requêtes simultanées
+    du même classeur partagent une seule génération.
+
+    `calculs` : tableaux déjà calculés pour la même requête (documents PV / Règlement)"""
+    fichiers = list(fichiers)
+    cle = cle_classeur(empreinte or empreinte_donnees(data), fichiers, profil)
+
+    resultat = cache_classeurs.obtenir(cle) or _classeur_disque(cle) or speculation.attendre(cle)
+    if resultat is not None:
+        attribuer(classeur_en_cache=True)
+        return resultat
+
+    def generer() -> bytes:
+        with ordonnanceur.admission(cout_donnees(data)):
+            contenu = CSVParser().generer_classeur(data, fichiers, profil, calculs=calculs).getvalue()
+        _memoriser(cle, contenu)
+        return contenu
+
+    return BytesIO(coalesceur.executer(cle, generer))
@@ -0,0 +1,245 @@
+"""Surveillance d'un dossier de dépôt : génération des classeurs des fichiers TB nouveaux ou modifiés.
+
+Les changements sont signalés par inotify (Linux, via la libc) ou, à
+défaut, par scrutation périodique du dossier. Un fichier n'est traité
+qu'une fois ses écritures terminées (aucun changement pendant DELAI_STABILITE
+secondes) ; sa génération n'est relancée que si l'empreinte de son contenu a
+changé. L'état (generation_hors_ligne.EtatGeneration) est conservé dans le
+répertoire de sortie : un redémarrage ne retraite pas tout le dossier.
+
+Si un processus de génération est tué (mémoire, signal), le pool est
+recréé et les fichiers en cours sont relancés une fois ; un fichier qui
+casse encore le pool est en échec.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services.generation_hors_ligne import EtatGeneration, est_source, generer_source, resultat_interrompu
+
+logger = logging.getLogger("uvicorn.error")
+
+# Délai sans écriture avant de traiter un fichier (s)
+DELAI_STABILITE = float(os.getenv("SURVEILLANCE_DELAI", "2"))
+# Intervalle de scrutation quand inotify n'est pas disponible (s)
+INTERVALLE_SCRUTATION = float(os.getenv("SURVEILLANCE_INTERVALLE", "2"))
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+EVENEMENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Noms des fichiers du dossier créés, modifiés ou déplacés dedans, signalés par inotify"""
+
+    def __init__(self, repertoire: Path):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        masque = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(repertoire), masque) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {repertoire}")
+        self.debordement = False
+
+    def attendre(self, timeout: float) -> Set[str]:
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        noms = set()
+        try:
+            donnees = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return noms
+        position = 0
+        while position < len(donnees):
+            _, masque, _, longueur = EVENEMENT.unpack_from(donnees, position)
+            position += EVENEMENT.size
+            nom = donnees[position:position + longueur].rstrip(b"\0")
+            position += longueur
+            if masque & IN_Q_OVERFLOW:
+                # Événements perdus : le dossier sera relu en entier
+                self.debordement = True
+            elif nom:
+                noms.add(os.fsdecode(nom))
+        return noms
+
+    def fermer(self):
+        os.close(self._fd)
+
+
+class _Scrutation:
+    """Noms des fichiers dont la taille ou la date de modification a changé depuis le dernier passage"""
+
+    def __init__(self, repertoire: Path, intervalle: float):
+        self._repertoire = repertoire
+        self._intervalle = intervalle
+        self._signatures = self._lire()
+        self._prochain = time.monotonic() + intervalle
+        self.debordement = False
+
+    def _lire(self) -> Dict[str, tuple]:
+        signatures = {}
+        with os.scandir(self._repertoire) as entrees:
+            for entree in entrees:
+                if entree.is_file():
+                    stat = entree.stat()
+                    signatures[entree.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def attendre(self, timeout: float) -> Set[str]:
+        attente = self._prochain - time.monotonic()
+        if attente > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, attente))
+        self._prochain = time.monotonic() + self._intervalle
+        signatures = self._lire()
+        noms = {nom for nom, signature in signatures.items() if self._signatures.get(nom) != signature}
+        self._signatures = signatures
+        return noms
+
+    def fermer(self):
+        pass
+
+
+class Surveillant:
+    """Boucle du mode démon : détecte, laisse se stabiliser puis génère les fichiers du dossier"""
+
+    def __init__(
+        self,
+        repertoire: Path,
+        sortie: Path,
+        fichiers: List[str],
+        profil: Optional[str] = None,
+        strict: bool = True,
+        workers: int = 1,
+        scrutation: bool = False,
+    ):
+        self.repertoire = repertoire
+        self.sortie = sortie
+        self.fichiers = fichiers
+        self.profil = profil
+        self.strict = strict
+        self.workers = workers
+        self.scrutation = scrutation
+        self.arret = threading.Event()
+
+        # Fichier -> instant du dernier changement constaté
+        self._en_attente: Dict[Path, float] = {}
+        # Fichier -> (empreinte, génération lancée)
+        self._en_cours: Dict[Path, Tuple[str, Future]] = {}
+        # Fichiers relancés après un pool cassé, et leur empreinte
+        self._relances: Dict[Path, str] = {}
+        self.generes = 0
+        self.echecs = 0
+
+    def _observateur(self):
+        if not self.scrutation:
+            try:
+                return _Inotify(self.repertoire)
+            except (OSError, AttributeError):
+                logger.warning("inotify indisponible, scrutation du dossier toutes les %.0f s", INTERVALLE_SCRUTATION)
+        return _Scrutation(self.repertoire, INTERVALLE_SCRUTATION)
+
+    def _relire_dossier(self):
+        """Met en attente tous les fichiers du dossier (démarrage, événements perdus)"""
+        for chemin in self.repertoire.iterdir():
+            if est_source(chemin):
+                try:
+                    self._en_attente.setdefault(chemin, chemin.stat().st_mtime)
+                except FileNotFoundError:
+                    continue
+
+    def _signaler(self, noms: Set[str]):
+        maintenant = time.time()
+        for nom in noms:
+            chemin = self.repertoire / nom
+            if est_source(chemin):
+                self._en_attente[chemin] = maintenant
+
+    def _lancer_stables(self, etat: EtatGeneration, executeur: ProcessPoolExecutor):
+        """Soumet les fichiers sans changement depuis DELAI_STABILITE, si leur contenu a changé"""
+        maintenant = time.time()
+        for chemin, dernier_changement in list(self._en_attente.items()):
+            if maintenant - dernier_changement < DELAI_STABILITE or chemin in self._en_cours:
+                continue
+            del self._en_attente[chemin]
+            try:
+                empreinte = etat.empreinte(chemin, self.fichiers, self.profil)
+            except FileNotFoundError:
+                continue
+            if etat.a_jour(chemin, empreinte):
+                continue
+            self._en_cours[chemin] = empreinte, executeur.submit(
+                generer_source, str(chemin), empreinte, self.fichiers, str(self.sortie), self.profil, self.strict,
+            )
+
+    def _publier_terminees(self, etat: EtatGeneration) -> bool:
+        """Publie les générations terminées ; vrai si le pool est cassé et doit être recréé"""
+        casse = False
+        for chemin, (empreinte, future) in list(self._en_cours.items()):
+            if not future.done():
+                continue
+            del self._en_cours[chemin]
+            try:
+                resultat = future.result()
+            except BrokenProcessPool:
+                casse = True
+                if self._relances.pop(chemin, None) != empreinte:
+                    # Peut-être victime d'un autre fichier : relancé une fois, sur le nouveau pool
+                    self._relances[chemin] = empreinte
+                    self._en_attente[chemin] = 0.0
+                    logger.warning("Pool de génération cassé pendant %s, relancé", chemin.name)
+                    continue
+                resultat = resultat_interrompu(chemin, empreinte)
+            else:
+                self._relances.pop(chemin, None)
+            if resultat.erreur is None:
+                resultat = etat.publier(resultat)
+            if resultat.erreur is None:
+                self.generes += 1
+                logger.info("%s -> %s (%d lots)", chemin.name, Path(resultat.sortie).name, resultat.nb_lots)
+            else:
+                self.echecs += 1
+                logger.error("Échec de %s : %s", chemin.name, resultat.erreur)
+        return casse
+
+    def executer(self):
+        self.sortie.mkdir(parents=True, exist_ok=True)
+        etat = EtatGeneration(self.sortie)
+        observateur = self._observateur()
+        logger.info("Surveillance de %s (%s), classeurs dans %s", self.repertoire, type(observateur).__name__, self.sortie)
+        self._relire_dossier()
+        executeur = ProcessPoolExecutor(max(1, self.workers))
+        try:
+            while not self.arret.is_set():
+                self._signaler(observateur.attendre(min(0.5, DELAI_STABILITE)))
+                if observateur.debordement:
+                    observateur.debordement = False
+                    self._relire_dossier()
+                self._lancer_stables(etat, executeur)
+                if self._publier_terminees(etat):
+                    executeur.shutdown(cancel_futures=True)
+                    executeur = ProcessPoolExecutor(max(1, self.workers))
+
+            # Arrêt : les générations déjà lancées sont terminées et publiées
+            for _, future in self._en_cours.values():
+                future.exception()
+            self._publier_terminees(etat)
+        finally:
+            executeur.shutdown()
+            observateur.fermer()
+            etat.fermer()
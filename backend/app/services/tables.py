@@ -0,0 +1,232 @@
+"""Export en colonnes des tableaux calculés (Parquet, Arrow IPC, CSV), sans openpyxl.
+
+Pour les traitements en aval, qui relisaient jusqu'ici les classeurs XLSX
+pour en extraire les quots-parts, deux tables sont écrites directement
+depuis les données parsées et les calculs :
+
+    lots     une ligne par lot : surfaces, catégorie de consistance,
+             quote-part, indivision, numéro d'ordre et NVi (parties
+             privatives)
+    etages   une ligne par étage : totaux de surfaces, de quots-parts et
+             d'indivision, surfaces des commerces et des appartements (TR-N)
+
+Les colonnes sont construites en une passe, puis écrites en Parquet ou en
+Arrow IPC compressés en zstd avec pyarrow (dépendance optionnelle), sinon
+en CSV (UTF-8, séparateur virgule, point décimal). Les quots-parts et NVi restent
+exactes : decimal128(18, 2) en Parquet / Arrow, texte décimal en CSV.
+"""
+import csv
+from dataclasses import dataclass, field
+from decimal import Decimal
+from io import BytesIO, TextIOWrapper
+from typing import BinaryIO, Dict, Optional, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from fastapi import HTTPException
+
+from app.models.models import Apercu, ImportedData
+from app.services.calculs import calculer_apercu, categorie_consistance
+from app.services.xlsx_writer import DATE_ZIP
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # dépendance optionnelle
+    pyarrow = None
+
+# Format -> (extension, pyarrow requis)
+FORMATS_TABLES = {
+    "parquet": (".parquet", True),
+    "arrow": (".arrow", True),
+    "csv": (".csv", False),
+}
+FORMAT_PAR_DEFAUT = "parquet" if pyarrow is not None else "csv"
+
+# Tableaux repris dans les tables
+CALCULS_TABLES = ("Quot P CH2", "TR-N", "Voix")
+
+# Catégories des lots hors commerces / appartements
+AUTRE = "autre"
+COMMUNE = "commune"
+
+# Types des colonnes : texte, entier, reel (float64), decimal (2 décimales, exact)
+COLONNES_LOTS: Tuple[Tuple[str, str], ...] = (
+    ("titre_foncier", "texte"),
+    ("num_etage", "entier"),
+    ("etage", "texte"),
+    ("propriete", "texte"),
+    ("titre_num", "texte"),
+    ("indice_privative", "texte"),
+    ("indice_commune", "texte"),
+    ("consistance", "texte"),
+    ("categorie", "texte"),
+    ("surface_interieure", "reel"),
+    ("surface_avec_surplomb", "reel"),
+    ("quot_part", "decimal"),
+    ("indivision", "entier"),
+    ("num_ordre", "entier"),
+    ("nvi", "decimal"),
+)
+COLONNES_ETAGES: Tuple[Tuple[str, str], ...] = (
+    ("titre_foncier", "texte"),
+    ("num_etage", "entier"),
+    ("etage", "texte"),
+    ("cotes", "texte"),
+    ("nb_lots", "entier"),
+    ("nb_parties_privatives", "entier"),
+    ("total_surface_interieure", "reel"),
+    ("total_surface_avec_surplomb", "reel"),
+    ("total_quots_parts", "decimal"),
+    ("total_indivision", "entier"),
+    ("surface_commerces", "entier"),
+    ("surface_appartements", "entier"),
+)
+SCHEMAS = {"lots": COLONNES_LOTS, "etages": COLONNES_ETAGES}
+
+
+def resoudre_format(format: Optional[str]) -> str:
+    """Retourne le format demandé, ou celui par défaut, en vérifiant qu'il est disponible"""
+    format = format or FORMAT_PAR_DEFAUT
+    if format not in FORMATS_TABLES:
+        raise HTTPException(400, f"Format de tables inconnu : {format} (attendu : {', '.join(FORMATS_TABLES)})")
+    if FORMATS_TABLES[format][1] and pyarrow is None:
+        raise HTTPException(400, f"Format {format} indisponible : pyarrow n'est pas installé (utilisez csv)")
+    return format
+
+
+def _colonnes(schema: Tuple[Tuple[str, str], ...]) -> Dict[str, list]:
+    return {nom: [] for nom, _ in schema}
+
+
+def _entier(valeur: Optional[Decimal]) -> Optional[int]:
+    return int(valeur) if valeur is not None else None
+
+
+@dataclass
+class Tables:
+    """Tables lots et etages, colonne par colonne"""
+    lots: Dict[str, list] = field(default_factory=lambda: _colonnes(COLONNES_LOTS))
+    etages: Dict[str, list] = field(default_factory=lambda: _colonnes(COLONNES_ETAGES))
+
+    def etendre(self, autres: "Tables"):
+        """Ajoute les lignes d'autres tables (plusieurs titres fonciers)"""
+        for mes_colonnes, leurs_colonnes in ((self.lots, autres.lots), (self.etages, autres.etages)):
+            for nom, valeurs in leurs_colonnes.items():
+                mes_colonnes[nom].extend(valeurs)
+
+    def __len__(self) -> int:
+        return len(self.lots["titre_foncier"])
+
+
+def calculer_tables(data: ImportedData, calculs: Optional[Apercu] = None) -> Tables:
+    """Tables lots et etages d'un titre foncier, à partir des tableaux calculés"""
+    if calculs is None or calculs.quotation is None or calculs.tr_n is None or calculs.voix is None:
+        calculs = calculer_apercu(data, CALCULS_TABLES)
+
+    tables = Tables()
+    lots, etages = tables.lots, tables.etages
+    # Lignes des voix : parties privatives seules, dans l'ordre des lots
+    voix = iter([ligne for etage in calculs.voix.etages for ligne in etage.lignes])
+
+    for num_etage, (etage, quotation, tr_n) in enumerate(
+        zip(data.etages, calculs.quotation.etages, calculs.tr_n), start=1
+    ):
+        prives = 0
+        for lot, ligne in zip(etage.lots, quotation.lignes):
+            if lot.indice_privative:
+                prives += 1
+                ligne_voix = next(voix)
+                categorie = categorie_consistance(lot.consistance) or AUTRE
+                num_ordre, nvi = ligne_voix.num_ordre, ligne_voix.nvi
+            else:
+                categorie, num_ordre, nvi = COMMUNE, None, None
+            lots["titre_foncier"].append(data.titre_foncier)
+            lots["num_etage"].append(num_etage)
+            lots["etage"].append(etage.nom)
+            lots["propriete"].append(lot.propriete)
+            lots["titre_num"].append(lot.titre_num)
+            lots["indice_privative"].append(lot.indice_privative or None)
+            lots["indice_commune"].append(lot.indice_commune or None)
+            lots["consistance"].append(lot.consistance)
+            lots["categorie"].append(categorie)
+            lots["surface_interieure"].append(lot.surface_interieure)
+            lots["surface_avec_surplomb"].append(lot.surface_avec_surplomb)
+            lots["quot_part"].append(ligne.quot_part)
+            lots["indivision"].append(_entier(ligne.indivision))
+            lots["num_ordre"].append(num_ordre)
+            lots["nvi"].append(nvi)
+
+        etages["titre_foncier"].append(data.titre_foncier)
+        etages["num_etage"].append(num_etage)
+        etages["etage"].append(etage.nom)
+        etages["cotes"].append(etage.cotes)
+        etages["nb_lots"].append(len(etage.lots))
+        etages["nb_parties_privatives"].append(prives)
+        etages["total_surface_interieure"].append(etage.total_surface_interieure)
+        etages["total_surface_avec_surplomb"].append(etage.total_surface_avec_surplomb)
+        etages["total_quots_parts"].append(quotation.total_quots_parts)
+        etages["total_indivision"].append(_entier(quotation.total_indivision))
+        etages["surface_commerces"].append(_entier(tr_n.commerces))
+        etages["surface_appartements"].append(_entier(tr_n.appartements))
+
+    return tables
+
+
+def _schema_arrow(schema: Tuple[Tuple[str, str], ...]):
+    types = {
+        "texte": pyarrow.string(),
+        "entier": pyarrow.int64(),
+        "reel": pyarrow.float64(),
+        "decimal": pyarrow.decimal128(18, 2),
+    }
+    return pyarrow.schema([(nom, types[type]) for nom, type in schema])
+
+
+def ecrire_table(colonnes: Dict[str, list], schema: Tuple[Tuple[str, str], ...], format: str, sortie: BinaryIO):
+    """Écrit une table dans le format demandé"""
+    if format == "csv":
+        texte = TextIOWrapper(sortie, encoding="utf-8", newline="")
+        try:
+            writer = csv.writer(texte)
+            writer.writerow([nom for nom, _ in schema])
+            # None -> cellule vide ; Decimal et float gardent leur écriture exacte (point décimal)
+            writer.writerows(zip(*(colonnes[nom] for nom, _ in schema)))
+        finally:
+            texte.flush()
+            # Ne pas fermer la sortie avec le wrapper
+            texte.detach()
+        return
+
+    table = pyarrow.table(colonnes, schema=_schema_arrow(schema))
+    if format == "parquet":
+        pyarrow.parquet.write_table(table, sortie, compression="zstd")
+    else:
+        # Arrow IPC n'est pas compressé par défaut
+        options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        with pyarrow.ipc.new_file(sortie, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+def _entree(nom: str, compression: int) -> ZipInfo:
+    """Entrée d'archive à date fixe : mêmes tables, mêmes octets"""
+    entree = ZipInfo(nom, date_time=DATE_ZIP)
+    entree.external_attr = 0o644 << 16
+    entree.compress_type = compression
+    return entree
+
+
+def exporter_tables(tables: Tables, format: Optional[str] = None) -> BytesIO:
+    """Archive zip des tables lots et etages (lots.parquet, etages.parquet...)"""
+    format = resoudre_format(format)
+    extension, _ = FORMATS_TABLES[format]
+    buffer = BytesIO()
+    with ZipFile(buffer, "w") as archive:
+        for nom, colonnes in (("lots", tables.lots), ("etages", tables.etages)):
+            contenu = BytesIO()
+            ecrire_table(colonnes, SCHEMAS[nom], format, contenu)
+            # Parquet et Arrow sont déjà compressés (zstd)
+            compression = ZIP_DEFLATED if format == "csv" else ZIP_STORED
+            archive.writestr(_entree(f"{nom}{extension}", compression), contenu.getvalue())
+    buffer.seek(0)
+    return buffer
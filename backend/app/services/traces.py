@@ -0,0 +1,318 @@
+"""Traces par requête : spans des phases de traitement, exportés au format OTLP/JSON.
+
+Les métriques agrégées (ordonnanceur, caches) ne disent pas pourquoi une
+requête donnée a été lente. Chaque requête HTTP échantillonnée devient une
+trace : un span racine pour la requête, et un span par phase (lecture de
+l'upload, détection du dialecte, parsing, calcul des tableaux, rendu de
+chaque feuille, sérialisation, documents), avec le nombre d'étages et de
+lots en attributs. La phase ou la feuille qui domine se lit directement
+dans la trace.
+
+Export, à la fin de chaque trace, par un thread d'arrière-plan :
+  TRACES_FICHIER   fichier JSON lines, une requête ExportTraceServiceRequest
+                   par ligne (lisible par le récepteur otlpjsonfile du
+                   collecteur OpenTelemetry)
+  TRACES_OTLP_URL  collecteur local OTLP/HTTP JSON
+                   (ex. http://localhost:4318/v1/traces)
+
+TRACES_ECHANTILLONNAGE (0 à 1, 1 par défaut) fixe la part des requêtes
+tracées ; un en-tête W3C traceparent entrant impose sa décision et son
+identifiant de trace. Sans destination configurée, le traçage est inactif
+et `span()` ne coûte qu'une lecture de variable de contexte.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from app.models.models import ImportedData
+
+logger = logging.getLogger("uvicorn.error")
+
+FICHIER = os.getenv("TRACES_FICHIER")
+URL_COLLECTEUR = os.getenv("TRACES_OTLP_URL")
+ECHANTILLONNAGE = float(os.getenv("TRACES_ECHANTILLONNAGE", "1"))
+SERVICE = os.getenv("TRACES_SERVICE", "titre-foncier-api")
+ACTIF = bool(FICHIER or URL_COLLECTEUR)
+
+# Préfixe des attributs métier (nb_etages -> copro.nb_etages)
+PREFIXE_ATTRIBUTS = "copro."
+
+# Types de span OTLP
+SPAN_INTERNE = 1
+SPAN_SERVEUR = 2
+
+# Statut OTLP d'un span en erreur
+STATUT_ERREUR = 2
+
+TRACEPARENT = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Traces en attente d'export au-delà desquelles les suivantes sont abandonnées
+FILE_EXPORT_MAX = 1000
+
+
+class _Trace:
+    """Spans terminés d'une trace ; ils peuvent se terminer dans plusieurs threads"""
+
+    def __init__(self, trace_id: str):
+        self.id = trace_id
+        self.racine: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self._verrou = threading.Lock()
+
+    def terminer(self, span: "Span"):
+        with self._verrou:
+            self.spans.append(span)
+
+
+class Span:
+    __slots__ = ("trace", "id", "parent", "nom", "type", "debut", "fin", "attributs", "erreur")
+
+    def __init__(self, trace: _Trace, nom: str, parent: Optional[str], type: int = SPAN_INTERNE):
+        self.trace = trace
+        self.id = os.urandom(8).hex()
+        self.parent = parent
+        self.nom = nom
+        self.type = type
+        self.debut = time.time_ns()
+        self.fin = 0
+        self.attributs: Dict[str, Any] = {}
+        self.erreur: Optional[str] = None
+
+    def attribuer(self, **attributs):
+        for cle, valeur in attributs.items():
+            self.attributs[PREFIXE_ATTRIBUTS + cle] = valeur
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.id}-{self.id}-01"
+
+    def otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.id,
+            "spanId": self.id,
+            "name": self.nom,
+            "kind": self.type,
+            "startTimeUnixNano": str(self.debut),
+            "endTimeUnixNano": str(self.fin),
+            "attributes": [{"key": cle, "value": _valeur_otlp(valeur)} for cle, valeur in self.attributs.items()],
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent
+        if self.erreur is not None:
+            span["status"] = {"code": STATUT_ERREUR, "message": self.erreur}
+        return span
+
+
+def _valeur_otlp(valeur) -> Dict[str, Any]:
+    if isinstance(valeur, bool):
+        return {"boolValue": valeur}
+    if isinstance(valeur, int):
+        # int64 : chaîne en JSON OTLP
+        return {"intValue": str(valeur)}
+    if isinstance(valeur, float):
+        return {"doubleValue": valeur}
+    return {"stringValue": str(valeur)}
+
+
+_span_courant: ContextVar[Optional[Span]] = ContextVar("span_courant", default=None)
+
+
+def _terminer(span: Span, erreur: Optional[BaseException]):
+    span.fin = time.time_ns()
+    if isinstance(erreur, HTTPException):
+        span.erreur = f"{erreur.status_code} {erreur.detail}"
+    elif erreur is not None:
+        span.erreur = f"{type(erreur).__name__}: {erreur}"
+    span.trace.terminer(span)
+
+
+@contextmanager
+def span(nom: str, **attributs) -> Iterator[Optional[Span]]:
+    """Span enfant du span courant ; sans trace en cours (inactif, non échantillonné), ne fait rien"""
+    parent = _span_courant.get()
+    if parent is None:
+        yield None
+        return
+    courant = Span(parent.trace, nom, parent.id)
+    courant.attribuer(**attributs)
+    jeton = _span_courant.set(courant)
+    try:
+        yield courant
+    except BaseException as e:
+        _terminer(courant, e)
+        raise
+    else:
+        _terminer(courant, None)
+    finally:
+        _span_courant.reset(jeton)
+
+
+def attribuer(**attributs):
+    """Ajoute des attributs au span courant, s'il y en a un"""
+    courant = _span_courant.get()
+    if courant is not None:
+        courant.attribuer(**attributs)
+
+
+def attribuer_donnees(data: ImportedData):
+    """Nombre d'étages et de lots en attributs du span courant et du span racine de la requête"""
+    courant = _span_courant.get()
+    if courant is None:
+        return
+    mesures = {"nb_etages": len(data.etages), "nb_lots": sum(len(etage.lots) for etage in data.etages)}
+    courant.attribuer(**mesures)
+    if courant.trace.racine is not None:
+        courant.trace.racine.attribuer(**mesures)
+
+
+def _echantillonner(traceparent: Optional[str]):
+    """(identifiant de trace, span parent distant) si la requête est tracée, sinon None"""
+    if traceparent:
+        m = TRACEPARENT.match(traceparent.strip().lower())
+        if m:
+            if not int(m.group(3), 16) & 1:
+                return None
+            return m.group(1), m.group(2)
+    if random.random() >= ECHANTILLONNAGE:
+        return None
+    return os.urandom(16).hex(), None
+
+
+@contextmanager
+def trace(nom: str, traceparent: Optional[str] = None, **attributs) -> Iterator[Optional[Span]]:
+    """Span racine d'une requête, exporté avec ses enfants à sa fin ; None si la requête n'est pas tracée"""
+    decision = _echantillonner(traceparent) if ACTIF else None
+    if decision is None:
+        yield None
+        return
+    trace_id, parent = decision
+    racine = Span(_Trace(trace_id), nom, parent, SPAN_SERVEUR)
+    racine.trace.racine = racine
+    racine.attributs.update(attributs)
+    jeton = _span_courant.set(racine)
+    try:
+        yield racine
+    except BaseException as e:
+        _terminer(racine, e)
+        raise
+    else:
+        _terminer(racine, None)
+    finally:
+        _span_courant.reset(jeton)
+        exportateur.exporter(racine.trace)
+
+
+def requete_otlp(traces: List[_Trace]) -> Dict[str, Any]:
+    """Corps ExportTraceServiceRequest (OTLP/JSON)"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [span.otlp() for t in traces for span in t.spans],
+            }],
+        }]
+    }
+
+
+class Exportateur:
+    """Exporte les traces terminées depuis un thread d'arrière-plan, par lots.
+
+    Le thread est (re)démarré à la première trace de chaque processus : il ne
+    survit pas au fork des workers d'app.serveur.
+    """
+
+    def __init__(self, fichier: Optional[str], url: Optional[str]):
+        self.fichier = fichier
+        self.url = url
+        self._file: "queue.Queue[_Trace]" = queue.Queue(FILE_EXPORT_MAX)
+        self._pid: Optional[int] = None
+        self._verrou = threading.Lock()
+        self.abandonnees = 0
+
+    def exporter(self, trace: _Trace):
+        if self._pid != os.getpid():
+            self._demarrer()
+        try:
+            self._file.put_nowait(trace)
+        except queue.Full:
+            self.abandonnees += 1
+
+    def _demarrer(self):
+        with self._verrou:
+            if self._pid == os.getpid():
+                return
+            self._file = queue.Queue(FILE_EXPORT_MAX)
+            threading.Thread(target=self._boucle, name="export-traces", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _boucle(self):
+        file = self._file
+        while True:
+            traces = [file.get()]
+            while True:
+                try:
+                    traces.append(file.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.envoyer(traces)
+            except Exception:
+                logger.warning("Export des traces impossible", exc_info=True)
+
+    def envoyer(self, traces: List[_Trace]):
+        corps = json.dumps(requete_otlp(traces), separators=(",", ":"))
+        if self.fichier:
+            with open(self.fichier, "a", encoding="utf-8") as fichier:
+                fichier.write(corps + "\n")
+        if self.url:
+            requete = urllib.request.Request(
+                self.url, data=corps.encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(requete, timeout=5) as reponse:
+                reponse.read()
+
+
+exportateur = Exportateur(FICHIER, URL_COLLECTEUR)
+
+
+class MiddlewareTraces:
+    """Middleware ASGI : une trace par requête HTTP échantillonnée, renvoyée dans l'en-tête traceparent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        en_tetes = dict(scope["headers"])
+        traceparent = en_tetes.get(b"traceparent", b"").decode("latin-1") or None
+        with trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent,
+            **{"http.request.method": scope["method"], "url.path": scope["path"]},
+        ) as racine:
+            if racine is None:
+                return await self.app(scope, receive, send)
+
+            async def envoyer(message):
+                if message["type"] == "http.response.start":
+                    racine.attributs["http.response.status_code"] = message["status"]
+                    if message["status"] >= 500:
+                        racine.erreur = f"{message['status']}"
+                    message["headers"] = [*message.get("headers", []), (b"traceparent", racine.traceparent.encode())]
+                await send(message)
+
+            await self.app(scope, receive, envoyer)
@@ -0,0 +1,181 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.models.models import AnomalieValidation, ImportedData, Lot, RapportValidation
+from app.services.calculs import ECHELLE, depasse_centieme, en_centiemes, somme_surfaces
+
+# Écart toléré entre le total déclaré d'un étage et la somme de ses lots (m²)
+TOLERANCE_TOTAL = 0.005
+
+
+class Validateur:
+    """Contrôles du fichier TB effectués pendant le parsing, en une seule passe.
+
+    L'automate étages / lots de CSVParser._parse_rows appelle les méthodes
+    ci-dessous au fil des lignes ; les anomalies sont collectées avec leur
+    numéro de ligne au lieu d'échouer plus tard dans la génération.
+    """
+
+    def __init__(self, parse_float: Callable[[str], Optional[float]]):
+        self._parse_float = parse_float
+        self.erreurs: List[AnomalieValidation] = []
+        self.avertissements: List[AnomalieValidation] = []
+
+        self._titre_trouve = False
+        self._entete_trouvee = False
+        self._indices_privatifs: Dict[str, int] = {}
+        self._indices_communs_etage: Dict[str, int] = {}
+        self._etage: Optional[str] = None
+        self._ligne_etage: Optional[int] = None
+        self._total_trouve = False
+
+    def erreur(self, ligne: Optional[int], code: str, message: str, colonne: Optional[int] = None):
+        self.erreurs.append(AnomalieValidation(ligne=ligne, colonne=colonne, code=code, message=message))
+
+    def avertissement(self, ligne: Optional[int], code: str, message: str, colonne: Optional[int] = None):
+        self.avertissements.append(AnomalieValidation(ligne=ligne, colonne=colonne, code=code, message=message))
+
+    def titre(self, ligne: int, titre_foncier: str):
+        self._titre_trouve = True
+        if not titre_foncier:
+            self.erreur(ligne, "titre_foncier_vide", "Le numéro du titre foncier est vide")
+
+    def entete(self, ligne: int):
+        self._entete_trouvee = True
+
+    def debut_etage(self, ligne: int, nom: str, lots_precedents: List[Lot]):
+        self.fin_etage(lots_precedents)
+        self._etage = nom
+        self._ligne_etage = ligne
+        self._total_trouve = False
+        self._indices_communs_etage = {}
+
+    def fin_etage(self, lots: List[Lot]):
+        """Clôture l'étage en cours (nouvel étage, ligne Total ou fin de fichier)"""
+        if self._etage is None:
+            return
+        if not lots:
+            self.avertissement(
+                self._ligne_etage, "etage_vide", f"L'étage « {self._etage} » ne contient aucun lot et sera ignoré"
+            )
+        elif not self._total_trouve:
+            self.avertissement(
+                self._ligne_etage, "total_absent", f"L'étage « {self._etage} » n'a pas de ligne Total"
+            )
+        self._etage = None
+
+    def lot(self, ligne: int, row: List[str], lot: Optional[Lot], invalides: Sequence[Tuple[int, str]] = ()):
+        """Contrôle une ligne de lot (surface intérieure renseignée).
+
+        `invalides` : (colonne, contenu) des surfaces illisibles de la ligne,
+        relevées à la conversion des colonnes (nombres.convertir_colonne)."""
+        if lot is None:
+            self._lot_rejete(ligne, row, invalides)
+            return
+
+        if lot.indice_privative:
+            precedente = self._indices_privatifs.get(lot.indice_privative)
+            if precedente is not None:
+                self.erreur(
+                    ligne, "indice_duplique",
+                    f"L'indice privatif {lot.indice_privative} est déjà utilisé ligne {precedente}",
+                )
+            else:
+                self._indices_privatifs[lot.indice_privative] = ligne
+
+        if lot.indice_commune:
+            precedente = self._indices_communs_etage.get(lot.indice_commune)
+            if precedente is not None:
+                self.avertissement(
+                    ligne, "indice_duplique",
+                    f"L'indice commun {lot.indice_commune} apparaît deux fois dans l'étage (ligne {precedente})",
+                )
+            else:
+                self._indices_communs_etage[lot.indice_commune] = ligne
+
+        for colonne, surface in ((6, lot.surface_interieure), (7, lot.surface_avec_surplomb)):
+            if depasse_centieme(surface):
+                self.avertissement(
+                    ligne, "surface_arrondie",
+                    f"Surface {surface:g} arrondie au centième ({en_centiemes(surface) / ECHELLE:g}) pour les calculs",
+                    colonne=colonne,
+                )
+
+        if lot.surface_avec_surplomb < lot.surface_interieure:
+            self.avertissement(
+                ligne, "surplomb_inferieur",
+                f"La surface avec surplomb ({lot.surface_avec_surplomb}) est inférieure à la surface intérieure ({lot.surface_interieure})",
+            )
+
+    def _lot_rejete(self, ligne: int, row: List[str], invalides: Sequence[Tuple[int, str]]):
+        indices = [cell.strip() for cell in row[3:5] if cell.strip()]
+        if not indices:
+            self.avertissement(ligne, "indice_manquant", "Ligne ignorée : aucun indice privatif ni commun")
+            return
+        # Surface illisible, sinon surface vide
+        if invalides:
+            colonne, valeur = invalides[0]
+        elif not row[5].strip():
+            colonne, valeur = 6, row[5]
+        elif len(row) > 6 and not row[6].strip():
+            colonne, valeur = 7, row[6]
+        else:
+            self.erreur(ligne, "lot_invalide", "Ligne de lot invalide")
+            return
+        if colonne == 6:
+            self.erreur(ligne, "surface_invalide", f"Surface intérieure invalide : « {valeur.strip()} »", colonne=6)
+        else:
+            self.erreur(
+                ligne, "surface_invalide",
+                f"Surface avec surplomb manquante ou invalide : « {valeur.strip()} »", colonne=7,
+            )
+
+    def ligne_sans_surface(self, ligne: int, row: List[str]):
+        """Ligne non vide d'un étage qui n'est ni un lot, ni un Total"""
+        if any(cell.strip() for cell in row[3:5]):
+            self.erreur(ligne, "surface_manquante", "Surface intérieure manquante pour un lot indicé")
+
+    def ligne_hors_etage(self, ligne: int, row: List[str]):
+        if len(row) > 5 and any(cell.strip() for cell in row[3:6]):
+            self.avertissement(ligne, "ligne_hors_etage", "Ligne de lot hors étage (après une ligne Total) ignorée")
+
+    def total(self, ligne: int, row: List[str], lots: List[Lot]):
+        """Compare les totaux déclarés de l'étage à la somme des lots"""
+        self._total_trouve = True
+        for index, nom, calcule in (
+            (5, "intérieure", somme_surfaces(lot.surface_interieure for lot in lots)),
+            (6, "avec surplomb", somme_surfaces(lot.surface_avec_surplomb for lot in lots)),
+        ):
+            declare = self._parse_float(row[index]) if len(row) > index else None
+            # Total absent ou formule non calculée : rien à comparer
+            if declare is None:
+                continue
+            if abs(declare - calcule) > TOLERANCE_TOTAL:
+                self.erreur(
+                    ligne, "total_incoherent",
+                    f"Total surface {nom} de « {self._etage} » : {declare} déclaré, {calcule:g} calculé",
+                    colonne=index + 1,
+                )
+        self.fin_etage(lots)
+
+    def rapport(self, data: ImportedData) -> RapportValidation:
+        """Contrôles globaux puis construction du rapport"""
+        if not self._titre_trouve:
+            self.erreur(None, "titre_foncier_absent", "Ligne « Titre foncier » introuvable")
+        if not self._entete_trouvee:
+            self.erreur(None, "entete_absente", "En-tête « Propriété dite » introuvable")
+
+        if not data.etages:
+            self.erreur(None, "aucun_etage", "Aucun étage avec des lots n'a été trouvé")
+        else:
+            lots_prives = [lot for etage in data.etages for lot in etage.lots if lot.indice_privative]
+            if not lots_prives:
+                self.erreur(None, "aucune_partie_privative", "Aucun lot ne possède d'indice privatif")
+            elif somme_surfaces(lot.surface_avec_surplomb for lot in lots_prives) <= 0:
+                # Somme au centième, comme les calculs : des surfaces toutes sous 0,005 m² donnent 0
+                self.erreur(None, "surface_totale_nulle", "La surface totale des parties privatives est nulle")
+
+        return RapportValidation(
+            valide=not self.erreurs,
+            erreurs=self.erreurs,
+            avertissements=self.avertissements,
+        )
@@ -0,0 +1,278 @@
+import os
+import re
+from html import unescape
+from datetime import datetime
+from io import BytesIO
+from typing import Optional
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from fastapi import HTTPException
+# API internes d'openpyxl (écriture des cellules et des feuilles) : version figée dans requirements.txt
+from openpyxl import Workbook
+from openpyxl.cell._writer import write_cell
+from openpyxl.comments.comment_sheet import CommentRecord
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.packaging.relationship import Relationship, RelationshipList
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.xml.constants import ARC_SHARED_STRINGS, ARC_WORKBOOK_RELS, SHARED_STRINGS, SHEET_MAIN_NS
+from openpyxl.xml.functions import Element, SubElement, fromstring, tostring, whitespace, xmlfile
+
+from app.services.rendu_parallele import blocs_en_attente
+
+# Profils de compression du zip XLSX : (méthode, niveau deflate)
+#   fast    : téléchargements interactifs, moins de CPU pour un fichier un peu plus gros
+#   default : réglage par défaut d'openpyxl / zlib
+#   small   : archivage, compression maximale
+PROFILS_COMPRESSION = {
+    "fast": (ZIP_DEFLATED, 1),
+    "default": (ZIP_DEFLATED, 6),
+    "small": (ZIP_DEFLATED, 9),
+    "stored": (ZIP_STORED, None),
+}
+
+# Profil par défaut du serveur
+PROFIL_PAR_DEFAUT = os.getenv("XLSX_COMPRESSION_PROFILE", "default")
+
+# Dates fixes du mode déterministe : entrées du zip (plus petite date DOS) et propriétés du document
+DATE_ZIP = (1980, 1, 1, 0, 0, 0)
+DATE_PROPRIETES = datetime(1980, 1, 1)
+
+
+def resoudre_profil(profil: Optional[str]) -> str:
+    """Retourne le profil demandé, ou celui du serveur, en vérifiant qu'il existe"""
+    profil = profil or PROFIL_PAR_DEFAUT
+    if profil not in PROFILS_COMPRESSION:
+        raise HTTPException(
+            400, f"Profil de compression inconnu : {profil} (attendu : {', '.join(PROFILS_COMPRESSION)})"
+        )
+    return profil
+
+
+DIMENSION = re.compile(r'<dimension ref="([A-Z]+[0-9]+)(?::([A-Z]+)([0-9]+))?"')
+LIGNE = re.compile(r'<row r="([0-9]+)"')
+
+
+def _inserer_blocs(xml: str, blocs) -> str:
+    """Insère les lignes des blocs rendus en parallèle dans <sheetData>, à leur place"""
+    debut = xml.index("<sheetData")
+    if xml.startswith("<sheetData/>", debut):
+        xml = xml[:debut] + "<sheetData></sheetData>" + xml[debut + len("<sheetData/>"):]
+    fin = xml.index("</sheetData>", debut)
+
+    # Les lignes écrites par openpyxl (en-têtes, totaux) encadrent les blocs
+    morceaux = []
+    position = xml.index(">", debut) + 1
+    for bloc in blocs:
+        suivante = next((m for m in LIGNE.finditer(xml, position, fin) if int(m.group(1)) > bloc.fin), None)
+        coupure = suivante.start() if suivante else fin
+        morceaux += [xml[position:coupure], bloc.xml]
+        position = coupure
+    xml = xml[:xml.index(">", debut) + 1] + "".join(morceaux) + xml[position:]
+
+    derniere = max(bloc.fin for bloc in blocs)
+
+    def dimension(m):
+        if m.group(2) is None or int(m.group(3)) >= derniere:
+            return m.group(0)
+        return f'<dimension ref="{m.group(1)}:{m.group(2)}{derniere}"'
+
+    return DIMENSION.sub(dimension, xml, count=1)
+
+
+# Cellule texte écrite en ligne par openpyxl (blocs rendus en parallèle)
+CHAINE_EN_LIGNE = re.compile(
+    r'<c r="([A-Z]+[0-9]+)"((?: s="[0-9]+")?) t="inlineStr"><is><t(?: xml:space="preserve")?>(.*?)</t></is></c>',
+    re.S,
+)
+
+
+class TableChaines:
+    """Table des chaînes partagées d'un classeur : une entrée par valeur distincte"""
+
+    def __init__(self):
+        self._chaines = IndexedList()
+        self.references = 0
+
+    def __len__(self) -> int:
+        return len(self._chaines)
+
+    def indice(self, chaine: str) -> int:
+        self.references += 1
+        return self._chaines.add(chaine)
+
+    def xml(self) -> bytes:
+        out = BytesIO()
+        with xmlfile(out) as xf:
+            with xf.element("sst", xmlns=SHEET_MAIN_NS, count=f"{self.references}", uniqueCount=f"{len(self)}"):
+                for chaine in self._chaines:
+                    si = Element("si")
+                    texte = SubElement(si, "t")
+                    texte.text = chaine
+                    whitespace(texte)
+                    xf.write(si)
+        return out.getvalue()
+
+
+class _WorksheetWriterChaines(WorksheetWriter):
+    """WorksheetWriter qui écrit les cellules texte en référence à la table des chaînes partagées"""
+
+    def __init__(self, ws, chaines: TableChaines):
+        super().__init__(ws)
+        self.chaines = chaines
+
+    def write_row(self, xf, row, row_idx):
+        attrs = {"r": f"{row_idx}"}
+        attrs.update(self.ws.row_dimensions.get(row_idx, {}))
+
+        # Écriture directe dans le flux de et_xmlfile (sans lxml) ; lxml passe par Element
+        ecrire = getattr(xf, "_file", None)
+        with xf.element("row", attrs):
+            for cell in row:
+                if cell._comment is not None:
+                    self.ws._comments.append(CommentRecord.from_cell(cell))
+                if cell._value is None and not cell.has_style and not cell._comment:
+                    continue
+                if cell.data_type != "s" or type(cell._value) is not str or not cell._value:
+                    write_cell(xf, self.ws, cell, cell.has_style)
+                    continue
+
+                if cell.hyperlink:
+                    # Relevé par write_cell dans le cas général : la feuille écrit ensuite ses liens
+                    self.ws._hyperlinks.append(cell.hyperlink)
+                indice = f"{self.chaines.indice(cell._value)}"
+                if ecrire is not None:
+                    # Balise de forme fixe, sans caractère à échapper : écrite telle quelle
+                    style = f' s="{cell.style_id}"' if cell.has_style else ""
+                    ecrire(f'<c r="{cell.coordinate}"{style} t="s"><v>{indice}</v></c>')
+                    continue
+                attributs = {"r": cell.coordinate}
+                if cell.has_style:
+                    attributs["s"] = f"{cell.style_id}"
+                attributs["t"] = "s"
+                el = Element("c", attributs)
+                SubElement(el, "v").text = indice
+                xf.write(el)
+
+
+class _ArchiveCopro:
+    """Archive zip du classeur.
+
+    Ajoute la relation vers la table des chaînes aux relations du classeur
+    et, en mode déterministe, écrit chaque partie avec une date et des
+    attributs fixes : le même classeur donne toujours les mêmes octets.
+    """
+
+    def __init__(self, archive: ZipFile, chaines: Optional[TableChaines], deterministe: bool):
+        self._archive = archive
+        self._chaines = chaines
+        self._deterministe = deterministe
+
+    def __getattr__(self, nom):
+        return getattr(self._archive, nom)
+
+    def write(self, filename, arcname=None, *args, **kwargs):
+        if not self._deterministe:
+            return self._archive.write(filename, arcname, *args, **kwargs)
+        # La date du fichier temporaire de la feuille ne doit pas entrer dans l'archive
+        with open(filename, "rb") as fichier:
+            self.writestr(arcname or os.path.basename(filename), fichier.read())
+
+    def writestr(self, nom, donnees, *args, **kwargs):
+        if nom == ARC_WORKBOOK_RELS and self._chaines is not None and len(self._chaines):
+            relations = RelationshipList.from_tree(fromstring(donnees))
+            relations.append(Relationship(type="sharedStrings", Target="sharedStrings.xml"))
+            donnees = tostring(relations.to_tree())
+        if self._deterministe and isinstance(nom, str):
+            nom = ZipInfo(nom, date_time=DATE_ZIP)
+            nom.create_system = 3
+            nom.external_attr = 0o644 << 16
+            nom.compress_type = self._archive.compression
+            kwargs.setdefault("compresslevel", self._archive.compresslevel)
+        return self._archive.writestr(nom, donnees, *args, **kwargs)
+
+
+class _PartieChaines:
+    """Entrée du manifeste ([Content_Types].xml) de la table des chaînes"""
+    path = "/" + ARC_SHARED_STRINGS
+    mime_type = SHARED_STRINGS
+
+
+class _ExcelWriterCopro(ExcelWriter):
+    """ExcelWriter qui partage les chaînes entre cellules et feuilles, et insère dans chaque
+    feuille les blocs d'étages rendus en parallèle"""
+
+    def __init__(self, workbook: Workbook, archive: ZipFile, chaines_partagees: bool = True, deterministe: bool = True):
+        self.chaines = TableChaines() if chaines_partagees else None
+        super().__init__(workbook, _ArchiveCopro(archive, self.chaines, deterministe))
+
+    def _chaine_partagee(self, m) -> str:
+        indice = self.chaines.indice(unescape(m.group(3)))
+        return f'<c r="{m.group(1)}"{m.group(2)} t="s"><v>{indice}</v></c>'
+
+    def write_worksheet(self, ws):
+        blocs = blocs_en_attente(ws)
+        if not blocs and self.chaines is None:
+            return super().write_worksheet(ws)
+
+        ws._drawing = SpreadsheetDrawing()
+        ws._drawing.charts = ws._charts
+        ws._drawing.images = ws._images
+
+        writer = _WorksheetWriterChaines(ws, self.chaines) if self.chaines is not None else WorksheetWriter(ws)
+        writer.write()
+        if blocs:
+            if self.chaines is not None:
+                for bloc in blocs:
+                    bloc.xml = CHAINE_EN_LIGNE.sub(self._chaine_partagee, bloc.xml)
+            with open(writer.out, encoding="utf-8") as fichier:
+                xml = fichier.read()
+            with open(writer.out, "w", encoding="utf-8") as fichier:
+                fichier.write(_inserer_blocs(xml, blocs))
+
+        ws._rels = writer._rels
+        self._archive.write(writer.out, ws.path[1:])
+        self.manifest.append(ws)
+        writer.cleanup()
+
+    def _write_worksheets(self):
+        super()._write_worksheets()
+        if self.chaines is not None and len(self.chaines):
+            self._archive.writestr(ARC_SHARED_STRINGS, self.chaines.xml())
+            self.manifest.append(_PartieChaines())
+
+
+def save_workbook(
+    wb: Workbook,
+    profil: Optional[str] = None,
+    chaines_partagees: bool = True,
+    deterministe: bool = True,
+) -> BytesIO:
+    """Sérialise le classeur avec le profil de compression choisi.
+
+    Les textes sont écrits une fois dans la table des chaînes partagées
+    (xl/sharedStrings.xml) ; `chaines_partagees=False` garde l'écriture en
+    ligne d'openpyxl.
+
+    En mode déterministe (par défaut), les dates des propriétés du document
+    et des entrées du zip sont fixes, et les parties sont écrites dans un
+    ordre stable : deux générations des mêmes données donnent les mêmes
+    octets (ETag, déduplication). `deterministe=False` garde les dates
+    réelles.
+    """
+    compression, compresslevel = PROFILS_COMPRESSION[resoudre_profil(profil)]
+    if deterministe:
+        wb.properties.created = wb.properties.modified = DATE_PROPRIETES
+
+    buffer = BytesIO()
+    archive = ZipFile(buffer, "w", compression=compression, compresslevel=compresslevel, allowZip64=True)
+    try:
+        _ExcelWriterCopro(wb, archive, chaines_partagees, deterministe).save()
+    except BaseException:
+        # Sérialisation interrompue (pool de rendu cassé) : l'archive incomplète est abandonnée
+        archive.close()
+        raise
+    buffer.seek(0)
+
+    return buffer
@@ -0,0 +1,15 @@
+"""Fixtures communes : chaque test a son propre cache disque, sous tmp_path"""
+import pytest
+
+from app.api import routes
+from app.services import disk_cache, speculation
+from app.services.disk_cache import CacheDisque
+
+
+@pytest.fixture(autouse=True)
+def cache_disque(tmp_path, monkeypatch):
+    """Les tests n'écrivent jamais dans le cache disque de l'utilisateur (CACHE_DISQUE_DIR)"""
+    cache_disque = CacheDisque(tmp_path / "cache", 10 * 1024 * 1024)
+    for module in (disk_cache, routes, speculation):
+        monkeypatch.setattr(module, "cache_disque", cache_disque)
+    return cache_disque
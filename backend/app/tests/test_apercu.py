@@ -0,0 +1,61 @@
+"""/api/apercu : tableaux calculés en JSON, identiques à calculer_apercu sur les mêmes données"""
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+from app.api.routes import TEMPLATE_PATH
+from app.main import app
+from app.services.calculs import calculer_apercu
+from app.services.csv_parser import CSVParser
+from app.services.dialect import detecter_dialecte_prefixe
+from app.utils.synthetic import generer_csv
+
+# Corpus des classeurs de référence (test_golden) : fichier réel anonymisé, virgule décimale, centièmes
+CORPUS_DIR = Path(__file__).with_name("golden") / "corpus"
+
+FICHIERS = [
+    ("tb_modele.xlsx", TEMPLATE_PATH.read_bytes()),
+    ("synthetique_6x5.csv", generer_csv(6, 5).encode("utf-8")),
+] + [(source.name, source.read_bytes()) for source in sorted(CORPUS_DIR.glob("*.csv"))]
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+def _attendu(nom: str, contenu: bytes, fichiers):
+    parser = CSVParser()
+    if nom.endswith(".csv"):
+        # Dialecte détecté comme à l'upload (séparateur, encodage du corpus)
+        parser.apply_dialect(detecter_dialecte_prefixe(contenu[:64 * 1024]))
+    data = parser.parse_upload(UploadFile(file=BytesIO(contenu), filename=nom))
+    return calculer_apercu(data, fichiers).model_dump(mode="json")
+
+
+@pytest.mark.parametrize("nom, contenu", FICHIERS, ids=[nom for nom, _ in FICHIERS])
+def test_tous_les_tableaux(client, nom, contenu):
+    reponse = client.post("/api/apercu", files={"file": (nom, contenu)})
+    assert reponse.status_code == 200
+    apercu = reponse.json()
+    assert apercu == _attendu(nom, contenu, CSVParser.excel_key)
+    assert all(apercu[tableau] is not None for tableau in ("quotation", "tr_n", "tr_c", "ta", "voix"))
+
+
+def test_tableaux_demandes_seulement(client):
+    nom, contenu = FICHIERS[1]
+    reponse = client.post(
+        "/api/apercu", files={"file": (nom, contenu)}, data={"fichiersAGenerer": ["Voix", "TR-C"]}
+    )
+    assert reponse.status_code == 200
+    apercu = reponse.json()
+    assert apercu == _attendu(nom, contenu, ["Voix", "TR-C"])
+    assert apercu["quotation"] is None and apercu["ta"] is None and apercu["tr_n"] is None
+    assert apercu["voix"] is not None and apercu["tr_c"] is not None
+
+
+def test_sans_fichier(client):
+    assert client.post("/api/apercu").status_code == 422
@@ -0,0 +1,106 @@
+"""Cache disque : clés versionnées (rendu, parsing), invalidées par un changement de version ; lecture et éviction"""
+import csv
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from app.services import cache, disk_cache
+from app.services.cache import cle_classeur, nom_cle
+from app.services.csv_parser import CSVParser
+from app.services.disk_cache import CacheDisque
+from app.utils.synthetic import generer_csv
+
+
+@pytest.fixture(scope="module")
+def data():
+    return CSVParser()._parse_rows(csv.reader(StringIO(generer_csv(3, 4)), delimiter=";"))
+
+
+def test_classeur_invalide_par_version_du_rendu(cache_disque, monkeypatch):
+    cle = cle_classeur("empreinte", ["Voix"], None)
+    cache_disque.ajouter(nom_cle(cle), b"classeur", ".xlsx")
+    assert cache_disque.lire(nom_cle(cle)) == b"classeur"
+
+    monkeypatch.setattr(cache, "VERSION_RENDU", "version-suivante")
+    assert cache_disque.lire(nom_cle(cle)) is None
+
+
+def test_donnees_invalidees_par_version_du_parseur(cache_disque, data, monkeypatch):
+    cache_disque.ajouter_donnees("upload", data)
+    assert cache_disque.donnees("upload") == data
+
+    monkeypatch.setattr(cache, "VERSION_PARSEUR", "version-suivante")
+    assert cache_disque.donnees("upload") is None
+
+
+def test_contenu_lisible_malgre_une_eviction_concurrente(tmp_path):
+    cache_disque = CacheDisque(tmp_path, 15)
+    cache_disque.ajouter("a", b"classeur a", ".xlsx")
+    assert cache_disque.contient("a")
+
+    fichier = cache_disque.ouvrir("a")
+    # Écriture concurrente pendant l'envoi : "a", le moins récent, est évincé
+    cache_disque.ajouter("b", b"classeur b", ".xlsx")
+    assert not cache_disque.contient("a")
+    with fichier:
+        assert fichier.read() == b"classeur a"
+    assert cache_disque.lire("a") is None
+
+
+def test_entree_obsolete_sans_fichier(cache_disque):
+    cache_disque.ajouter("a", b"classeur", ".xlsx")
+    for fichier in cache_disque.objets.rglob("*.xlsx"):
+        fichier.unlink()
+    assert cache_disque.lire("a") is None
+    assert not cache_disque.contient("a")
+
+
+def test_repertoire_cree_au_premier_acces(tmp_path):
+    cache_disque = CacheDisque(tmp_path / "cache", 1024)
+    assert not cache_disque.repertoire.exists()
+    assert cache_disque.lire("a") is None
+    assert (cache_disque.repertoire / "index.sqlite3").exists()
+
+
+def test_repertoire_par_defaut_hors_des_sources(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert disk_cache._repertoire_par_defaut() == tmp_path / "titre-foncier-api"
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    assert disk_cache._repertoire_par_defaut().is_relative_to(Path.home())
+
+
+def test_cache_indisponible_desactive(tmp_path):
+    fichier = tmp_path / "fichier"
+    fichier.write_bytes(b"")
+    # Répertoire impossible à créer : le cache se désactive au lieu d'échouer
+    cache_disque = CacheDisque(fichier / "cache", 1024)
+    assert cache_disque.ajouter("a", b"classeur", ".xlsx") is None
+    assert cache_disque.lire("a") is None
+    assert not cache_disque.contient("a")
+    assert cache_disque.indisponible
+
+
+def test_apres_fork_rouvre_l_index(cache_disque):
+    cache_disque.ajouter("a", b"classeur", ".xlsx")
+    herite = cache_disque._db
+    cache_disque.apres_fork()
+    assert cache_disque._db is None
+    assert cache_disque.lire("a") == b"classeur"
+    assert cache_disque._db is not None and cache_disque._db is not herite
+
+
+def test_remplacement_libere_l_ancien_contenu(cache_disque):
+    cache_disque.ajouter("a", b"ancien rendu", ".xlsx")
+    cache_disque.ajouter("b", b"rendu commun", ".xlsx")
+    cache_disque.ajouter("c", b"rendu commun", ".xlsx")
+
+    cache_disque.ajouter("a", b"nouveau", ".xlsx")
+    assert cache_disque.lire("a") == b"nouveau"
+    assert sorted(f.read_bytes() for f in cache_disque.objets.rglob("*.xlsx")) == [b"nouveau", b"rendu commun"]
+    assert cache_disque._taille == cache_disque._taille_totale() == len(b"nouveau") + len(b"rendu commun")
+
+    # Contenu encore référencé par "c" : conservé
+    cache_disque.ajouter("b", b"autre", ".xlsx")
+    assert cache_disque.lire("c") == b"rendu commun"
+    assert cache_disque._taille == cache_disque._taille_totale()
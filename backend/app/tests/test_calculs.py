@@ -0,0 +1,158 @@
+"""Calculs en centièmes de m² entiers : équivalence avec les formules en Decimal (ROUND_HALF_UP)
+
+La référence reprend les formules de calcul en Decimal sur les surfaces
+flottantes ; sur des surfaces saisies au centième, les résultats arrondis
+doivent être identiques, sauf aux cas d'égalité que l'erreur des flottants
+faisait basculer, où l'arrondi entier est exact.
+"""
+import csv
+import random
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from typing import List, Tuple
+
+import pytest
+
+from app.models.models import Floor, ImportedData, Lot
+from app.services.calculs import calculer_quotation, calculer_tr_c, calculer_voix, depasse_centieme, somme_surfaces
+from app.services.csv_parser import CSVParser
+from app.services.nombres import nombre
+from app.services.validation import Validateur
+from app.utils.synthetic import generer_csv
+
+CENTIEME = Decimal("0.01")
+UNITE = Decimal("1")
+
+
+def quotation_decimal(data: ImportedData) -> List[Tuple[Decimal, Decimal]]:
+    """Quote-part et indivision de chaque lot privatif, en Decimal sur les surfaces flottantes"""
+    total = sum(lot.surface_avec_surplomb for etage in data.etages for lot in etage.lots if lot.indice_privative)
+    resultats = []
+    for etage in data.etages:
+        for lot in etage.lots:
+            if lot.indice_privative:
+                quot = Decimal(lot.surface_avec_surplomb) * Decimal(etage.total_surface_interieure) / Decimal(total)
+                indivision = Decimal(lot.surface_avec_surplomb) * Decimal(10000) / Decimal(total)
+                resultats.append((
+                    quot.quantize(CENTIEME, rounding=ROUND_HALF_UP),
+                    indivision.quantize(UNITE, rounding=ROUND_HALF_UP),
+                ))
+    return resultats
+
+
+def voix_decimal(data: ImportedData) -> List[Decimal]:
+    """NVi de chaque lot privatif, en Decimal sur les surfaces flottantes"""
+    lots = [lot for etage in data.etages for lot in etage.lots if lot.indice_privative]
+    total = sum(lot.surface_avec_surplomb for lot in lots)
+    return [
+        (Decimal(lot.surface_avec_surplomb) / Decimal(total) * Decimal(100)).quantize(CENTIEME, rounding=ROUND_HALF_UP)
+        for lot in lots
+    ]
+
+
+def immeuble(nb_etages: int, lots_par_etage: int, seed: int, centiemes: bool) -> ImportedData:
+    """Immeuble synthétique ; surfaces au centième de m² si `centiemes`"""
+    rows = csv.reader(StringIO(generer_csv(nb_etages, lots_par_etage, seed=seed)), delimiter=";")
+    data = CSVParser()._parse_rows(rows)
+    if centiemes:
+        rng = random.Random(seed)
+        for etage in data.etages:
+            for lot in etage.lots:
+                lot.surface_interieure = round(lot.surface_interieure + rng.randint(0, 99) / 100, 2)
+                lot.surface_avec_surplomb = round(lot.surface_avec_surplomb + rng.randint(0, 99) / 100, 2)
+            etage.total_surface_interieure = somme_surfaces(lot.surface_interieure for lot in etage.lots)
+    return data
+
+
+def _lot(indice_privative: str, indice_commune: str, surface: float, consistance: str) -> Lot:
+    return Lot(
+        propriete="", titre_num="", indice_privative=indice_privative, indice_commune=indice_commune,
+        surface_interieure=surface, surface_avec_surplomb=surface, consistance=consistance,
+    )
+
+
+def _lignes_quotation(data: ImportedData) -> List[Tuple[Decimal, Decimal]]:
+    return [
+        (ligne.quot_part, ligne.indivision)
+        for etage in calculer_quotation(data).etages
+        for ligne in etage.lignes
+        if ligne.indice_privative
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("centiemes", [False, True])
+def test_equivalence_decimal(seed, centiemes):
+    data = immeuble(1 + seed % 12, 2 + seed % 9, seed, centiemes)
+
+    assert _lignes_quotation(data) == quotation_decimal(data)
+    assert [ligne.nvi for etage in calculer_voix(data).etages for ligne in etage.lignes] == voix_decimal(data)
+
+
+def test_totaux_exacts():
+    data = immeuble(15, 7, seed=3, centiemes=True)
+
+    quotation = calculer_quotation(data)
+    assert quotation.total_indivision == 10000
+    assert calculer_voix(data).somme_nvi == 100
+    assert quotation.total_quots_parts == sum(
+        Decimal(str(lot.surface_avec_surplomb)) * Decimal(str(etage.total_surface_interieure))
+        for etage in data.etages for lot in etage.lots if lot.indice_privative
+    ) / Decimal(str(quotation.total_surface_avec_surplomb))
+
+
+def test_somme_surfaces_sans_erreur_flottante():
+    assert somme_surfaces([0.1, 0.2]) == 0.3
+    assert somme_surfaces([None, 12.5, 0.01]) == 12.51
+
+
+def test_egalite_arrondie_vers_le_haut():
+    # Quote-part du lot 1 : 4,47 x 6,06 / 5,96 = 4,545 exactement ; le calcul
+    # en flottants donne 4,5449999… et arrondissait à 4,54
+    lots = [_lot("1", "", 4.47, "Appartement"), _lot("2", "", 1.49, "Appartement"), _lot("", "3", 0.1, "Gaines")]
+    data = ImportedData(titre_foncier="1/05", etages=[Floor(
+        nom="Rez-de-chaussée", cotes="", lots=lots,
+        total_surface_interieure=somme_surfaces(lot.surface_interieure for lot in lots),
+    )])
+
+    assert _lignes_quotation(data)[0] == (Decimal("4.55"), Decimal("7500"))
+    assert quotation_decimal(data)[0][0] == Decimal("4.54")
+
+
+def test_surface_totale_nulle_au_centieme():
+    """Mode non strict : des surfaces privatives toutes sous 0,005 m² ne divisent pas par zéro"""
+    lots = [_lot("1", "", 0.004, "Appartement"), _lot("", "2", 0.1, "Gaines")]
+    data = ImportedData(titre_foncier="1/05", etages=[Floor(
+        nom="Rez-de-chaussée", cotes="", lots=lots,
+        total_surface_interieure=somme_surfaces(lot.surface_interieure for lot in lots),
+    )])
+
+    assert _lignes_quotation(data) == [(Decimal("0.00"), Decimal("0"))]
+    quotation = calculer_quotation(data)
+    assert quotation.total_quots_parts == quotation.total_indivision == 0
+    voix = calculer_voix(data)
+    assert voix.surface_totale == 0
+    assert [ligne.nvi for etage in voix.etages for ligne in etage.lignes] == [Decimal("0.00")]
+
+
+def test_totaux_consistance_arrondis_a_l_unite():
+    lots = [_lot("1", "", 10.25, "Appartement"), _lot("2", "", 10.25, "Appartement"), _lot("3", "", 7.5, "Commerce")]
+    totaux = calculer_tr_c(ImportedData(titre_foncier="", etages=[Floor(nom="", cotes="", lots=lots)]))
+
+    assert totaux.appartements == Decimal("20")
+    assert totaux.commerces == Decimal("8")
+
+
+@pytest.mark.parametrize("surface, depasse", [
+    (12.34, False), (0.1, False), (1234567.89, False), (None, False), (12.345, True), (0.001, True),
+])
+def test_depasse_centieme(surface, depasse):
+    assert depasse_centieme(surface) is depasse
+
+
+def test_surface_arrondie_signalee():
+    validateur = Validateur(nombre)
+    validateur.lot(12, [], _lot("1", "", 12.345, "Appartement"))
+    avertissements = [a for a in validateur.avertissements if a.code == "surface_arrondie"]
+    assert [(a.ligne, a.colonne) for a in avertissements] == [(12, 6), (12, 7)]
+    assert "12.345" in avertissements[0].message
@@ -0,0 +1,104 @@
+"""Génération en masse (python -m app.cli) : sources à jour ignorées, titre foncier en double,
+échec d'un fichier, processus de génération tué"""
+import csv
+import os
+import sqlite3
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from app import cli
+from app.services.generation_hors_ligne import ERREUR_PROCESSUS, NOM_ETAT, generer_source
+from app.utils.synthetic import generer_lignes
+
+
+def _ecrire_tb(chemin: Path, titre_foncier: str, seed: int = 0) -> Path:
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(generer_lignes(2, 3, titre_foncier=titre_foncier, seed=seed))
+    chemin.write_text(buffer.getvalue(), encoding="utf-8")
+    return chemin
+
+
+@pytest.fixture
+def depot(tmp_path):
+    depot = tmp_path / "depot"
+    depot.mkdir()
+    _ecrire_tb(depot / "a.csv", "1001 /01")
+    _ecrire_tb(depot / "b.csv", "1002 /02")
+    return depot
+
+
+def _executer(depot: Path, sortie: Path, capsys, *options: str):
+    code = cli.main([str(depot), "-o", str(sortie), "--workers", "2", "--fichiers", "Voix", *options])
+    sorties = capsys.readouterr()
+    return code, sorties.out.splitlines()[0], sorties.err
+
+
+def test_sources_a_jour_ignorees(depot, tmp_path, capsys):
+    sortie = tmp_path / "classeurs"
+    code, bilan, _ = _executer(depot, sortie, capsys)
+    assert code == 0
+    assert bilan == "2 sources : 2 générées, 0 à jour, 0 échecs"
+    assert sorted(p.name for p in sortie.glob("*.xlsx")) == ["1001-01.xlsx", "1002-02.xlsx"]
+    with sqlite3.connect(sortie / NOM_ETAT) as db:
+        assert db.execute("SELECT COUNT(*) FROM sources").fetchone() == (2,)
+
+    # Date de modification changée, contenu identique : l'empreinte du contenu décide
+    os.utime(depot / "a.csv", ns=(0, 0))
+    assert _executer(depot, sortie, capsys)[1] == "2 sources : 0 générées, 2 à jour, 0 échecs"
+
+    _ecrire_tb(depot / "a.csv", "1001 /01", seed=1)
+    assert _executer(depot, sortie, capsys)[1] == "2 sources : 1 générées, 1 à jour, 0 échecs"
+
+    # Classeur supprimé, ou autres feuilles demandées : régénéré
+    (sortie / "1002-02.xlsx").unlink()
+    assert _executer(depot, sortie, capsys)[1] == "2 sources : 1 générées, 1 à jour, 0 échecs"
+    code, bilan, _ = _executer(depot, sortie, capsys, "--fichiers", "TA")
+    assert bilan == "2 sources : 2 générées, 0 à jour, 0 échecs"
+
+
+def test_titre_foncier_en_double(depot, tmp_path, capsys):
+    _ecrire_tb(depot / "c.csv", "1001 /01", seed=2)
+    sortie = tmp_path / "classeurs"
+    code, bilan, erreurs = _executer(depot, sortie, capsys)
+
+    assert code == 1
+    assert bilan == "3 sources : 2 générées, 0 à jour, 1 échecs"
+    # Première source dans l'ordre : a.csv l'emporte
+    assert f"échec {depot / 'c.csv'} : titre foncier 1001 /01 déjà généré depuis {(depot / 'a.csv').resolve()}" in erreurs
+    assert sorted(p.name for p in sortie.iterdir() if not p.name.startswith(".")) == ["1001-01.xlsx", "1002-02.xlsx"]
+
+
+def test_echec_d_un_fichier(depot, tmp_path, capsys):
+    (depot / "vide.csv").write_text("pas un tableau TB\n", encoding="utf-8")
+    sortie = tmp_path / "classeurs"
+    code, bilan, erreurs = _executer(depot, sortie, capsys)
+
+    assert code == 1
+    assert bilan == "3 sources : 2 générées, 0 à jour, 1 échecs"
+    assert f"échec {depot / 'vide.csv'} : Fichier TB invalide" in erreurs
+    assert len(list(sortie.glob("*.xlsx"))) == 2
+    # Aucun classeur temporaire laissé dans la sortie
+    assert not list(sortie.glob(".*.tmp"))
+
+
+def _generer_ou_tuer(source: str, *args):
+    """Exécuté dans le pool : le processus qui traite un fichier « tuer » meurt sans résultat"""
+    if "tuer" in Path(source).name:
+        os._exit(1)
+    return generer_source(source, *args)
+
+
+def test_processus_tue(depot, tmp_path, capsys, monkeypatch):
+    _ecrire_tb(depot / "b-tuer.csv", "1003 /03")
+    _ecrire_tb(depot / "c.csv", "1004 /04")
+    monkeypatch.setattr(cli, "generer_source", _generer_ou_tuer)
+    sortie = tmp_path / "classeurs"
+    code, bilan, erreurs = _executer(depot, sortie, capsys)
+
+    # Le pool est recréé : seule la source qui tue son processus est en échec
+    assert code == 1
+    assert bilan == "4 sources : 3 générées, 0 à jour, 1 échecs"
+    assert f"échec {depot / 'b-tuer.csv'} : {ERREUR_PROCESSUS}" in erreurs
+    assert sorted(p.name for p in sortie.glob("*.xlsx")) == ["1001-01.xlsx", "1002-02.xlsx", "1004-04.xlsx"]
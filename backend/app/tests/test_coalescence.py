@@ -0,0 +1,74 @@
+"""Regroupement des requêtes identiques simultanées : résultat et erreurs partagés, métriques"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.coalescence import Coalesceur
+
+REQUETES = 8
+
+# Débloque les travaux une fois toutes les requêtes lancées
+liberation = threading.Event()
+
+
+def _simultanees(coalesceur: Coalesceur, cles, travail):
+    """Lance une requête par clé ; le travail est bloqué jusqu'à ce que toutes soient en vol ou en attente"""
+    with ThreadPoolExecutor(len(cles)) as executeur:
+        futures = [executeur.submit(coalesceur.executer, cle, travail) for cle in cles]
+        doublons = len(cles) - len(set(cles))
+        while coalesceur.metriques().en_attente < doublons:
+            time.sleep(0.001)
+        liberation.set()
+        return [future.exception() or future.result() for future in futures]
+
+
+@pytest.fixture(autouse=True)
+def _liberation():
+    liberation.clear()
+
+
+def test_un_seul_calcul_pour_les_doublons():
+    coalesceur = Coalesceur()
+    appels = []
+
+    def travail():
+        appels.append(1)
+        liberation.wait(5)
+        return b"classeur"
+
+    resultats = _simultanees(coalesceur, ["a"] * REQUETES, travail)
+    assert resultats == [b"classeur"] * REQUETES
+    assert len(appels) == 1
+
+    metriques = coalesceur.metriques()
+    assert (metriques.executes, metriques.partages, metriques.en_vol, metriques.en_attente) == (1, REQUETES - 1, 0, 0)
+
+
+def test_cles_distinctes_non_regroupees():
+    coalesceur = Coalesceur()
+
+    def travail():
+        liberation.wait(5)
+        return threading.get_ident()
+
+    resultats = _simultanees(coalesceur, ["a", "b", "a", "b"], travail)
+    assert resultats[0] == resultats[2] != resultats[1] == resultats[3]
+    assert (coalesceur.metriques().executes, coalesceur.metriques().partages) == (2, 2)
+
+
+def test_erreur_partagee_puis_nouveau_calcul():
+    coalesceur = Coalesceur()
+
+    def echec():
+        liberation.wait(5)
+        raise ValueError("fichier invalide")
+
+    resultats = _simultanees(coalesceur, ["a"] * 3, echec)
+    assert all(isinstance(r, ValueError) for r in resultats)
+    assert coalesceur.metriques().echecs_partages == 2
+
+    # Une fois le travail terminé, la clé n'est plus en vol : la requête suivante recalcule
+    assert coalesceur.executer("a", lambda: b"ok") == b"ok"
+    assert coalesceur.metriques().executes == 2
@@ -0,0 +1,108 @@
+"""Uploads compressés : détection gzip / zstd, taille décompressée, préfixe décompressé, estimation du coût"""
+import gzip
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.services.compression import (
+    GZIP,
+    ZSTD,
+    decompresser_prefixe,
+    detecter_compression,
+    flux_decompresse,
+    taille_decompressee,
+)
+from app.services.dialect import TAILLE_ECHANTILLON, detecter_dialecte_flux
+from app.services.scheduler import RATIO_COMPRESSION, cout_octets, cout_upload
+from app.utils.synthetic import generer_csv
+
+# Plusieurs blocs zstd (128 Ko chacun) : un préfixe de la trame en contient de complets
+CONTENU = generer_csv(150, 30).encode("utf-8")
+
+
+def _zstd(contenu: bytes, taille_connue: bool = True) -> bytes:
+    zstandard = pytest.importorskip("zstandard")
+    compresseur = zstandard.ZstdCompressor(write_content_size=taille_connue)
+    if taille_connue:
+        return compresseur.compress(contenu)
+    # Compression en flux : la taille n'est pas écrite dans l'en-tête de trame
+    return b"".join(compresseur.read_to_iter(BytesIO(contenu)))
+
+
+@pytest.mark.parametrize("compresser, content_encoding, attendu", [
+    (gzip.compress, None, GZIP),
+    (_zstd, None, ZSTD),
+    (lambda c: c, None, None),
+    # Octets magiques prioritaires sur l'en-tête
+    (gzip.compress, "zstd", GZIP),
+    (lambda c: c, " X-Gzip ", GZIP),
+    (lambda c: c, "br", None),
+])
+def test_detection(compresser, content_encoding, attendu):
+    flux = BytesIO(compresser(CONTENU))
+    assert detecter_compression(flux, content_encoding) == attendu
+    assert flux.tell() == 0
+
+
+@pytest.mark.parametrize("compresser, compression, attendu", [
+    (lambda c: c, None, len(CONTENU)),
+    (gzip.compress, GZIP, len(CONTENU)),
+    (_zstd, ZSTD, len(CONTENU)),
+    (lambda c: _zstd(c, taille_connue=False), ZSTD, None),
+    (lambda c: b"\x1f\x8b\x08", GZIP, None),
+])
+def test_taille_decompressee(compresser, compression, attendu):
+    flux = BytesIO(compresser(CONTENU))
+    flux.seek(3)
+    assert taille_decompressee(flux, compression) == attendu
+    assert flux.tell() == 3
+
+
+@pytest.mark.parametrize("compresser, compression", [
+    (lambda c: c, None),
+    (gzip.compress, GZIP),
+    (_zstd, ZSTD),
+    (lambda c: _zstd(c, taille_connue=False), ZSTD),
+])
+def test_prefixe_tronque(compresser, compression):
+    compresse = compresser(CONTENU)
+    # Premiers octets reçus d'un upload en flux : la trame compressée est coupée
+    prefixe = compresse[: len(compresse) // 2]
+    assert decompresser_prefixe(prefixe, compression, TAILLE_ECHANTILLON) == CONTENU[:TAILLE_ECHANTILLON]
+    assert decompresser_prefixe(prefixe, compression, 100) == CONTENU[:100]
+
+
+@pytest.mark.parametrize("compression, contenu", [
+    (GZIP, b"\x1f\x8b\x09\x00" + b"\x00" * 20),
+    (ZSTD, b"\x28\xb5\x2f\xfd" + b"\xff" * 30),
+])
+def test_prefixe_invalide(compression, contenu):
+    if compression == ZSTD:
+        pytest.importorskip("zstandard")
+    with pytest.raises(HTTPException) as erreur:
+        decompresser_prefixe(contenu, compression, TAILLE_ECHANTILLON)
+    assert erreur.value.status_code == 400
+
+
+@pytest.mark.parametrize("compresser, compression", [(gzip.compress, GZIP), (_zstd, ZSTD)])
+def test_flux_decompresse(compresser, compression):
+    flux = BytesIO(compresser(CONTENU))
+    with flux_decompresse(flux, compression) as lecteur:
+        assert lecteur.read() == CONTENU
+    assert not flux.closed
+
+
+@pytest.mark.parametrize("compresser", [lambda c: c, gzip.compress, _zstd])
+def test_cout_estime_depuis_la_taille_decompressee(compresser):
+    compresse = compresser(CONTENU)
+    assert len(CONTENU) > TAILLE_ECHANTILLON
+    dialecte = detecter_dialecte_flux(BytesIO(compresse))
+    assert dialecte.lignes_estimees == pytest.approx(CONTENU.count(b"\n"), rel=0.1)
+    assert cout_upload(UploadFile(file=BytesIO(compresse), size=len(compresse)), dialecte) == dialecte.lignes_estimees
+
+
+def test_cout_sans_taille_decompressee():
+    assert cout_octets(8000) == 101
+    assert cout_octets(8000, compresse=True) == 8000 * RATIO_COMPRESSION // 80 + 1
+    assert cout_octets(None) == 1
@@ -0,0 +1,83 @@
+"""Détection du dialecte CSV : BOM, UTF-8 / cp1252 / latin-1, délimiteur, octets cp1252 tardifs"""
+import csv
+from io import BytesIO, StringIO
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.services.csv_parser import CSVParser
+from app.services.dialect import (
+    TAILLE_ECHANTILLON,
+    detecter_delimiteur,
+    detecter_dialecte,
+    detecter_encodage,
+    estimer_lignes,
+)
+from app.utils.synthetic import generer_csv, generer_lignes
+
+TEXTE = "Modification successives du Titre foncier : 1/05\n;Propriété dite;Titre N°\n"
+
+
+@pytest.mark.parametrize("octets, encodage", [
+    (b"\xef\xbb\xbf" + TEXTE.encode("utf-8"), "utf-8-sig"),
+    (TEXTE.encode("utf-16"), "utf-16"),
+    (b"\xfe\xff" + TEXTE.encode("utf-16-be"), "utf-16"),
+    (TEXTE.encode("utf-8"), "utf-8"),
+    # Caractère multi-octets coupé en fin d'échantillon
+    (TEXTE.encode("utf-8") + "é".encode("utf-8")[:1], "utf-8"),
+    ((TEXTE + "€").encode("cp1252"), "cp1252"),
+    # 0x81 n'est pas défini en cp1252
+    (TEXTE.encode("cp1252") + b"\x81", "latin-1"),
+    (b"", "utf-8"),
+])
+def test_encodage(octets, encodage):
+    assert detecter_encodage(octets) == encodage
+
+
+@pytest.mark.parametrize("delimiteur", [";", ",", "\t", "|"])
+def test_delimiteur_deduit_des_libelles(delimiteur):
+    assert detecter_delimiteur(generer_csv(2, 3, delimiter=delimiteur)) == delimiteur
+    assert detecter_dialecte(generer_csv(2, 3, delimiter=delimiteur).encode("cp1252")).delimiter == delimiteur
+
+
+def test_delimiteur_par_frequence_sans_en_tete():
+    # Les virgules décimales ne comptent pas : le tabulateur est le plus régulier
+    texte = "".join(f"a\tb,{i}\tc\td\n" if i % 2 else f"a\tb\tc\td\n" for i in range(10))
+    assert detecter_delimiteur(texte) is None
+    assert detecter_dialecte(texte.encode("utf-8")).delimiter == "\t"
+
+
+def test_estimation_des_lignes():
+    assert estimer_lignes(b"a\nb\nc", 5) == 3
+    echantillon = b"x" * 99 + b"\n"
+    assert estimer_lignes(echantillon * (TAILLE_ECHANTILLON // 100 + 1), 10 * TAILLE_ECHANTILLON) == pytest.approx(
+        10 * TAILLE_ECHANTILLON // 100, rel=0.01
+    )
+
+
+def _upload(contenu: bytes) -> UploadFile:
+    return UploadFile(file=BytesIO(contenu), filename="tb.csv", headers=Headers({"content-type": "text/csv"}))
+
+
+def test_octets_cp1252_apres_l_echantillon():
+    """Échantillon en UTF-8 valide, consistance du dernier lot exportée en cp1252 plus loin"""
+    lignes = generer_lignes(40, 20)
+    dernier_lot = max(i for i, ligne in enumerate(lignes) if ligne[3:4] and ligne[3])
+    lignes[dernier_lot][7] = "Entrepôt"
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+    texte = buffer.getvalue()
+    coupure = texte.index("Entrepôt")
+    contenu = texte[:coupure].encode("utf-8") + texte[coupure:].encode("cp1252")
+    assert coupure > TAILLE_ECHANTILLON
+
+    upload = _upload(contenu)
+    parser = CSVParser()
+    parser.apply_dialect(CSVParser.validate_csv(upload))
+    assert parser.encoding == "utf-8"
+
+    data = parser.parse_upload(upload)
+    assert [lot for lot in data.etages[-1].lots if lot.indice_privative][-1].consistance == "Entrepôt"
+    # Le reste du fichier, UTF-8 valide, est lu en UTF-8
+    assert data.etages[0].nom == "Rez-de-chaussée"
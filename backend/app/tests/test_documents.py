@@ -0,0 +1,120 @@
+"""Documents PV / Règlement : moteur de gabarits, paquet .docx, dossier zip"""
+import csv
+import zipfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from xml.etree import ElementTree
+
+import pytest
+
+from app.services import documents
+from app.services.calculs import calculer_apercu
+from app.services.csv_parser import CSVParser
+from app.services.documents import (
+    CALCULS_DOCUMENTS,
+    GABARITS,
+    XLSX_MEDIA_TYPE,
+    ZIP_MEDIA_TYPE,
+    Gabarit,
+    contexte_documents,
+    ecrire_docx,
+    generer_dossier,
+)
+from app.utils.synthetic import generer_csv
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+@pytest.fixture(scope="module")
+def data():
+    return CSVParser()._parse_rows(csv.reader(StringIO(generer_csv(3, 4)), delimiter=";"))
+
+
+def _rendre(source: str, **contexte) -> str:
+    return "".join(Gabarit(source).rendre(contexte))
+
+
+@pytest.mark.parametrize("source, contexte, attendu", [
+    ("<t>{{ a }}</t>", {"a": "x"}, "<t>x</t>"),
+    ("{{ a.b.c }}", {"a": {"b": {"c": 3}}}, "3"),
+    ("{{ a.b }}", {"a": None}, ""),
+    ("{{ a }}", {"a": Decimal("1234.5")}, "1\u00a0234,50"),
+    ("{{ a | nombre }}", {"a": 0.125}, "0,13"),
+    ("{{ a | entier }}", {"a": Decimal("2500.5")}, "2\u00a0501"),
+    ("{{ a | exposant }}", {"a": "13-13a"}, "13-13ᵃ"),
+    ("{{ a | nombre }}", {"a": None}, ""),
+    # Valeurs échappées : pas d'injection de XML
+    ("<t>{{ a }}</t>", {"a": "R&D <b>"}, "<t>R&amp;D &lt;b&gt;</t>"),
+    ("{% pour x dans xs %}[{{ x }}]{% fin %}", {"xs": [1, 2]}, "[1][2]"),
+    ("{% pour x dans xs %}{% pour y dans x %}{{ y }}{% fin %};{% fin %}", {"xs": [[1, 2], [3]]}, "12;3;"),
+    ("{% pour x dans xs %}x{% fin %}", {"xs": None}, ""),
+    ("{% si a %}oui{% fin %}{% si b %}non{% fin %}", {"a": "1", "b": ""}, "oui"),
+    # Mise en forme du gabarit entre balises XML supprimée, texte conservé
+    ("<a>\n  <b> x </b>\n</a>", {}, "<a><b> x </b></a>"),
+])
+def test_rendu(source, contexte, attendu):
+    assert _rendre(source, **contexte) == attendu
+
+
+def test_boucle_ne_fuit_pas_hors_du_bloc():
+    assert _rendre("{% pour x dans xs %}{{ x }}{% fin %}{{ x }}", xs=[1], x="dehors") == "1dehors"
+
+
+@pytest.mark.parametrize("source, message", [
+    ("a\n{{ a | inconnu }}", "ligne 2 : filtre inconnu : inconnu"),
+    ("{% tant que a %}", "instruction inconnue"),
+    ("\n\n{% si a %}", "ligne 3 : bloc non fermé"),
+    ("{% fin %}", "sans bloc ouvert"),
+    ("{{ a + b }}", "expression invalide"),
+])
+def test_erreurs_de_compilation(source, message):
+    with pytest.raises(ValueError, match=message):
+        Gabarit(source, "essai.xml")
+
+
+def test_gabarits_sans_texte_juridique_redige(data):
+    contexte = contexte_documents(data, calculer_apercu(data, CALCULS_DOCUMENTS))
+    for nom, gabarit in GABARITS.items():
+        xml = "".join(gabarit.rendre(contexte))
+        assert "[À COMPLÉTER" in xml, nom
+        assert "conformément à la législation" not in xml
+        assert data.titre_foncier in xml
+
+
+@pytest.mark.parametrize("taille_bloc", [10, documents.TAILLE_BLOC])
+def test_paquet_docx(data, monkeypatch, taille_bloc):
+    monkeypatch.setattr(documents, "TAILLE_BLOC", taille_bloc)
+    contexte = contexte_documents(data, calculer_apercu(data, CALCULS_DOCUMENTS))
+    contenu = ecrire_docx(GABARITS["PV"], contexte)
+
+    archive = zipfile.ZipFile(BytesIO(contenu))
+    assert archive.namelist() == ["[Content_Types].xml", "_rels/.rels", "word/document.xml"]
+    assert {entree.date_time for entree in archive.infolist()} == {documents.DATE_ZIP}
+    corps = ElementTree.fromstring(archive.read("word/document.xml"))
+    lignes = corps.findall(f".//{W}tbl/{W}tr")
+    # Par étage : en-tête, lots et parties communes, total
+    assert len(lignes) == sum(len(etage.lots) + 2 for etage in data.etages)
+    assert ecrire_docx(GABARITS["PV"], contexte) == contenu
+
+
+def _classeur(feuilles, calculs):
+    return BytesIO(f"classeur {','.join(feuilles)} {calculs is not None}".encode())
+
+
+def test_dossier_sans_document_renvoie_le_classeur(data):
+    contenu, nom, media_type = generer_dossier(data, ["Voix", "TA"], _classeur)
+    assert (contenu.getvalue(), nom, media_type) == (b"classeur Voix,TA False", "fichier.xlsx", XLSX_MEDIA_TYPE)
+
+
+def test_dossier_avec_documents(data):
+    contenu, nom, media_type = generer_dossier(data, ["Voix", "Reglement", "PV"], _classeur)
+    assert (nom, media_type) == ("fichiers_copropriete.zip", ZIP_MEDIA_TYPE)
+    archive = zipfile.ZipFile(contenu)
+    assert archive.namelist() == ["fichier.xlsx", "PV.docx", "Reglement.docx"]
+    # Tableaux calculés une fois, partagés avec le classeur
+    assert archive.read("fichier.xlsx") == b"classeur Voix True"
+
+
+def test_dossier_documents_seuls(data):
+    contenu, _, _ = generer_dossier(data, ["PV"], _classeur)
+    assert zipfile.ZipFile(contenu).namelist() == ["PV.docx"]
@@ -0,0 +1,159 @@
+"""Classeurs reproductibles à l'octet près, ETag dérivé de la clé du cache disque, 304 sur If-None-Match,
+envoi des classeurs du cache disque depuis le fichier"""
+import asyncio
+import csv
+import time
+from io import BytesIO, StringIO
+from zipfile import ZipFile
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+from app.main import app
+from app.api.routes import _ReponseFichierOuvert
+from app.services import cache, speculation
+from app.services.cache import CacheClasseurs, cle_classeur, etag_classeur, nom_cle
+from app.services.csv_parser import CSVParser
+from app.services.xlsx_writer import DATE_ZIP, PROFILS_COMPRESSION, save_workbook
+from app.utils.synthetic import generer_csv
+
+CONTENU = generer_csv(4, 5)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _data(contenu: str = CONTENU):
+    return CSVParser()._parse_rows(csv.reader(StringIO(contenu), delimiter=";"))
+
+
+def _classeur() -> Workbook:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Voix"
+    for i in range(50):
+        ws.append([f"Lot {i % 12}", "Appartement", i, i * 1.5])
+    return wb
+
+
+def test_zip_deterministe_identique_a_l_octet():
+    premiers = {profil: save_workbook(_classeur(), profil).getvalue() for profil in PROFILS_COMPRESSION}
+    # Horloge différente (dates des propriétés, des fichiers temporaires des feuilles)
+    time.sleep(1.1)
+    for profil, premier in premiers.items():
+        assert save_workbook(_classeur(), profil).getvalue() == premier, profil
+
+        archive = ZipFile(BytesIO(premier))
+        assert {entree.date_time for entree in archive.infolist()} == {DATE_ZIP}
+        assert "1980-01-01" in archive.read("docProps/core.xml").decode("utf-8")
+
+
+def test_zip_non_deterministe_garde_les_dates():
+    archive = ZipFile(save_workbook(_classeur(), deterministe=False))
+    assert DATE_ZIP not in {entree.date_time for entree in archive.infolist()}
+
+
+def test_memes_octets_d_une_generation_a_l_autre():
+    data = _data()
+    premier = CSVParser().generer_classeur(data, list(CSVParser.excel_key)).getvalue()
+    second = CSVParser().generer_classeur(_data(), list(CSVParser.excel_key)).getvalue()
+    assert premier == second
+
+
+def _envoyer(client, fichiers, **headers):
+    return client.post(
+        "/api/fichiers-copropriete",
+        files={"file": ("tb.csv", CONTENU.encode("utf-8"), "text/csv")},
+        data={"fichiersAGenerer": fichiers},
+        headers=headers,
+    )
+
+
+def test_if_none_match_304(client):
+    reponse = _envoyer(client, ["Voix"])
+    assert reponse.status_code == 200
+    etag = reponse.headers["etag"]
+
+    reponse = _envoyer(client, ["Voix"], **{"If-None-Match": etag})
+    assert reponse.status_code == 304
+    assert reponse.headers["etag"] == etag
+    assert reponse.content == b""
+
+    # Autres feuilles : autre ETag, classeur renvoyé
+    reponse = _envoyer(client, ["TA"], **{"If-None-Match": etag})
+    assert reponse.status_code == 200
+    assert reponse.headers["etag"] != etag
+
+
+def test_changement_de_version_change_etag_et_octets(cache_disque, monkeypatch):
+    # Empreinte propre au test : le cache en mémoire ne connaît pas ce classeur
+    cle = cle_classeur("empreinte-test-version", ["Voix"], None)
+    cache_disque.ajouter(nom_cle(cle), b"rendu de la version precedente", ".xlsx")
+    etag = etag_classeur(cle)
+
+    monkeypatch.setattr(cache, "VERSION_RENDU", "version-suivante")
+    assert etag_classeur(cle) != etag
+    with speculation.generer_classeur_en_cache(_data(), ["Voix"], empreinte=cle[0]) as classeur:
+        assert classeur.read() != b"rendu de la version precedente"
+
+
+def test_classeur_du_cache_disque_servi_depuis_le_fichier(client, cache_disque, monkeypatch):
+    # Cache mémoire vide : le classeur est généré et écrit sur disque, puis vient du disque
+    monkeypatch.setattr(speculation, "cache_classeurs", CacheClasseurs(1024 * 1024))
+    attendu = _envoyer(client, ["Voix"]).content
+    monkeypatch.setattr(speculation, "cache_classeurs", CacheClasseurs(1024 * 1024))
+    ouverts = []
+    ouvrir = cache_disque.ouvrir
+
+    def ouvrir_suivi(cle):
+        fichier = ouvrir(cle)
+        ouverts.append(fichier)
+        return fichier
+
+    monkeypatch.setattr(cache_disque, "ouvrir", ouvrir_suivi)
+    reponse = _envoyer(client, ["Voix"])
+    assert reponse.status_code == 200
+    assert reponse.content == attendu
+    assert reponse.headers["content-length"] == str(len(attendu))
+    (fichier,) = [f for f in ouverts if f is not None and f.name.endswith(".xlsx")]
+    assert fichier.closed
+
+
+def _envoyer_reponse(reponse, extensions):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": extensions}
+    asyncio.run(reponse(scope, None, send))
+    return messages
+
+
+def test_envoi_zero_copie_si_le_serveur_le_propose(cache_disque):
+    cache_disque.ajouter("a", b"classeur a", ".xlsx")
+    fichier = cache_disque.ouvrir("a")
+    debut, corps = _envoyer_reponse(
+        _ReponseFichierOuvert(fichier, "application/zip", {}), {"http.response.zerocopysend": {}}
+    )
+    assert (b"content-length", b"10") in debut["headers"]
+    # Le serveur lit le descripteur lui-même
+    assert corps == {"type": "http.response.zerocopysend", "file": fichier, "more_body": False}
+    assert fichier.closed
+
+
+def test_envoi_par_blocs_malgre_une_eviction(cache_disque, monkeypatch):
+    monkeypatch.setattr(cache_disque, "taille_max", 15)
+    cache_disque.ajouter("a", b"classeur a", ".xlsx")
+    fichier = cache_disque.ouvrir("a")
+    # "a" évincé pendant l'envoi : le descripteur ouvert reste lisible
+    cache_disque.ajouter("b", b"classeur b", ".xlsx")
+    assert not cache_disque.contient("a")
+
+    messages = _envoyer_reponse(_ReponseFichierOuvert(fichier, "application/zip", {}), {})
+    assert b"".join(m["body"] for m in messages[1:]) == b"classeur a"
+    assert messages[-1] == {"type": "http.response.body", "body": b""}
+    assert fichier.closed
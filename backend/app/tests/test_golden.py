@@ -0,0 +1,204 @@
+"""Équivalence des classeurs générés avec des classeurs de référence (golden)
+
+Chaque fichier du corpus (golden/corpus : CSV synthétiques et réel
+anonymisé) est parsé puis ses cinq feuilles sont générées par chacun des
+moteurs de MOTEURS. Le résultat est comparé cellule par cellule (valeurs,
+formats, polices, bordures, alignements), avec les fusions, hauteurs de
+lignes et largeurs de colonnes, au classeur de référence golden/<nom>.xlsx.
+
+Un nouveau moteur de génération (rendu alternatif, cache, chemin parallèle)
+est ajouté à MOTEURS et doit passer ces tests avant d'être activé.
+
+Après une évolution volontaire du rendu, régénérer les références avec le
+moteur séquentiel, puis relire les différences signalées avant de committer :
+
+    cd backend && python -m app.tests.test_golden --diff        # différences actuelles
+    cd backend && python -m app.tests.test_golden --regenerer
+"""
+import argparse
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+from openpyxl import load_workbook
+from openpyxl.worksheet.worksheet import Worksheet
+
+from app.models.models import ImportedData
+from app.services.csv_parser import CSVParser
+from app.services.dialect import detecter_dialecte_prefixe
+
+GOLDEN_DIR = Path(__file__).with_name("golden")
+CORPUS_DIR = GOLDEN_DIR / "corpus"
+
+FICHIERS = CSVParser.excel_key
+
+# Nombre maximal de différences détaillées par classeur
+LIMITE_DIFF = 40
+
+
+def charger_donnees(chemin: Path) -> ImportedData:
+    """Parse un fichier du corpus comme un upload (détection du dialecte comprise)"""
+    contenu = chemin.read_bytes()
+    parser = CSVParser()
+    parser.apply_dialect(detecter_dialecte_prefixe(contenu[:64 * 1024]))
+    return parser.parse_stream(BytesIO(contenu))
+
+
+# Moteurs de génération : (données, feuilles) -> classeur XLSX
+
+def _sequentiel(data: ImportedData, fichiers: List[str]) -> BytesIO:
+    return CSVParser().generer_classeur(data, fichiers, parallele=False)
+
+
+def _parallele(data: ImportedData, fichiers: List[str]) -> BytesIO:
+    return CSVParser().generer_classeur(data, fichiers, parallele=True)
+
+
+def _sans_compression(data: ImportedData, fichiers: List[str]) -> BytesIO:
+    return CSVParser().generer_classeur(data, fichiers, profil="stored")
+
+
+MOTEURS: Dict[str, Callable[[ImportedData, List[str]], BytesIO]] = {
+    "sequentiel": _sequentiel,
+    "parallele": _parallele,
+    "stored": _sans_compression,
+}
+
+
+def _couleur(couleur) -> Optional[str]:
+    return couleur.rgb if couleur is not None and isinstance(couleur.rgb, str) else None
+
+
+def _cellule(ws: Worksheet, row: int, column: int) -> Dict[str, Any]:
+    """Attributs comparés d'une cellule"""
+    cell = ws._cells.get((row, column)) or ws.cell(row, column)
+    font, border, alignment = cell.font, cell.border, cell.alignment
+    return {
+        "valeur": cell.value,
+        "format": cell.number_format,
+        "police": (font.name, font.sz, font.b, font.i, font.u, _couleur(font.color)),
+        "remplissage": (cell.fill.fill_type, _couleur(cell.fill.fgColor)),
+        "bordure": tuple(
+            (cote.style, _couleur(cote.color))
+            for cote in (border.left, border.right, border.top, border.bottom)
+        ),
+        "alignement": (alignment.horizontal, alignment.vertical, alignment.wrap_text, alignment.text_rotation),
+    }
+
+
+def _differences_feuille(attendue: Worksheet, obtenue: Worksheet) -> List[str]:
+    nom = attendue.title
+    differences: List[str] = []
+
+    for (row, column) in sorted(set(attendue._cells) | set(obtenue._cells)):
+        a, b = _cellule(attendue, row, column), _cellule(obtenue, row, column)
+        for attribut in a:
+            if a[attribut] != b[attribut]:
+                coordonnee = attendue.cell(row, column).coordinate
+                differences.append(f"{nom}!{coordonnee} {attribut} : attendu {a[attribut]!r}, obtenu {b[attribut]!r}")
+
+    fusions_a = {str(r) for r in attendue.merged_cells.ranges}
+    fusions_b = {str(r) for r in obtenue.merged_cells.ranges}
+    for fusion in sorted(fusions_a - fusions_b):
+        differences.append(f"{nom} fusion manquante : {fusion}")
+    for fusion in sorted(fusions_b - fusions_a):
+        differences.append(f"{nom} fusion en trop : {fusion}")
+
+    for dimensions, libelle, attribut in (
+        (lambda ws: ws.row_dimensions, "hauteur de la ligne", "height"),
+        (lambda ws: ws.column_dimensions, "largeur de la colonne", "width"),
+    ):
+        da, db = dimensions(attendue), dimensions(obtenue)
+        for cle in sorted(set(da) | set(db), key=str):
+            va = getattr(da[cle], attribut) if cle in da else None
+            vb = getattr(db[cle], attribut) if cle in db else None
+            if va != vb:
+                differences.append(f"{nom} {libelle} {cle} : attendu {va!r}, obtenu {vb!r}")
+    return differences
+
+
+def comparer_classeurs(attendu, obtenu, feuilles: Optional[List[str]] = None) -> List[str]:
+    """Différences lisibles entre deux classeurs XLSX (chemins ou flux), limitées à `feuilles`"""
+    wb_a, wb_b = load_workbook(attendu), load_workbook(obtenu)
+    noms_a = [n for n in wb_a.sheetnames if feuilles is None or n in feuilles]
+    if noms_a != wb_b.sheetnames:
+        return [f"feuilles : attendu {noms_a}, obtenu {wb_b.sheetnames}"]
+
+    differences: List[str] = []
+    for nom in noms_a:
+        differences += _differences_feuille(wb_a[nom], wb_b[nom])
+    return differences
+
+
+def formater(differences: List[str]) -> str:
+    lignes = differences[:LIMITE_DIFF]
+    if len(differences) > LIMITE_DIFF:
+        lignes.append(f"… et {len(differences) - LIMITE_DIFF} autres différences")
+    return "\n".join(lignes)
+
+
+def _corpus() -> List[Path]:
+    return sorted(CORPUS_DIR.glob("*.csv"))
+
+
+def _reference(source: Path) -> Path:
+    return GOLDEN_DIR / f"{source.stem}.xlsx"
+
+
+_donnees: Dict[Path, ImportedData] = {}
+
+
+def _donnees_corpus(source: Path) -> ImportedData:
+    if source not in _donnees:
+        _donnees[source] = charger_donnees(source)
+    return _donnees[source]
+
+
+@pytest.mark.parametrize("moteur", sorted(MOTEURS))
+@pytest.mark.parametrize("source", _corpus(), ids=lambda source: source.stem)
+def test_classeur_complet(source, moteur):
+    obtenu = MOTEURS[moteur](_donnees_corpus(source), list(FICHIERS))
+    differences = comparer_classeurs(_reference(source), obtenu)
+    assert not differences, f"{moteur} / {source.name} :\n{formater(differences)}"
+
+
+@pytest.mark.parametrize("fichier", FICHIERS)
+@pytest.mark.parametrize("source", _corpus(), ids=lambda source: source.stem)
+def test_feuille_seule(source, fichier):
+    # Chemin de la pré-génération et du cache : une feuille par classeur
+    obtenu = _sequentiel(_donnees_corpus(source), [fichier])
+    differences = comparer_classeurs(_reference(source), obtenu, [fichier])
+    assert not differences, f"{fichier} / {source.name} :\n{formater(differences)}"
+
+
+def regenerer_references():
+    for source in _corpus():
+        _reference(source).write_bytes(_sequentiel(charger_donnees(source), list(FICHIERS)).getvalue())
+        print(f"{_reference(source).name} régénéré")
+
+
+def afficher_differences(moteurs: List[str]) -> int:
+    echecs = 0
+    for source in _corpus():
+        data = charger_donnees(source)
+        for moteur in moteurs:
+            differences = comparer_classeurs(_reference(source), MOTEURS[moteur](data, list(FICHIERS)))
+            statut = "identique" if not differences else f"{len(differences)} différences"
+            print(f"{source.stem:<28} {moteur:<12} {statut}")
+            if differences:
+                echecs += 1
+                print(formater(differences))
+    return echecs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--regenerer", action="store_true", help="réécrit les classeurs de référence")
+    parser.add_argument("--diff", action="store_true", help="affiche les différences de chaque moteur")
+    parser.add_argument("--moteurs", default=",".join(MOTEURS), help="moteurs comparés avec --diff")
+    args = parser.parse_args()
+    if args.regenerer:
+        regenerer_references()
+    if args.diff or not args.regenerer:
+        raise SystemExit(1 if afficher_differences(args.moteurs.split(",")) else 0)
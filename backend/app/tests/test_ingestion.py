@@ -0,0 +1,76 @@
+"""Parsing en flux d'un corps de requête : données identiques, client déconnecté en cours de corps"""
+import asyncio
+import csv
+import threading
+from io import StringIO
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from app.services.csv_parser import CSVParser
+from app.services.dialect import TAILLE_ECHANTILLON
+from app.services.ingestion import FluxBlocs, parser_en_flux
+from app.utils.synthetic import generer_csv
+
+CONTENU = generer_csv(150, 30).encode("utf-8")
+TAILLE_BLOC = 4096
+
+
+async def _blocs(contenu: bytes, coupure: int = None):
+    for debut in range(0, len(contenu), TAILLE_BLOC):
+        if coupure is not None and debut >= coupure:
+            raise ClientDisconnect()
+        yield contenu[debut:debut + TAILLE_BLOC]
+        await asyncio.sleep(0)
+
+
+def test_donnees_identiques_au_parsing_complet():
+    assert len(CONTENU) > 2 * TAILLE_ECHANTILLON
+    data = asyncio.run(parser_en_flux(CSVParser(), _blocs(CONTENU)))
+    attendu = CSVParser()._parse_rows(csv.reader(StringIO(CONTENU.decode("utf-8")), delimiter=";"))
+    assert data == attendu
+
+
+class _ParserSuivi(CSVParser):
+    """Signale la fin du parsing, et ce que le thread a vu du flux"""
+
+    def __init__(self):
+        super().__init__()
+        self.termine = threading.Event()
+        self.erreur = None
+
+    def parse_stream(self, stream):
+        try:
+            return super().parse_stream(stream)
+        except BaseException as e:
+            self.erreur = e
+            raise
+        finally:
+            self.termine.set()
+
+
+def test_client_deconnecte_en_cours_de_corps():
+    parser = _ParserSuivi()
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(parser_en_flux(parser, _blocs(CONTENU, coupure=2 * TAILLE_ECHANTILLON)))
+    # Thread de parsing terminé avant que l'erreur ne remonte, sans conclure sur le corps tronqué
+    assert parser.termine.is_set()
+    assert parser.erreur is not None
+
+
+def test_interruption_debloque_le_lecteur():
+    flux = FluxBlocs()
+    lu = []
+
+    def lire():
+        try:
+            flux.read(10)
+        except ConnectionAbortedError as e:
+            lu.append(e)
+
+    lecteur = threading.Thread(target=lire, daemon=True)
+    lecteur.start()
+    flux.interrompre()
+    lecteur.join(5)
+    assert not lecteur.is_alive()
+    assert len(lu) == 1
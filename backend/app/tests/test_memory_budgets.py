@@ -0,0 +1,116 @@
+"""Budgets mémoire par étape du pipeline (parsing, génération des feuilles, sauvegarde)
+
+Chaque étape est exécutée sous tracemalloc sur des immeubles synthétiques de
+taille fixe ; son pic d'allocation est comparé aux budgets versionnés dans
+memory_budgets.json (pic absolu par taille, et octets par lot).
+
+Après une évolution volontaire de la consommation mémoire, régénérer la
+référence puis relire le diff avant de le committer :
+
+    cd backend && python -m app.tests.test_memory_budgets
+"""
+import json
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import pytest
+from openpyxl import Workbook
+
+from app.services.csv_parser import CSVParser
+from app.services.xlsx_writer import save_workbook
+from app.utils.synthetic import generer_csv
+
+BUDGETS_PATH = Path(__file__).with_name("memory_budgets.json")
+
+# Marge appliquée aux mesures lors de la régénération de la référence
+MARGE = 1.5
+
+
+def _pic(fonction: Callable):
+    """Exécute la fonction et retourne (résultat, pic d'allocation en octets)"""
+    tracemalloc.reset_peak()
+    avant = tracemalloc.get_traced_memory()[0]
+    resultat = fonction()
+    return resultat, tracemalloc.get_traced_memory()[1] - avant
+
+
+def mesurer(taille: str) -> Tuple[int, Dict[str, int]]:
+    """Mesure le pic de chaque étape sur un immeuble « étages x lots par étage »"""
+    nb_etages, lots_par_etage = (int(v) for v in taille.split("x"))
+    raw = generer_csv(nb_etages, lots_par_etage, seed=0).encode("utf-8")
+    parser = CSVParser()
+    wb = Workbook()
+    pics: Dict[str, int] = {}
+
+    tracemalloc.start()
+    try:
+        data, pics["parse"] = _pic(lambda: parser.parse_stream(BytesIO(raw)))
+        for etape, generateur in (
+            ("quotation", parser.generer_xlxs_quotation),
+            ("voix", parser.generer_xlxs_voix),
+            ("ta", parser.generer_xlxs_ta),
+            ("tr_n", parser.generer_excel_tr_n),
+            ("tr_c", parser.generate_excel_tr_c),
+        ):
+            _, pics[etape] = _pic(lambda: generateur(data, wb))
+        wb.remove(wb["Sheet"])
+        _, pics["save"] = _pic(lambda: save_workbook(wb))
+    finally:
+        tracemalloc.stop()
+
+    nb_lots = sum(len(etage.lots) for etage in data.etages)
+    return nb_lots, pics
+
+
+def _charger_budgets() -> dict:
+    with open(BUDGETS_PATH, encoding="utf-8") as fichier:
+        return json.load(fichier)
+
+
+BUDGETS = _charger_budgets()
+
+
+@pytest.fixture(scope="module", params=sorted(BUDGETS["tailles"]))
+def mesures(request):
+    return request.param, mesurer(request.param)
+
+
+@pytest.mark.parametrize("etape", BUDGETS["etapes"])
+def test_budget_memoire(mesures, etape):
+    taille, (nb_lots, pics) = mesures
+    pic = pics[etape]
+    budget = BUDGETS["tailles"][taille][etape]
+    assert pic <= budget * 1024, (
+        f"{etape} sur {taille} : pic de {pic // 1024} Ko, budget de {budget} Ko"
+    )
+    par_lot = BUDGETS["octets_par_lot"][etape]
+    assert pic / nb_lots <= par_lot, (
+        f"{etape} sur {taille} : {pic / nb_lots:.0f} octets par lot, budget de {par_lot}"
+    )
+
+
+def regenerer_budgets():
+    """Réécrit memory_budgets.json à partir des mesures courantes (avec MARGE)"""
+    budgets = {
+        "version": BUDGETS["version"] + 1,
+        "marge": MARGE,
+        "etapes": BUDGETS["etapes"],
+        "tailles": {},
+        "octets_par_lot": {},
+    }
+    for taille in sorted(BUDGETS["tailles"]):
+        nb_lots, pics = mesurer(taille)
+        budgets["tailles"][taille] = {etape: round(pics[etape] * MARGE / 1024) for etape in budgets["etapes"]}
+        for etape in budgets["etapes"]:
+            par_lot = round(pics[etape] * MARGE / nb_lots)
+            budgets["octets_par_lot"][etape] = max(budgets["octets_par_lot"].get(etape, 0), par_lot)
+
+    with open(BUDGETS_PATH, "w", encoding="utf-8") as fichier:
+        json.dump(budgets, fichier, indent=2)
+        fichier.write("\n")
+
+
+if __name__ == "__main__":
+    regenerer_budgets()
@@ -0,0 +1,95 @@
+"""Surfaces au format français : cellules, colonnes et parsing complet d'un fichier TB"""
+import csv
+from io import StringIO
+from typing import Callable, List
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.csv_parser import CSVParser
+from app.services.nombres import convertir_colonne, nombre
+from app.utils.synthetic import generer_lignes
+
+
+@pytest.mark.parametrize("cellule, attendu", [
+    ("12.5", 12.5),
+    (" 7 ", 7.0),
+    ("1e-05", 1e-05),
+    ("12,50", 12.5),
+    ("1 234,50", 1234.5),
+    ("1\u00a0234,50", 1234.5),
+    ("1\u202f234,50", 1234.5),
+    ("1'234,50", 1234.5),
+    ("1.234,50", 1234.5),
+    ("1 234 567,25", 1234567.25),
+    ("1 234.50", 1234.5),
+    ("1,234.50", 1234.5),
+    ("1,234,567", 1234567.0),
+    ("1,234", 1.234),
+    ("-4,5", -4.5),
+    ("", None),
+    ("  ", None),
+    ("nan", None),
+    ("inf", None),
+    ("1_000", None),
+    ("12 50", None),
+    ("12,5,3", None),
+    ("abc", None),
+])
+def test_nombre(cellule, attendu):
+    assert nombre(cellule) == attendu
+
+
+@pytest.mark.parametrize("cellules", [
+    ["1", "2.5", " 3 ", "1e2"],
+    ["1", "2,5", " 3 ", "-4,25"],
+    ["1", "2,5", "1 234,5", "3.5"],
+])
+def test_colonne_valide(cellules):
+    colonne = convertir_colonne(cellules)
+    assert colonne.valeurs == [nombre(cellule) for cellule in cellules]
+    assert colonne.invalides == []
+
+
+def test_colonne_invalides_avec_positions():
+    colonne = convertir_colonne(["1", "2,5", "x", "", "1\n2", "3"])
+    assert colonne.valeurs == [1.0, 2.5, None, None, None, 3.0]
+    assert colonne.invalides == [(2, "x"), (4, "1\n2")]
+
+
+def _csv(formater: Callable[[float], str]) -> str:
+    """CSV synthétique dont les surfaces (lots et totaux) sont écrites par `formater`"""
+    lignes: List[List[str]] = generer_lignes(6, 8)
+    for row in lignes:
+        if len(row) > 6 and row[5].isdigit():
+            # Multiplicateur exact au centième : les totaux restent cohérents
+            row[5], row[6] = (formater(int(cellule) * 13.25) for cellule in row[5:7])
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+    return buffer.getvalue()
+
+
+def _parser(contenu: str):
+    parser = CSVParser()
+    return parser._parse_rows(csv.reader(StringIO(contenu), delimiter=";")), parser.rapport
+
+
+def test_fichier_francais_identique():
+    reference, _ = _parser(_csv(lambda v: f"{v:.2f}"))
+    francais, rapport = _parser(_csv(lambda v: f"{v:,.2f}".replace(",", " ").replace(".", ",")))
+    assert rapport.valide, rapport.erreurs
+    assert francais == reference
+    assert max(etage.total_surface_avec_surplomb for etage in francais.etages) > 1000
+
+
+def test_surface_invalide_signalee_avec_position():
+    contenu = _csv(lambda v: f"{v:.2f}").splitlines()
+    numero = next(i for i, ligne in enumerate(contenu) if "Local Commercial" in ligne)
+    cellules = contenu[numero].split(";")
+    cellules[6] = "12,5x"
+    contenu[numero] = ";".join(cellules)
+
+    with pytest.raises(HTTPException) as erreur:
+        _parser("\n".join(contenu))
+    anomalie = next(e for e in erreur.value.detail["erreurs"] if e["code"] == "surface_invalide")
+    assert (anomalie["ligne"], anomalie["colonne"]) == (numero + 1, 7)
@@ -0,0 +1,100 @@
+"""Rendu parallèle : seuil du mode automatique, jamais dans un processus enfant, repli séquentiel si le pool casse"""
+import csv
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+
+import pytest
+
+from app.services import generation_hors_ligne, rendu_parallele
+from app.services.csv_parser import CSVParser
+from app.services.rendu_parallele import executeur_rendu
+from app.utils.synthetic import generer_csv
+
+FICHIERS = ["Quot P CH2", "TA"]
+
+
+class _PoolCasse:
+    """Pool dont les processus ont été tués : chaque bloc échoue"""
+
+    def __init__(self):
+        self.soumis = 0
+        self.arrete = False
+
+    def submit(self, *args, **kwargs):
+        self.soumis += 1
+        future = Future()
+        future.set_exception(BrokenProcessPool("processus de rendu tué"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.arrete = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Pool factice à la place du pool de processus : aucun processus n'est lancé"""
+    pool = object()
+    monkeypatch.setattr(rendu_parallele, "_executeur", pool)
+    monkeypatch.setattr(rendu_parallele, "SEUIL_ETAGES", 10)
+    monkeypatch.setattr(rendu_parallele, "WORKERS", 4)
+    return pool
+
+
+@pytest.fixture(scope="module")
+def data():
+    return CSVParser()._parse_rows(csv.reader(StringIO(generer_csv(6, 4)), delimiter=";"))
+
+
+def test_seuil_du_mode_automatique(pool, monkeypatch):
+    assert executeur_rendu(9) is None
+    assert executeur_rendu(10) is pool
+    # Choix explicite prioritaire
+    assert executeur_rendu(500, parallele=False) is None
+    assert executeur_rendu(1, parallele=True) is pool
+
+    monkeypatch.setattr(rendu_parallele, "SEUIL_ETAGES", 0)
+    assert executeur_rendu(500) is None
+    monkeypatch.setattr(rendu_parallele, "SEUIL_ETAGES", 10)
+    monkeypatch.setattr(rendu_parallele, "WORKERS", 1)
+    assert executeur_rendu(500) is None
+
+
+def _mode_automatique(nb_etages: int) -> bool:
+    return executeur_rendu(nb_etages) is not None
+
+
+def test_jamais_automatique_dans_un_processus_enfant(monkeypatch):
+    # Lus par l'enfant à l'import du module
+    monkeypatch.setenv("RENDU_PARALLELE_SEUIL_ETAGES", "10")
+    monkeypatch.setenv("RENDU_PARALLELE_WORKERS", "4")
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executeur:
+        assert executeur.submit(_mode_automatique, 500).result() is False
+
+
+def test_generation_hors_ligne_sequentielle(tmp_path, monkeypatch):
+    source = tmp_path / "tb.csv"
+    source.write_text(generer_csv(3, 2), encoding="utf-8")
+    demandes = []
+
+    def executeur_suivi(nb_etages, parallele=None):
+        demandes.append(parallele)
+        return None
+
+    monkeypatch.setattr("app.services.csv_parser.executeur_rendu", executeur_suivi)
+    resultat = generation_hors_ligne.generer_source(str(source), "empreinte", FICHIERS, str(tmp_path))
+    assert resultat.erreur is None
+    assert demandes == [False]
+
+
+def test_repli_sequentiel_si_le_pool_casse(data, monkeypatch):
+    casse = _PoolCasse()
+    monkeypatch.setattr(rendu_parallele, "_executeur", casse)
+
+    classeur = CSVParser().generer_classeur(data, FICHIERS, parallele=True).getvalue()
+    assert casse.soumis > 0
+    assert casse.arrete
+    # Pool recréé à la prochaine demande
+    assert rendu_parallele._executeur is None
+    assert classeur == CSVParser().generer_classeur(data, FICHIERS, parallele=False).getvalue()
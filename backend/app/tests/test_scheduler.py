@@ -0,0 +1,170 @@
+"""Contrôle d'admission : plus court d'abord, vieillissement, voie lourde bornée, 503, admission sans attente
+
+Les travaux bloqués attendent dans des threads ; chaque test attend
+explicitement l'état voulu de la file (métriques) avant d'agir, avec un
+petit budget pour que l'ordre d'admission soit entièrement déterminé.
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import scheduler
+from app.services.scheduler import LOURDE, RAPIDE, Ordonnanceur
+
+DELAI = 5
+
+
+def _attendre(condition: Callable[[], bool]):
+    limite = time.monotonic() + DELAI
+    while not condition():
+        assert time.monotonic() < limite, "état attendu non atteint"
+        time.sleep(0.001)
+
+
+class _Travail:
+    """Demande d'admission bloquante, dans un thread"""
+
+    def __init__(self, ordonnanceur: Ordonnanceur, cout: int):
+        self.ordonnanceur = ordonnanceur
+        self.ticket = None
+        self.erreur: Optional[HTTPException] = None
+        self.admis = threading.Event()
+        self._thread = threading.Thread(target=self._acquerir, args=(cout,), daemon=True)
+        self._thread.start()
+
+    def _acquerir(self, cout: int):
+        try:
+            self.ticket = self.ordonnanceur.acquerir(cout)
+        except HTTPException as e:
+            self.erreur = e
+        self.admis.set()
+
+    def liberer(self):
+        self.admis.wait(DELAI)
+        self.ordonnanceur.liberer(self.ticket)
+        self._thread.join(DELAI)
+
+
+def _en_attente(ordonnanceur: Ordonnanceur, voie: str = RAPIDE) -> int:
+    return ordonnanceur.metriques().voies[voie].en_attente
+
+
+def _ordonnanceur(**parametres) -> Ordonnanceur:
+    return Ordonnanceur(**{"budget": 10, "seuil_lourd": 100, "lourds_max": 1, "file_lourde_max": 1, **parametres})
+
+
+def _mettre_en_file(ordonnanceur: Ordonnanceur, couts, voie: str = RAPIDE):
+    travaux = []
+    for cout in couts:
+        travaux.append(_Travail(ordonnanceur, cout))
+        # Un par un : l'ordre d'arrivée est celui de la liste
+        _attendre(lambda: _en_attente(ordonnanceur, voie) == len(travaux))
+    return travaux
+
+
+@pytest.fixture
+def sans_vieillissement(monkeypatch):
+    monkeypatch.setattr(scheduler, "VIEILLISSEMENT", float("inf"))
+
+
+def test_plus_court_d_abord(sans_vieillissement):
+    ordonnanceur = _ordonnanceur()
+    occupe = ordonnanceur.acquerir(10)
+    long, court, moyen = _mettre_en_file(ordonnanceur, [8, 3, 5])
+
+    ordonnanceur.liberer(occupe)
+    _attendre(lambda: court.admis.is_set() and moyen.admis.is_set())
+    assert not long.admis.is_set()
+    assert ordonnanceur.metriques().cout_en_vol == 8
+
+    court.liberer()
+    moyen.liberer()
+    assert long.admis.wait(DELAI)
+    long.liberer()
+    assert ordonnanceur.metriques().cout_en_vol == 0
+
+
+def test_vieillissement_reserve_la_place_du_travail_ancien(monkeypatch):
+    # Tous les travaux en attente sont anciens : ordre d'arrivée
+    monkeypatch.setattr(scheduler, "VIEILLISSEMENT", 0.0)
+    ordonnanceur = _ordonnanceur()
+    occupe = ordonnanceur.acquerir(10)
+    ancien, court = _mettre_en_file(ordonnanceur, [8, 3])
+
+    ordonnanceur.liberer(occupe)
+    assert ancien.admis.wait(DELAI)
+    # 3 tiendrait avant 8, mais ne double plus le travail ancien ; 8 + 3 dépasse le budget
+    assert not court.admis.is_set()
+
+    ancien.liberer()
+    assert court.admis.wait(DELAI)
+    court.liberer()
+
+
+def test_voie_lourde_bornee(monkeypatch):
+    # Le travail lourd ancien, bloqué par la voie pleine, ne bloque pas la voie rapide
+    monkeypatch.setattr(scheduler, "VIEILLISSEMENT", 0.0)
+    ordonnanceur = _ordonnanceur(budget=10_000)
+    lourd = ordonnanceur.acquerir(500)
+    (second,) = _mettre_en_file(ordonnanceur, [600], LOURDE)
+    assert not second.admis.is_set()
+
+    rapide = ordonnanceur.acquerir(50)
+    assert ordonnanceur.metriques().voies[RAPIDE].en_cours == 1
+    ordonnanceur.liberer(rapide)
+
+    ordonnanceur.liberer(lourd)
+    assert second.admis.wait(DELAI)
+    assert ordonnanceur.metriques().voies[LOURDE].en_cours == 1
+    second.liberer()
+
+
+def test_file_lourde_pleine_503(sans_vieillissement):
+    ordonnanceur = _ordonnanceur(budget=10_000)
+    lourd = ordonnanceur.acquerir(500)
+    (en_file,) = _mettre_en_file(ordonnanceur, [500], LOURDE)
+
+    with pytest.raises(HTTPException) as erreur:
+        ordonnanceur.acquerir(500)
+    assert erreur.value.status_code == 503
+    assert erreur.value.headers == {"Retry-After": "10"}
+    assert ordonnanceur.metriques().voies[LOURDE].rejetes == 1
+
+    # La voie rapide reste ouverte
+    ordonnanceur.liberer(ordonnanceur.acquerir(10))
+    ordonnanceur.liberer(lourd)
+    en_file.liberer()
+
+
+def test_essayer_acquerir(sans_vieillissement):
+    ordonnanceur = _ordonnanceur()
+    ticket = ordonnanceur.essayer_acquerir(4)
+    assert ticket is not None
+    assert ordonnanceur.essayer_acquerir(7) is None
+    plein = ordonnanceur.essayer_acquerir(6)
+    assert plein is not None
+    # Jamais seul au-delà du budget, contrairement à acquerir
+    ordonnanceur.liberer(ticket)
+    ordonnanceur.liberer(plein)
+    assert ordonnanceur.essayer_acquerir(11) is None
+
+    # Refusée dès qu'un travail attend, même si le budget suffit
+    occupe = ordonnanceur.acquerir(8)
+    (en_file,) = _mettre_en_file(ordonnanceur, [5])
+    assert ordonnanceur.essayer_acquerir(1) is None
+    ordonnanceur.liberer(occupe)
+    en_file.liberer()
+    assert ordonnanceur.metriques().cout_en_vol == 0
+
+
+def test_travail_plus_gros_que_le_budget_passe_seul(sans_vieillissement):
+    ordonnanceur = _ordonnanceur()
+    petit = ordonnanceur.acquerir(2)
+    (enorme,) = _mettre_en_file(ordonnanceur, [50])
+    ordonnanceur.liberer(petit)
+    assert enorme.admis.wait(DELAI)
+    assert ordonnanceur.metriques().cout_en_vol == 50
+    enorme.liberer()
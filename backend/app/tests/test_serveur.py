@@ -0,0 +1,115 @@
+"""Serveur pré-forké : préchauffage avant le fork des workers, index du cache disque rouvert dans chaque worker"""
+import gc
+import os
+import signal
+import threading
+
+import pytest
+
+from app import serveur
+from app.services import rendu_parallele
+
+
+@pytest.fixture
+def demarrage(monkeypatch):
+    """Démarrage de main() sans processus : forks, signaux et attente simulés, dans l'ordre"""
+    evenements = []
+    gestionnaires = {}
+    enfants = iter(range(1000, 2000))
+
+    def prechauffer():
+        evenements.append("prechauffage")
+        return {"generation": 1.0}
+
+    def fork():
+        evenements.append("fork")
+        return next(enfants)
+
+    arretes = []
+
+    def wait():
+        # Tous les workers lancés : arrêt demandé (SIGTERM transmis à chacun), puis fin de chaque worker
+        if not arretes:
+            gestionnaires[signal.SIGTERM](signal.SIGTERM, None)
+        return arretes.pop(), 0
+
+    def kill(pid, signum):
+        arretes.append(pid)
+
+    monkeypatch.setattr(serveur, "prechauffer", prechauffer)
+    monkeypatch.setattr(serveur.os, "fork", fork)
+    monkeypatch.setattr(serveur.os, "wait", wait)
+    monkeypatch.setattr(serveur.os, "kill", kill)
+    monkeypatch.setattr(serveur.signal, "signal", gestionnaires.__setitem__)
+    monkeypatch.setattr(serveur.gc, "freeze", lambda: evenements.append("gc.freeze"))
+    yield evenements
+    gc.unfreeze()
+
+
+def test_prechauffage_avant_le_fork(demarrage):
+    assert serveur.main(["--port", "0", "--workers", "3"]) == 0
+    assert demarrage == ["prechauffage", "gc.freeze", "fork", "fork", "fork"]
+
+
+def test_sans_prechauffage(demarrage):
+    assert serveur.main(["--port", "0", "--workers", "2", "--sans-prechauffage"]) == 0
+    assert demarrage == ["gc.freeze", "fork", "fork"]
+
+
+def test_prechauffage_sans_pool_ni_thread(monkeypatch):
+    # Seuil abaissé : l'immeuble du préchauffage passerait en rendu parallèle
+    monkeypatch.setattr(rendu_parallele, "_executeur", None)
+    monkeypatch.setattr(rendu_parallele, "SEUIL_ETAGES", 1)
+    monkeypatch.setattr(rendu_parallele, "WORKERS", 4)
+    avant = threading.active_count()
+    durees = serveur.prechauffer()
+    assert set(durees) == {"modele", "generation"}
+    # Rien ne doit être hérité à moitié par les workers forkés
+    assert rendu_parallele._executeur is None
+    assert threading.active_count() == avant
+
+
+class _ServeurDuWorker:
+    """Remplace uvicorn.Server dans le worker forké : vérifie le cache disque et écrit le bilan dans un tube"""
+
+    tube = None
+
+    def __init__(self, config):
+        pass
+
+    def run(self, sockets):
+        from app.services.disk_cache import cache_disque
+
+        try:
+            bilan = [
+                cache_disque._db is None,
+                cache_disque.lire("parent") == b"classeur du parent",
+                cache_disque._db is not None,
+            ]
+            cache_disque.ajouter("worker", b"classeur du worker", ".xlsx")
+            message = "ok" if all(bilan) else f"bilan {bilan}"
+        except Exception as e:
+            message = repr(e)
+        os.write(self.tube, message.encode("utf-8"))
+
+
+def test_worker_rouvre_l_index_du_cache_disque(cache_disque, monkeypatch):
+    cache_disque.ajouter("parent", b"classeur du parent", ".xlsx")
+    connexion_du_parent = cache_disque._db
+    lecture, ecriture = os.pipe()
+    monkeypatch.setattr(_ServeurDuWorker, "tube", ecriture)
+    monkeypatch.setattr(serveur.uvicorn, "Server", _ServeurDuWorker)
+
+    pid = os.fork()
+    if pid == 0:
+        serveur._worker(None, None)
+    os.close(ecriture)
+    _, statut = os.waitpid(pid, 0)
+    with os.fdopen(lecture, "rb") as tube:
+        assert tube.read().decode("utf-8") == "ok"
+    assert os.waitstatus_to_exitcode(statut) == 0
+
+    # Connexion du parent intacte, écriture du worker visible
+    assert cache_disque._db is connexion_du_parent
+    assert cache_disque.lire("worker") == b"classeur du worker"
+    assert cache_disque.lire("parent") == b"classeur du parent"
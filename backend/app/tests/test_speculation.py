@@ -0,0 +1,184 @@
+"""Pré-génération après upload : abandon sous charge, annulation au nouvel upload, téléchargement servi
+
+Chaque test utilise sa propre instance de Speculation et son propre
+ordonnanceur ; le seul thread de spéculation est bloqué ou vidé
+explicitement, pour que l'ordre des générations soit déterminé.
+"""
+import csv
+import threading
+import uuid
+from io import StringIO
+
+import pytest
+
+from app.services import speculation as module_speculation
+from app.services.cache import cache_classeurs, cle_classeur
+from app.services.csv_parser import CSVParser
+from app.services.scheduler import Ordonnanceur
+from app.services.speculation import Speculation, generer_classeur_en_cache
+from app.utils.synthetic import generer_csv
+
+DELAI = 5
+
+
+@pytest.fixture(scope="module")
+def data():
+    return CSVParser()._parse_rows(csv.reader(StringIO(generer_csv(3, 4)), delimiter=";"))
+
+
+@pytest.fixture
+def ordonnanceur(monkeypatch):
+    ordonnanceur = Ordonnanceur(budget=1000, seuil_lourd=10_000, lourds_max=1, file_lourde_max=1)
+    monkeypatch.setattr(module_speculation, "ordonnanceur", ordonnanceur)
+    return ordonnanceur
+
+
+@pytest.fixture
+def speculation(monkeypatch):
+    speculation = Speculation()
+    monkeypatch.setattr(module_speculation, "speculation", speculation)
+    yield speculation
+    speculation._executeur.shutdown(wait=True, cancel_futures=True)
+
+
+def _empreinte() -> str:
+    # Propre au test : le cache des classeurs en mémoire est partagé
+    return uuid.uuid4().hex
+
+
+def _vider(speculation: Speculation):
+    """Attend la fin des spéculations planifiées (un seul thread, file FIFO)"""
+    speculation._executeur.submit(lambda: None).result(DELAI)
+
+
+def _bloquer(speculation: Speculation) -> threading.Event:
+    """Occupe le thread de spéculation jusqu'à ce que l'événement soit levé"""
+    debloquer = threading.Event()
+    demarre = threading.Event()
+
+    def bloquer():
+        demarre.set()
+        debloquer.wait(DELAI)
+
+    speculation._executeur.submit(bloquer)
+    assert demarre.wait(DELAI)
+    return debloquer
+
+
+def _en_cache(empreinte: str):
+    return [f for f in CSVParser.excel_key if cache_classeurs.contient(cle_classeur(empreinte, [f], None))]
+
+
+def test_feuilles_generees_en_cache(data, ordonnanceur, speculation):
+    empreinte = _empreinte()
+    speculation.lancer(data, empreinte)
+    _vider(speculation)
+
+    assert speculation.terminees == len(CSVParser.excel_key)
+    assert _en_cache(empreinte) == list(CSVParser.excel_key)
+    assert ordonnanceur.metriques().cout_en_vol == 0
+
+
+def test_abandon_sous_charge(data, ordonnanceur, speculation):
+    # Budget entièrement pris par des requêtes : essayer_acquerir refuse
+    occupe = ordonnanceur.acquerir(ordonnanceur.budget)
+    empreinte = _empreinte()
+    speculation.lancer(data, empreinte)
+    _vider(speculation)
+    ordonnanceur.liberer(occupe)
+
+    assert speculation.terminees == 0
+    assert speculation.abandonnees == len(CSVParser.excel_key)
+    assert _en_cache(empreinte) == []
+
+
+def test_nouvel_upload_annule_la_speculation_precedente(data, ordonnanceur, speculation):
+    ancienne, nouvelle = _empreinte(), _empreinte()
+    debloquer = _bloquer(speculation)
+    speculation.lancer(data, ancienne)
+    speculation.lancer(data, nouvelle)
+    # Les feuilles de l'ancien jeu, encore en file, sont annulées
+    assert speculation.abandonnees == len(CSVParser.excel_key)
+    assert {cle[0] for cle in speculation._en_cours} == {nouvelle}
+
+    debloquer.set()
+    _vider(speculation)
+    assert _en_cache(ancienne) == []
+    assert _en_cache(nouvelle) == list(CSVParser.excel_key)
+
+
+def test_meme_upload_ne_replanifie_pas(data, ordonnanceur, speculation):
+    empreinte = _empreinte()
+    debloquer = _bloquer(speculation)
+    speculation.lancer(data, empreinte)
+    speculation.lancer(data, empreinte)
+    assert speculation.abandonnees == 0
+    assert len(speculation._en_cours) == len(CSVParser.excel_key)
+    debloquer.set()
+    _vider(speculation)
+    assert speculation.terminees == len(CSVParser.excel_key)
+
+
+def _compter_generations(monkeypatch):
+    appels = []
+    generer = CSVParser.generer_classeur
+
+    def generer_compte(self, data, fichiers, *args, **kwargs):
+        appels.append(tuple(fichiers))
+        return generer(self, data, fichiers, *args, **kwargs)
+
+    monkeypatch.setattr(CSVParser, "generer_classeur", generer_compte)
+    return appels
+
+
+def test_telechargement_servi_par_la_speculation(data, ordonnanceur, speculation, monkeypatch):
+    empreinte = _empreinte()
+    speculation.lancer(data, empreinte)
+    _vider(speculation)
+
+    appels = _compter_generations(monkeypatch)
+    for fichier in CSVParser.excel_key:
+        classeur = generer_classeur_en_cache(data, [fichier], None, empreinte)
+        assert classeur.getvalue() == cache_classeurs.obtenir(cle_classeur(empreinte, [fichier], None)).getvalue()
+    assert appels == []
+
+
+def test_telechargement_attend_la_speculation_en_cours(data, ordonnanceur, speculation, monkeypatch):
+    """Feuille en cours de spéculation : la requête attend son résultat au lieu de la générer à nouveau"""
+    empreinte = _empreinte()
+    premiere = CSVParser.excel_key[0]
+    appels = _compter_generations(monkeypatch)
+    generer = CSVParser.generer_classeur
+    en_cours, reprendre = threading.Event(), threading.Event()
+
+    def generer_bloque(self, data, fichiers, *args, **kwargs):
+        en_cours.set()
+        reprendre.wait(DELAI)
+        return generer(self, data, fichiers, *args, **kwargs)
+
+    monkeypatch.setattr(CSVParser, "generer_classeur", generer_bloque)
+    speculation.lancer(data, empreinte)
+    assert en_cours.wait(DELAI)
+
+    attendre = speculation.attendre
+    attente = threading.Event()
+
+    def attendre_signale(cle):
+        attente.set()
+        return attendre(cle)
+
+    monkeypatch.setattr(speculation, "attendre", attendre_signale)
+    resultat = []
+    telechargement = threading.Thread(
+        target=lambda: resultat.append(generer_classeur_en_cache(data, [premiere], None, empreinte))
+    )
+    telechargement.start()
+    # La requête a manqué le cache et rejoint la spéculation, toujours bloquée
+    assert attente.wait(DELAI)
+    reprendre.set()
+    telechargement.join(DELAI)
+
+    assert resultat and resultat[0].getvalue()
+    # Une seule génération de la première feuille : celle de la spéculation
+    assert appels.count((premiere,)) == 1
+    _vider(speculation)
@@ -0,0 +1,205 @@
+"""Dossier surveillé : délai de stabilité, redémarrage sur l'état enregistré, scrutation sans inotify,
+processus de génération tué"""
+import csv
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from app.services import surveillance
+from app.services.generation_hors_ligne import ERREUR_PROCESSUS, EtatGeneration, generer_source
+from app.services.surveillance import Surveillant, _Scrutation
+from app.utils.synthetic import generer_lignes
+
+DELAI = 10
+
+
+def _ecrire_tb(chemin: Path, titre_foncier: str, seed: int = 0) -> Path:
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(generer_lignes(2, 3, titre_foncier=titre_foncier, seed=seed))
+    chemin.write_text(buffer.getvalue(), encoding="utf-8")
+    return chemin
+
+
+def _attendre(condition):
+    limite = time.monotonic() + DELAI
+    while not condition():
+        assert time.monotonic() < limite, "délai dépassé"
+        time.sleep(0.05)
+
+
+class _Executeur:
+    """Pool factice : garde les fichiers soumis, sans les générer"""
+
+    def __init__(self):
+        self.soumis = []
+
+    def submit(self, fonction, source, *args):
+        self.soumis.append(Path(source).name)
+        return Future()
+
+
+@pytest.fixture
+def dossiers(tmp_path):
+    depot, sortie = tmp_path / "depot", tmp_path / "classeurs"
+    depot.mkdir()
+    sortie.mkdir()
+    return depot, sortie
+
+
+@pytest.fixture
+def surveillant(dossiers):
+    depot, sortie = dossiers
+    return Surveillant(depot, sortie, ["Voix"], workers=1, scrutation=True)
+
+
+def test_fichier_traite_apres_le_delai_de_stabilite(surveillant, dossiers, monkeypatch):
+    monkeypatch.setattr(surveillance, "DELAI_STABILITE", 60)
+    depot, sortie = dossiers
+    _ecrire_tb(depot / "a.csv", "1001 /01")
+    etat, executeur = EtatGeneration(sortie), _Executeur()
+
+    # Écriture en cours (changement récent) : pas encore soumis
+    surveillant._signaler({"a.csv", "notes.txt"})
+    surveillant._lancer_stables(etat, executeur)
+    assert executeur.soumis == []
+    assert list(surveillant._en_attente) == [depot / "a.csv"]
+
+    # Nouveau changement : le délai repart de zéro
+    surveillant._en_attente[depot / "a.csv"] = time.time() - 59
+    surveillant._signaler({"a.csv"})
+    surveillant._lancer_stables(etat, executeur)
+    assert executeur.soumis == []
+
+    surveillant._en_attente[depot / "a.csv"] = time.time() - 61
+    surveillant._lancer_stables(etat, executeur)
+    assert executeur.soumis == ["a.csv"]
+    assert surveillant._en_attente == {}
+    etat.fermer()
+
+
+def _executer(surveillant: Surveillant) -> threading.Thread:
+    fil = threading.Thread(target=surveillant.executer, daemon=True)
+    fil.start()
+    return fil
+
+
+def _arreter(surveillant: Surveillant, fil: threading.Thread):
+    surveillant.arret.set()
+    fil.join(DELAI)
+    assert not fil.is_alive()
+
+
+@pytest.fixture
+def delais_courts(monkeypatch):
+    monkeypatch.setattr(surveillance, "DELAI_STABILITE", 0.2)
+    monkeypatch.setattr(surveillance, "INTERVALLE_SCRUTATION", 0.1)
+
+
+def test_redemarrage_sans_regenerer(surveillant, dossiers, delais_courts):
+    depot, sortie = dossiers
+    _ecrire_tb(depot / "a.csv", "1001 /01")
+    fil = _executer(surveillant)
+    _attendre(lambda: surveillant.generes == 1)
+    _arreter(surveillant, fil)
+    classeur = sortie / "1001-01.xlsx"
+    genere_le = classeur.stat().st_mtime_ns
+
+    # Redémarrage : le dossier est relu, l'état enregistré évite la régénération
+    _ecrire_tb(depot / "b.csv", "1002 /02")
+    redemarre = Surveillant(depot, sortie, ["Voix"], workers=1, scrutation=True)
+    etat, executeur = EtatGeneration(sortie), _Executeur()
+    redemarre._relire_dossier()
+    for chemin in redemarre._en_attente:
+        redemarre._en_attente[chemin] = 0.0
+    redemarre._lancer_stables(etat, executeur)
+    assert executeur.soumis == ["b.csv"]
+    assert classeur.stat().st_mtime_ns == genere_le
+
+    # Contenu modifié pendant l'arrêt : régénéré
+    _ecrire_tb(depot / "a.csv", "1001 /01", seed=1)
+    redemarre._relire_dossier()
+    redemarre._en_attente[depot / "a.csv"] = 0.0
+    redemarre._lancer_stables(etat, executeur)
+    assert executeur.soumis == ["b.csv", "a.csv"]
+    etat.fermer()
+
+
+def test_scrutation_sans_inotify(dossiers, delais_courts, monkeypatch, caplog):
+    depot, sortie = dossiers
+
+    def inotify_indisponible(repertoire):
+        raise OSError(38, "inotify_init1")
+
+    monkeypatch.setattr(surveillance, "_Inotify", inotify_indisponible)
+    surveillant = Surveillant(depot, sortie, ["Voix"], workers=1)
+    observateur = surveillant._observateur()
+    assert isinstance(observateur, _Scrutation)
+    assert "inotify indisponible" in caplog.text
+
+    # Nouveau fichier, puis fichier modifié : signalés au passage suivant
+    _ecrire_tb(depot / "a.csv", "1001 /01")
+    assert observateur.attendre(DELAI) == {"a.csv"}
+    assert observateur.attendre(0.5) == set()
+    with open(depot / "a.csv", "a", encoding="utf-8") as fichier:
+        fichier.write("\n")
+    assert observateur.attendre(DELAI) == {"a.csv"}
+
+    # Boucle complète en scrutation : fichier déposé après le démarrage
+    fil = _executer(surveillant)
+    _ecrire_tb(depot / "b.csv", "1002 /02")
+    _attendre(lambda: surveillant.generes == 2)
+    _arreter(surveillant, fil)
+    assert sorted(p.name for p in sortie.glob("*.xlsx")) == ["1001-01.xlsx", "1002-02.xlsx"]
+
+
+def _future_cassee() -> Future:
+    future = Future()
+    future.set_exception(BrokenProcessPool("processus tué"))
+    return future
+
+
+def test_pool_casse_relance_une_fois(surveillant, dossiers):
+    depot, sortie = dossiers
+    chemin = _ecrire_tb(depot / "a.csv", "1001 /01")
+    etat = EtatGeneration(sortie)
+
+    surveillant._en_cours[chemin] = "empreinte", _future_cassee()
+    assert surveillant._publier_terminees(etat) is True
+    # Relancé dès le passage suivant, sans compter d'échec
+    assert surveillant._en_attente == {chemin: 0.0}
+    assert surveillant.echecs == 0
+
+    del surveillant._en_attente[chemin]
+    surveillant._en_cours[chemin] = "empreinte", _future_cassee()
+    assert surveillant._publier_terminees(etat) is True
+    assert surveillant._en_attente == {}
+    assert surveillant.echecs == 1
+    etat.fermer()
+
+
+def _generer_ou_tuer(source: str, *args):
+    """Exécuté dans le pool : le processus qui traite un fichier « tuer » meurt sans résultat"""
+    if "tuer" in Path(source).name:
+        os._exit(1)
+    return generer_source(source, *args)
+
+
+def test_processus_tue(surveillant, dossiers, delais_courts, monkeypatch, caplog):
+    depot, sortie = dossiers
+    monkeypatch.setattr(surveillance, "generer_source", _generer_ou_tuer)
+    _ecrire_tb(depot / "a-tuer.csv", "1001 /01")
+    fil = _executer(surveillant)
+    _attendre(lambda: surveillant.echecs == 1)
+
+    # Pool recréé : les fichiers suivants sont générés
+    _ecrire_tb(depot / "b.csv", "1002 /02")
+    _attendre(lambda: surveillant.generes == 1)
+    _arreter(surveillant, fil)
+    assert ERREUR_PROCESSUS in caplog.text
+    assert [p.name for p in sortie.glob("*.xlsx")] == ["1002-02.xlsx"]
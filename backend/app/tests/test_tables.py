@@ -0,0 +1,69 @@
+"""Tables lots / etages : cohérence avec les tableaux calculés et relecture des formats d'export"""
+import csv
+import zipfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+import pytest
+
+from app.services.calculs import calculer_quotation, calculer_tr_n, calculer_voix
+from app.services.csv_parser import CSVParser
+from app.services.tables import COLONNES_LOTS, calculer_tables, exporter_tables
+from app.utils.synthetic import generer_csv
+
+
+@pytest.fixture(scope="module")
+def data():
+    return CSVParser()._parse_rows(csv.reader(StringIO(generer_csv(8, 12)), delimiter=";"))
+
+
+def test_tables_reprennent_les_calculs(data):
+    tables = calculer_tables(data)
+    lots, etages = tables.lots, tables.etages
+
+    quotation = calculer_quotation(data)
+    assert lots["quot_part"] == [ligne.quot_part for etage in quotation.etages for ligne in etage.lignes]
+    assert etages["total_quots_parts"] == [etage.total_quots_parts for etage in quotation.etages]
+
+    voix = calculer_voix(data)
+    assert [nvi for nvi in lots["nvi"] if nvi is not None] == [
+        ligne.nvi for etage in voix.etages for ligne in etage.lignes
+    ]
+    assert etages["surface_commerces"] == [
+        int(etage.commerces) if etage.commerces is not None else None for etage in calculer_tr_n(data)
+    ]
+
+    nb_lots = sum(len(etage.lots) for etage in data.etages)
+    assert len(tables) == nb_lots
+    assert all(len(valeurs) == nb_lots for valeurs in lots.values())
+    assert set(lots["categorie"]) == {"commerce", "appartement", "commune"}
+
+
+def test_export_csv(data):
+    archive = zipfile.ZipFile(exporter_tables(calculer_tables(data), "csv"))
+    assert archive.namelist() == ["lots.csv", "etages.csv"]
+
+    lignes = list(csv.DictReader(StringIO(archive.read("lots.csv").decode("utf-8"))))
+    assert list(lignes[0]) == [nom for nom, _ in COLONNES_LOTS]
+    assert [Decimal(l["quot_part"]) if l["quot_part"] else None for l in lignes] == calculer_tables(data).lots["quot_part"]
+
+
+def test_export_parquet(data):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    archive = zipfile.ZipFile(exporter_tables(calculer_tables(data), "parquet"))
+    table = parquet.read_table(BytesIO(archive.read("lots.parquet")))
+    assert table.column_names == [nom for nom, _ in COLONNES_LOTS]
+    assert table.column("quot_part").to_pylist() == calculer_tables(data).lots["quot_part"]
+
+
+def test_export_arrow_compresse(data):
+    ipc = pytest.importorskip("pyarrow.ipc")
+    archive = zipfile.ZipFile(exporter_tables(calculer_tables(data), "arrow"))
+    table = ipc.open_file(BytesIO(archive.read("lots.arrow"))).read_all()
+    assert table.column("quot_part").to_pylist() == calculer_tables(data).lots["quot_part"]
+
+    # Tampons compressés : pas les octets de l'écriture par défaut
+    sans_compression = BytesIO()
+    with ipc.new_file(sans_compression, table.schema) as writer:
+        writer.write_table(table)
+    assert archive.read("lots.arrow") != sans_compression.getvalue()
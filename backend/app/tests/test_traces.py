@@ -0,0 +1,231 @@
+"""Traces : échantillonnage et propagation de traceparent, forme OTLP/JSON, statut d'erreur, export fichier"""
+import json
+import os
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.services import traces
+from app.services.traces import (
+    PREFIXE_ATTRIBUTS,
+    SPAN_INTERNE,
+    SPAN_SERVEUR,
+    STATUT_ERREUR,
+    Exportateur,
+    MiddlewareTraces,
+    _echantillonner,
+    requete_otlp,
+    span,
+    trace,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+DELAI = 5
+
+
+class _Collecte:
+    """Exportateur de test : garde les traces terminées, sans thread"""
+
+    def __init__(self):
+        self.traces = []
+
+    def exporter(self, trace):
+        self.traces.append(trace)
+
+
+@pytest.fixture
+def collecte(monkeypatch):
+    collecte = _Collecte()
+    monkeypatch.setattr(traces, "ACTIF", True)
+    monkeypatch.setattr(traces, "exportateur", collecte)
+    return collecte
+
+
+def _spans(trace):
+    return {span.nom: span for span in trace.spans}
+
+
+@pytest.mark.parametrize("traceparent", [
+    f"00-{TRACE_ID}-{PARENT_ID}-01",
+    f" 00-{TRACE_ID.upper()}-{PARENT_ID}-03 ",
+])
+def test_traceparent_echantillonne_impose_la_trace(monkeypatch, traceparent):
+    monkeypatch.setattr(traces, "ECHANTILLONNAGE", 0.0)
+    assert _echantillonner(traceparent) == (TRACE_ID, PARENT_ID)
+
+
+def test_traceparent_non_echantillonne(monkeypatch):
+    monkeypatch.setattr(traces, "ECHANTILLONNAGE", 1.0)
+    assert _echantillonner(f"00-{TRACE_ID}-{PARENT_ID}-00") is None
+
+
+@pytest.mark.parametrize("traceparent", [None, "", "00-abc-def-01", f"01-{TRACE_ID}-{PARENT_ID}-01"])
+def test_sans_traceparent_valide_taux_d_echantillonnage(monkeypatch, traceparent):
+    monkeypatch.setattr(traces, "ECHANTILLONNAGE", 0.0)
+    assert _echantillonner(traceparent) is None
+
+    monkeypatch.setattr(traces, "ECHANTILLONNAGE", 1.0)
+    trace_id, parent = _echantillonner(traceparent)
+    assert len(trace_id) == 32 and int(trace_id, 16) >= 0
+    assert parent is None
+
+
+def test_taux_d_echantillonnage_intermediaire(monkeypatch):
+    monkeypatch.setattr(traces, "ECHANTILLONNAGE", 0.5)
+    monkeypatch.setattr(traces.random, "random", lambda: 0.49)
+    assert _echantillonner(None) is not None
+    monkeypatch.setattr(traces.random, "random", lambda: 0.5)
+    assert _echantillonner(None) is None
+
+
+def test_inactif_sans_destination(monkeypatch):
+    monkeypatch.setattr(traces, "ACTIF", False)
+    with trace("requete") as racine:
+        assert racine is None
+        with span("phase") as enfant:
+            assert enfant is None
+
+
+def test_spans_enfants_et_attributs(collecte):
+    with trace("requete", f"00-{TRACE_ID}-{PARENT_ID}-01", **{"url.path": "/upload"}) as racine:
+        with span("parsing", nb_lignes=12) as parsing:
+            with span("dialecte"):
+                traces.attribuer(delimiteur=";")
+        traces.attribuer(profil="complet")
+
+    (terminee,) = collecte.traces
+    spans = _spans(terminee)
+    assert set(spans) == {"requete", "parsing", "dialecte"}
+    assert racine.trace.id == TRACE_ID
+    assert racine.parent == PARENT_ID
+    assert spans["parsing"].parent == racine.id
+    assert spans["dialecte"].parent == parsing.id
+    assert racine.attributs == {"url.path": "/upload", PREFIXE_ATTRIBUTS + "profil": "complet"}
+    assert spans["dialecte"].attributs == {PREFIXE_ATTRIBUTS + "delimiteur": ";"}
+    assert all(s.debut <= s.fin for s in terminee.spans)
+    assert racine.traceparent == f"00-{TRACE_ID}-{racine.id}-01"
+
+
+def test_statut_d_erreur(collecte):
+    with pytest.raises(HTTPException):
+        with trace("requete"):
+            with pytest.raises(ValueError):
+                with span("parsing"):
+                    raise ValueError("ligne 3 invalide")
+            with span("rendu"):
+                pass
+            raise HTTPException(status_code=422, detail="Tableau invalide")
+
+    spans = _spans(collecte.traces[0])
+    assert spans["parsing"].erreur == "ValueError: ligne 3 invalide"
+    assert spans["rendu"].erreur is None
+    assert spans["requete"].erreur == "422 Tableau invalide"
+
+    otlp = {s["name"]: s for s in requete_otlp(collecte.traces)["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert otlp["parsing"]["status"] == {"code": STATUT_ERREUR, "message": "ValueError: ligne 3 invalide"}
+    assert otlp["requete"]["status"] == {"code": STATUT_ERREUR, "message": "422 Tableau invalide"}
+    assert "status" not in otlp["rendu"]
+
+
+def test_forme_otlp(collecte):
+    with trace("requete", f"00-{TRACE_ID}-{PARENT_ID}-01"):
+        with span("calcul", nb_etages=3, ratio=0.5, partiel=False, profil="complet"):
+            pass
+
+    corps = requete_otlp(collecte.traces)
+    (ressource,) = corps["resourceSpans"]
+    assert ressource["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": traces.SERVICE}}]
+    (portee,) = ressource["scopeSpans"]
+    assert portee["scope"] == {"name": "app.services.traces"}
+    spans = {s["name"]: s for s in portee["spans"]}
+
+    racine, calcul = spans["requete"], spans["calcul"]
+    assert racine["traceId"] == calcul["traceId"] == TRACE_ID
+    assert racine["kind"] == SPAN_SERVEUR and calcul["kind"] == SPAN_INTERNE
+    assert racine["parentSpanId"] == PARENT_ID
+    assert calcul["parentSpanId"] == racine["spanId"]
+    # Horodatages int64 : chaînes en JSON OTLP
+    assert isinstance(calcul["startTimeUnixNano"], str) and int(calcul["endTimeUnixNano"]) >= int(
+        calcul["startTimeUnixNano"]
+    )
+    assert calcul["attributes"] == [
+        {"key": "copro.nb_etages", "value": {"intValue": "3"}},
+        {"key": "copro.ratio", "value": {"doubleValue": 0.5}},
+        {"key": "copro.partiel", "value": {"boolValue": False}},
+        {"key": "copro.profil", "value": {"stringValue": "complet"}},
+    ]
+    # Sérialisable tel quel
+    assert json.loads(json.dumps(corps)) == corps
+
+
+def _application() -> FastAPI:
+    application = FastAPI()
+
+    @application.get("/ok")
+    def ok():
+        with span("phase"):
+            return {"ok": True}
+
+    @application.get("/erreur")
+    def erreur():
+        raise HTTPException(status_code=503, detail="Serveur saturé")
+
+    application.add_middleware(MiddlewareTraces)
+    return application
+
+
+def test_middleware_propage_traceparent(collecte):
+    client = TestClient(_application())
+    reponse = client.get("/ok", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+    assert reponse.status_code == 200
+
+    (terminee,) = collecte.traces
+    spans = _spans(terminee)
+    racine = spans["GET /ok"]
+    assert terminee.id == TRACE_ID
+    assert racine.parent == PARENT_ID
+    assert spans["phase"].parent == racine.id
+    assert racine.attributs["http.response.status_code"] == 200
+    assert reponse.headers["traceparent"] == f"00-{TRACE_ID}-{racine.id}-01"
+
+
+def test_middleware_non_echantillonne(collecte):
+    client = TestClient(_application())
+    reponse = client.get("/ok", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+    assert reponse.status_code == 200
+    assert "traceparent" not in reponse.headers
+    assert collecte.traces == []
+
+
+def test_middleware_erreur_serveur(collecte):
+    reponse = TestClient(_application()).get("/erreur")
+    assert reponse.status_code == 503
+    (racine,) = collecte.traces[0].spans
+    assert racine.erreur == "503"
+
+
+def test_export_fichier(tmp_path, monkeypatch):
+    """TRACES_FICHIER : une requête ExportTraceServiceRequest par ligne, écrite par le thread d'export"""
+    fichier = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACES_FICHIER", str(fichier))
+    monkeypatch.setattr(traces, "ACTIF", True)
+    monkeypatch.setattr(traces, "exportateur", Exportateur(os.getenv("TRACES_FICHIER"), None))
+
+    with trace("requete", f"00-{TRACE_ID}-{PARENT_ID}-01"):
+        with span("rendu", feuille="TA"):
+            pass
+
+    limite = time.monotonic() + DELAI
+    while not (fichier.exists() and fichier.read_text(encoding="utf-8").endswith("\n")):
+        assert time.monotonic() < limite, "trace non exportée"
+        time.sleep(0.01)
+
+    (ligne,) = fichier.read_text(encoding="utf-8").splitlines()
+    spans = json.loads(ligne)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert sorted(s["name"] for s in spans) == ["rendu", "requete"]
+    assert {s["traceId"] for s in spans} == {TRACE_ID}
+    rendu = next(s for s in spans if s["name"] == "rendu")
+    assert rendu["attributes"] == [{"key": "copro.feuille", "value": {"stringValue": "TA"}}]
@@ -0,0 +1,247 @@
+"""Validation des fichiers TB pendant le parsing : codes d'erreur et d'avertissement, rejet 422"""
+import csv
+from io import StringIO
+from typing import Callable, List
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.csv_parser import CSVParser
+from app.services.validation import Validateur
+from app.utils.synthetic import generer_lignes
+
+LOTS_PAR_ETAGE = 4
+# Ligne d'étage, lots privatifs, 3 parties communes, Total
+LIGNES_PAR_ETAGE = 1 + LOTS_PAR_ETAGE + 3 + 1
+PREMIER_ETAGE = 4
+
+
+def _ligne(etage: int, rang: int = 0) -> int:
+    """Index de la ligne `rang` de l'étage (0 : ligne d'étage, 1 : premier lot...)"""
+    return PREMIER_ETAGE + etage * LIGNES_PAR_ETAGE + rang
+
+
+def _total(etage: int) -> int:
+    return _ligne(etage, LIGNES_PAR_ETAGE - 1)
+
+
+def _rapport(modifier: Callable[[List[List[str]]], None] = lambda lignes: None):
+    lignes = generer_lignes(3, LOTS_PAR_ETAGE)
+    modifier(lignes)
+    parser = CSVParser(strict=False)
+    parser._parse_rows(lignes)
+    return parser.rapport
+
+
+def _codes(anomalies) -> List[tuple]:
+    return [(a.code, a.ligne, a.colonne) for a in anomalies]
+
+
+def test_fichier_valide():
+    rapport = _rapport()
+    assert rapport.valide
+    assert rapport.erreurs == rapport.avertissements == []
+
+
+def test_indice_privatif_duplique():
+    def modifier(lignes):
+        lignes[_ligne(1, 2)][3] = lignes[_ligne(0, 1)][3]
+
+    rapport = _rapport(modifier)
+    assert not rapport.valide
+    (erreur,) = rapport.erreurs
+    assert (erreur.code, erreur.ligne) == ("indice_duplique", _ligne(1, 2) + 1)
+    assert f"ligne {_ligne(0, 1) + 1}" in erreur.message
+
+
+def test_indice_commun_duplique_dans_l_etage():
+    def modifier(lignes):
+        lignes[_ligne(0, LOTS_PAR_ETAGE + 2)][4] = lignes[_ligne(0, LOTS_PAR_ETAGE + 1)][4]
+
+    rapport = _rapport(modifier)
+    assert rapport.valide
+    assert _codes(rapport.avertissements) == [("indice_duplique", _ligne(0, LOTS_PAR_ETAGE + 2) + 1, None)]
+
+
+@pytest.mark.parametrize("colonne", [6, 7])
+def test_surface_invalide(colonne):
+    def modifier(lignes):
+        lignes[_ligne(0, 1)][colonne - 1] = "12,5x"
+
+    rapport = _rapport(modifier)
+    erreurs = _codes(rapport.erreurs)
+    assert ("surface_invalide", _ligne(0, 1) + 1, colonne) in erreurs
+
+
+def test_surfaces_illisibles_relevees_a_la_conversion():
+    """Le Validateur reçoit les cellules invalides de convertir_colonne, sans les reconvertir"""
+    def modifier(lignes):
+        lignes[_ligne(0, 1)][5] = "12,5x"
+        lignes[_ligne(0, 1)][6] = "abc"
+        lignes[_ligne(1, 2)][6] = " 7 m² "
+        lignes[_ligne(2, 3)][6] = "   "
+
+    rapport = _rapport(modifier)
+    erreurs = [(e.ligne, e.colonne, e.message) for e in rapport.erreurs if e.code == "surface_invalide"]
+    assert erreurs == [
+        # Une erreur par ligne : la première colonne illisible
+        (_ligne(0, 1) + 1, 6, "Surface intérieure invalide : « 12,5x »"),
+        (_ligne(1, 2) + 1, 7, "Surface avec surplomb manquante ou invalide : « 7 m² »"),
+        (_ligne(2, 3) + 1, 7, "Surface avec surplomb manquante ou invalide : «  »"),
+    ]
+
+    # Cellule relevée à la conversion : signalée telle quelle, sans nouvelle lecture de la ligne
+    validateur = Validateur(lambda valeur: pytest.fail("surface relue"))
+    validateur.lot(12, ["", "", "", "A1", "", "10", "1O"], None, [(7, "1O")])
+    assert _codes(validateur.erreurs) == [("surface_invalide", 12, 7)]
+
+
+def test_surface_manquante_et_indice_manquant():
+    def modifier(lignes):
+        lignes[_ligne(0, 1)][5] = ""
+        lignes[_ligne(0, 2)][3] = ""
+
+    rapport = _rapport(modifier)
+    assert ("surface_manquante", _ligne(0, 1) + 1, None) in _codes(rapport.erreurs)
+    assert ("indice_manquant", _ligne(0, 2) + 1, None) in _codes(rapport.avertissements)
+
+
+@pytest.mark.parametrize("colonne", [6, 7])
+def test_total_incoherent(colonne):
+    def modifier(lignes):
+        total = lignes[_total(1)]
+        total[colonne - 1] = str(int(total[colonne - 1]) + 1)
+
+    rapport = _rapport(modifier)
+    assert _codes(rapport.erreurs) == [("total_incoherent", _total(1) + 1, colonne)]
+
+
+def test_total_absent_et_ligne_hors_etage():
+    def modifier(lignes):
+        # Total du dernier étage retiré ; une ligne de lot suit le Total du premier
+        del lignes[_total(2)]
+        lignes.insert(_total(0) + 1, list(lignes[_ligne(0, 1)]))
+
+    rapport = _rapport(modifier)
+    assert rapport.valide
+    codes = [(a.code, a.ligne) for a in rapport.avertissements]
+    assert ("ligne_hors_etage", _total(0) + 2) in codes
+    assert ("total_absent", _ligne(2) + 2) in codes
+
+
+def test_surplomb_inferieur():
+    def modifier(lignes):
+        lignes[_ligne(0, 1)][6] = "1"
+        # Totaux cohérents : seul l'avertissement est attendu
+        lignes[_total(0)][6] = ""
+
+    rapport = _rapport(modifier)
+    assert rapport.valide
+    assert [a.code for a in rapport.avertissements] == ["surplomb_inferieur"]
+
+
+def test_etage_vide():
+    def modifier(lignes):
+        lignes.insert(_ligne(1), ["", "Mezzanine : de la cote 3,00m à la cote 3,10m"])
+
+    rapport = _rapport(modifier)
+    assert _codes(rapport.avertissements) == [("etage_vide", _ligne(1) + 1, None)]
+
+
+@pytest.mark.parametrize("modifier, code", [
+    (lambda lignes: lignes.__delitem__(0), "titre_foncier_absent"),
+    (lambda lignes: lignes[0].__setitem__(1, "Titre foncier : "), "titre_foncier_vide"),
+    (lambda lignes: lignes[1].__setitem__(1, "Propriétés"), "entete_absente"),
+])
+def test_en_tete(modifier, code):
+    assert code in [e.code for e in _rapport(modifier).erreurs]
+
+
+def test_aucun_etage():
+    rapport = _rapport(lambda lignes: lignes.__delitem__(slice(PREMIER_ETAGE, None)))
+    assert [e.code for e in rapport.erreurs] == ["aucun_etage"]
+
+
+def test_aucune_partie_privative():
+    def modifier(lignes):
+        for ligne in lignes[PREMIER_ETAGE:]:
+            if len(ligne) > 3 and ligne[3]:
+                ligne[4], ligne[3] = ligne[3], ""
+
+    assert "aucune_partie_privative" in [e.code for e in _rapport(modifier).erreurs]
+
+
+def _surfaces_privatives(lignes, surface: str):
+    for ligne in lignes[PREMIER_ETAGE:]:
+        if len(ligne) > 6 and ligne[3]:
+            ligne[5] = ligne[6] = surface
+
+
+@pytest.mark.parametrize("surface", ["0", "0.004"])
+def test_surface_totale_nulle(surface):
+    """Surfaces toutes sous 0,005 m² : total nul au centième, comme dans les calculs"""
+    codes = [e.code for e in _rapport(lambda lignes: _surfaces_privatives(lignes, surface)).erreurs]
+    assert "surface_totale_nulle" in codes
+
+
+def test_surface_totale_nulle_422():
+    lignes = generer_lignes(3, LOTS_PAR_ETAGE)
+    _surfaces_privatives(lignes, "0.004")
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+
+    reponse = TestClient(app).post(
+        "/api/apercu", files={"file": ("tb.csv", buffer.getvalue().encode("utf-8"), "text/csv")}
+    )
+    assert reponse.status_code == 422
+    assert "surface_totale_nulle" in [e["code"] for e in reponse.json()["detail"]["erreurs"]]
+
+
+def test_mode_strict_rejette_avec_le_rapport():
+    lignes = generer_lignes(3, LOTS_PAR_ETAGE)
+    lignes[_ligne(0, 1)][6] = "abc"
+    with pytest.raises(HTTPException) as erreur:
+        CSVParser()._parse_rows(lignes)
+    assert erreur.value.status_code == 422
+    assert erreur.value.detail["valide"] is False
+    assert erreur.value.detail["erreurs"][0]["code"] == "surface_invalide"
+
+
+def test_reponse_422():
+    lignes = generer_lignes(3, LOTS_PAR_ETAGE)
+    lignes[_ligne(1, 2)][3] = lignes[_ligne(0, 1)][3]
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+
+    reponse = TestClient(app).post(
+        "/api/upload", files={"file": ("tb.csv", buffer.getvalue().encode("utf-8"), "text/csv")}
+    )
+    assert reponse.status_code == 422
+    detail = reponse.json()["detail"]
+    assert detail["message"] == "Fichier TB invalide"
+    assert detail["valide"] is False
+    assert detail["erreurs"] == [{
+        "ligne": _ligne(1, 2) + 1,
+        "colonne": None,
+        "code": "indice_duplique",
+        "message": f"L'indice privatif {lignes[_ligne(0, 1)][3]} est déjà utilisé ligne {_ligne(0, 1) + 1}",
+    }]
+    assert detail["avertissements"] == []
+
+
+def test_apercu_422():
+    lignes = generer_lignes(3, LOTS_PAR_ETAGE)
+    lignes[_ligne(0, 1)][6] = "abc"
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+
+    reponse = TestClient(app).post(
+        "/api/apercu", files={"file": ("tb.csv", buffer.getvalue().encode("utf-8"), "text/csv")}
+    )
+    assert reponse.status_code == 422
+    detail = reponse.json()["detail"]
+    assert detail["valide"] is False
+    erreur = detail["erreurs"][0]
+    assert (erreur["code"], erreur["ligne"], erreur["colonne"]) == ("surface_invalide", _ligne(0, 1) + 1, 7)
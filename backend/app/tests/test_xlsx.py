@@ -0,0 +1,68 @@
+"""Import XLSX : mêmes données que le CSV équivalent, quelle que soit la colonne de départ du tableau"""
+import csv
+from io import BytesIO, StringIO
+from typing import List
+
+import pytest
+from fastapi import UploadFile
+from openpyxl import Workbook, load_workbook
+
+from app.api.routes import TEMPLATE_PATH
+from app.services.csv_parser import CSVParser
+
+
+def _parser_xlsx(contenu: bytes):
+    return CSVParser().parse_upload(UploadFile(file=BytesIO(contenu), filename="tb.xlsx"))
+
+
+def _parser_csv(lignes: List[List[str]]):
+    buffer = StringIO()
+    csv.writer(buffer, delimiter=";").writerows(lignes)
+    return CSVParser().parse_upload(UploadFile(file=BytesIO(buffer.getvalue().encode("utf-8")), filename="tb.csv"))
+
+
+def _cellule_csv(valeur) -> str:
+    """Cellule telle qu'Excel l'écrit à l'export CSV"""
+    if valeur is None:
+        return ""
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return str(valeur)
+
+
+def _export_csv_du_modele() -> List[List[str]]:
+    ws = load_workbook(TEMPLATE_PATH, data_only=True).worksheets[0]
+    # Désignation ramenée en deuxième colonne (le tableau du modèle commence en C)
+    return [[_cellule_csv(v) for v in valeurs[1:]] for valeurs in ws.iter_rows(values_only=True)]
+
+
+def test_modele_xlsx_identique_a_son_export_csv():
+    contenu = TEMPLATE_PATH.read_bytes()
+    lignes = _export_csv_du_modele()
+
+    data = _parser_xlsx(contenu)
+    assert data == _parser_csv(lignes)
+    assert data.titre_foncier == "154311 /05"
+    assert [len(etage.lots) for etage in data.etages] == [12, 9, 8, 8, 4]
+
+
+def _cellule_xlsx(cellule: str):
+    """Valeur saisie dans Excel : les surfaces sont des nombres"""
+    return int(cellule) if cellule.isdigit() else cellule or None
+
+
+@pytest.mark.parametrize("decalage", [-1, 0, 1, 4])
+def test_colonne_de_depart_deduite_du_titre_foncier(decalage):
+    """`decalage` : colonnes vides ajoutées (ou retirées) devant le tableau du CSV"""
+    lignes = _export_csv_du_modele()
+    wb = Workbook()
+    ws = wb.active
+    # Lignes vides au-dessus du tableau, comme dans le modèle
+    ws.append([])
+    for ligne in lignes:
+        cellules = ligne[-decalage:] if decalage < 0 else [""] * decalage + ligne
+        ws.append([_cellule_xlsx(c) for c in cellules])
+    contenu = BytesIO()
+    wb.save(contenu)
+
+    assert _parser_xlsx(contenu.getvalue()) == _parser_csv(lignes)
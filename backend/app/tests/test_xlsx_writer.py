@@ -0,0 +1,140 @@
+"""Sérialisation XLSX : profils de compression, profil du serveur (XLSX_COMPRESSION_PROFILE), chaînes partagées"""
+import importlib
+import struct
+import zlib
+from io import BytesIO
+from xml.etree import ElementTree
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import Workbook, load_workbook
+
+from app.services import xlsx_writer
+from app.services.xlsx_writer import PROFILS_COMPRESSION, resoudre_profil, save_workbook
+
+
+def _classeur() -> Workbook:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Voix"
+    for i in range(200):
+        ws.append([f"Lot {i % 12}", "Appartement", i, i * 1.5])
+    return wb
+
+
+def _octets_compresses(contenu: bytes, entree) -> bytes:
+    """Données brutes d'une entrée, telles qu'écrites dans l'archive"""
+    entete = contenu[entree.header_offset:entree.header_offset + 30]
+    longueur_nom, longueur_extra = struct.unpack("<HH", entete[26:30])
+    debut = entree.header_offset + 30 + longueur_nom + longueur_extra
+    return contenu[debut:debut + entree.compress_size]
+
+
+def _deflate(donnees: bytes, niveau: int) -> bytes:
+    compresseur = zlib.compressobj(niveau, zlib.DEFLATED, -15)
+    return compresseur.compress(donnees) + compresseur.flush()
+
+
+@pytest.mark.parametrize("profil", list(PROFILS_COMPRESSION))
+def test_niveau_deflate_du_profil(profil):
+    compression, niveau = PROFILS_COMPRESSION[profil]
+    contenu = save_workbook(_classeur(), profil).getvalue()
+
+    archive = ZipFile(BytesIO(contenu))
+    for entree in archive.infolist():
+        assert entree.compress_type == compression, entree.filename
+        donnees = archive.read(entree)
+        if compression == ZIP_STORED:
+            assert _octets_compresses(contenu, entree) == donnees
+        else:
+            # Le flux deflate de l'archive est celui du niveau du profil
+            assert _octets_compresses(contenu, entree) == _deflate(donnees, niveau), entree.filename
+
+    # Le classeur se relit quel que soit le profil
+    assert load_workbook(BytesIO(contenu))["Voix"]["A3"].value == "Lot 2"
+
+
+def test_tailles_ordonnees_par_profil():
+    tailles = {profil: len(save_workbook(_classeur(), profil).getvalue()) for profil in PROFILS_COMPRESSION}
+    assert tailles["small"] <= tailles["default"] <= tailles["fast"] < tailles["stored"]
+
+
+def test_profil_inconnu():
+    with pytest.raises(HTTPException) as erreur:
+        resoudre_profil("ultra")
+    assert erreur.value.status_code == 400
+
+
+@pytest.fixture
+def profil_du_serveur(monkeypatch):
+    """Recharge le module avec XLSX_COMPRESSION_PROFILE, puis le rétablit"""
+    def recharger(valeur):
+        monkeypatch.setenv("XLSX_COMPRESSION_PROFILE", valeur)
+        importlib.reload(xlsx_writer)
+
+    yield recharger
+    monkeypatch.delenv("XLSX_COMPRESSION_PROFILE", raising=False)
+    importlib.reload(xlsx_writer)
+
+
+def test_profil_choisi_par_l_environnement(profil_du_serveur):
+    profil_du_serveur("small")
+    assert xlsx_writer.PROFIL_PAR_DEFAUT == "small"
+    assert xlsx_writer.resoudre_profil(None) == "small"
+    # Un profil demandé explicitement reste prioritaire
+    assert xlsx_writer.resoudre_profil("fast") == "fast"
+
+    contenu = xlsx_writer.save_workbook(_classeur()).getvalue()
+    archive = ZipFile(BytesIO(contenu))
+    entree = archive.getinfo("xl/worksheets/sheet1.xml")
+    assert entree.compress_type == ZIP_DEFLATED
+    assert _octets_compresses(contenu, entree) == _deflate(archive.read(entree), 9)
+
+
+def test_profil_d_environnement_inconnu(profil_du_serveur):
+    profil_du_serveur("rapide")
+    with pytest.raises(HTTPException):
+        xlsx_writer.resoudre_profil(None)
+
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _chaines(archive: ZipFile):
+    sst = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
+    return sst, [si.find(f"{NS}t").text for si in sst]
+
+
+def test_chaines_partagees_dedupliquees():
+    wb = _classeur()
+    autre = wb.create_sheet("TA")
+    autre.append(["Appartement", " espace en tête", "R&D <1>"])
+    archive = ZipFile(save_workbook(wb))
+
+    sst, chaines = _chaines(archive)
+    # Une entrée par valeur distincte, toutes feuilles confondues
+    assert len(chaines) == len(set(chaines)) == 12 + 3
+    assert sst.get("uniqueCount") == "15"
+    assert sst.get("count") == f"{200 * 2 + 3}"
+    feuille = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert "inlineStr" not in feuille
+
+    relu = load_workbook(BytesIO(archive.fp.getvalue()))
+    assert [c.value for c in relu["TA"][1]] == ["Appartement", " espace en tête", "R&D <1>"]
+    assert relu["Voix"]["B200"].value == "Appartement"
+
+
+def test_chaines_en_ligne():
+    archive = ZipFile(save_workbook(_classeur(), chaines_partagees=False))
+    assert "xl/sharedStrings.xml" not in archive.namelist()
+    assert "inlineStr" in archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+
+
+@pytest.mark.parametrize("chaines_partagees", [True, False])
+def test_liens_hypertexte_conserves(chaines_partagees):
+    wb = _classeur()
+    wb["Voix"]["A1"].hyperlink = "https://example.org/titre"
+    relu = load_workbook(save_workbook(wb, chaines_partagees=chaines_partagees))
+    assert relu["Voix"]["A1"].value == "Lot 0"
+    assert relu["Voix"]["A1"].hyperlink.target == "https://example.org/titre"
@@ -0,0 +1,94 @@
+"""Générateur d'immeubles synthétiques au format du CSV TB (benchmarks, tests)"""
+import csv
+import random
+from io import StringIO
+from typing import List
+
+CONSISTANCES_COMMUNES = [
+    ("Cage d'escaliers", ""),
+    ("Murs,Piliers et Gaines", "dont {indice}a= {surplomb}m2 de surplomb"),
+    ("Vide sur cour", ""),
+]
+
+
+def _nom_etage(numero: int) -> str:
+    if numero == 0:
+        return "Rez-de-chaussée"
+    return f"Etage {numero}"
+
+
+def generer_lignes(
+    nb_etages: int = 5,
+    lots_par_etage: int = 6,
+    titre_foncier: str = "154311 /05",
+    seed: int = 0,
+) -> List[List[str]]:
+    """Génère les lignes d'un tableau TB : un rez-de-chaussée commercial puis des étages d'appartements"""
+    rng = random.Random(seed)
+    propriete = "RESIDENCE SYNTHETIQUE"
+
+    rows: List[List[str]] = [
+        ["", f"Modification successives du Titre foncier  : {titre_foncier}"],
+        ["", "Propriété dite", " Titre N°", "Indices des parties", "", "Surface  en m²", "", "Consistance", "Observations"],
+        ["", "", "", "", "", "Intérieure du titre", "Avec surplomb", "", ""],
+        ["", "", "", "Privative", "Commune", "", "", "", ""],
+    ]
+
+    indice = 1
+    num_lot = 1
+    cote = 0.10
+    for etage in range(nb_etages):
+        rows.append(["", f"{_nom_etage(etage)} : de la cote {cote:.2f}m à la cote {cote + 3:.2f}m".replace(".", ",")])
+        cote += 3.20
+        total_int = 0
+        total_surp = 0
+
+        for _ in range(lots_par_etage):
+            surface = rng.randint(20, 120)
+            if etage == 0:
+                surplomb = 0
+                consistance = f"Local Commercial {num_lot}+WC"
+                indice_privative = str(indice)
+                observations = ""
+            else:
+                surplomb = rng.choice([0, 0, rng.randint(2, 16)])
+                consistance = "Appartement"
+                indice_privative = f"{indice}-{indice}a" if surplomb else str(indice)
+                observations = f"dont {indice}a={surplomb}m2  en  surplomb" if surplomb else ""
+            rows.append([
+                "", f"{propriete} {num_lot}", "T,,,,,,,,,,,,,,,,,", indice_privative, "",
+                str(surface), str(surface + surplomb), consistance, observations,
+            ])
+            total_int += surface
+            total_surp += surface + surplomb
+            indice += 1
+            num_lot += 1
+
+        for consistance, observations in CONSISTANCES_COMMUNES:
+            surface = rng.randint(10, 40)
+            surplomb = rng.randint(2, 12) if observations else 0
+            indice_commune = f"{indice}-{indice}a" if surplomb else str(indice)
+            rows.append([
+                "", "", "", "", indice_commune, str(surface), str(surface + surplomb), consistance,
+                observations.format(indice=indice, surplomb=surplomb),
+            ])
+            total_int += surface
+            total_surp += surface + surplomb
+            indice += 1
+
+        rows.append(["", "", "Total", "", "", str(total_int), str(total_surp), "", ""])
+
+    return rows
+
+
+def generer_csv(
+    nb_etages: int = 5,
+    lots_par_etage: int = 6,
+    delimiter: str = ";",
+    seed: int = 0,
+) -> str:
+    """Génère le contenu d'un CSV TB synthétique"""
+    buffer = StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\r\n")
+    writer.writerows(generer_lignes(nb_etages, lots_par_etage, seed=seed))
+    return buffer.getvalue()
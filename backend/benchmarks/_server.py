@@ -0,0 +1,29 @@
+"""Démarrage de l'API dans un thread pour les benchmarks de bout en bout"""
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+
+
+def _port_libre() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serveur_local(app: str = "app.main:app"):
+    """Lance uvicorn sur un port libre et renvoie l'URL de base"""
+    port = _port_libre()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
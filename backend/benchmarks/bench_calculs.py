@@ -0,0 +1,75 @@
+"""Benchmark : calculs Quot P CH2 / Voix en centièmes entiers contre les formules en Decimal
+
+Arithmétique seule (quote-part, indivision, NVi de chaque lot) : la
+référence en Decimal est celle des tests d'équivalence
+(app/tests/test_calculs.py). La dernière colonne donne la durée complète de
+calculer_quotation / calculer_voix, construction des lignes comprise.
+
+    cd backend && python -m benchmarks.bench_calculs
+"""
+import argparse
+import time
+
+from app.models.models import ImportedData
+from app.services.calculs import _decimal, _diviser_arrondi, calculer_quotation, calculer_voix, en_centiemes
+from app.tests.test_calculs import immeuble, quotation_decimal, voix_decimal
+
+
+def _surfaces_privees(data: ImportedData):
+    return [
+        (en_centiemes(lot.surface_avec_surplomb), en_centiemes(etage.total_surface_interieure))
+        for etage in data.etages for lot in etage.lots if lot.indice_privative
+    ]
+
+
+def quotation_entiers(data: ImportedData):
+    surfaces = _surfaces_privees(data)
+    total = sum(surface for surface, _ in surfaces)
+    return [
+        (_decimal(_diviser_arrondi(surface * surface_etage, total), 2), _diviser_arrondi(surface * 10000, total))
+        for surface, surface_etage in surfaces
+    ]
+
+
+def voix_entiers(data: ImportedData):
+    surfaces = _surfaces_privees(data)
+    total = sum(surface for surface, _ in surfaces)
+    return [_decimal(_diviser_arrondi(surface * 10000, total), 2) for surface, _ in surfaces]
+
+
+def chronometrer(fonction, data, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fonction(data)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tailles", default="20x20,100x40,300x50", help="étages x lots par étage")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'immeuble':<10} {'lots':>6} {'calcul':<10} {'Decimal ms':>11} {'entiers ms':>11} {'gain':>6}"
+        f" {'complet ms':>11}"
+    )
+    for taille in args.tailles.split(","):
+        nb_etages, lots = (int(v) for v in taille.split("x"))
+        data = immeuble(nb_etages, lots, seed=0, centiemes=True)
+        nb_lots = sum(len(etage.lots) for etage in data.etages)
+        for nom, reference, entiers, complet in (
+            ("quotation", quotation_decimal, quotation_entiers, calculer_quotation),
+            ("voix", voix_decimal, voix_entiers, calculer_voix),
+        ):
+            duree_reference = chronometrer(reference, data, args.repeat)
+            duree_entiers = chronometrer(entiers, data, args.repeat)
+            duree_complete = chronometrer(complet, data, args.repeat)
+            print(
+                f"{taille:<10} {nb_lots:>6} {nom:<10} {duree_reference:>11.2f} {duree_entiers:>11.2f}"
+                f" {duree_reference / duree_entiers:>6.2f} {duree_complete:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
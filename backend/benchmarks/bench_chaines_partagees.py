@@ -0,0 +1,49 @@
+"""Benchmark : chaînes partagées (sharedStrings.xml) contre chaînes en ligne d'openpyxl
+
+Temps CPU de la sauvegarde et taille du XLSX des cinq feuilles, sur de
+grands immeubles, pour les profils de compression par défaut et sans
+compression.
+
+    cd backend && python -m benchmarks.bench_chaines_partagees
+"""
+import argparse
+import csv
+import time
+from io import StringIO
+
+from app.services.csv_parser import CSVParser
+from app.services.xlsx_writer import save_workbook
+from app.utils.synthetic import generer_csv
+from benchmarks.bench_compression_profiles import construire_classeur
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tailles", default="60x30,200x40", help="étages x lots par étage")
+    parser.add_argument("--profils", default="default,stored")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_parser = CSVParser()
+    print(f"{'immeuble':<10} {'lots':>6} {'profil':<8} {'chaînes':<9} {'CPU ms':>9} {'taille Ko':>10}")
+    for taille in args.tailles.split(","):
+        nb_etages, lots = (int(v) for v in taille.split("x"))
+        data = csv_parser._parse_rows(csv.reader(StringIO(generer_csv(nb_etages, lots)), delimiter=";"))
+        nb_lots = sum(len(etage.lots) for etage in data.etages)
+        wb = construire_classeur(csv_parser, data)
+
+        for profil in args.profils.split(","):
+            for partagees in (False, True):
+                start = time.process_time()
+                for _ in range(args.repeat):
+                    buffer = save_workbook(wb, profil, chaines_partagees=partagees)
+                cpu = (time.process_time() - start) / args.repeat * 1000
+                mode = "partagées" if partagees else "en ligne"
+                print(
+                    f"{taille:<10} {nb_lots:>6} {profil:<8} {mode:<9} {cpu:>9.1f}"
+                    f" {len(buffer.getvalue()) / 1024:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
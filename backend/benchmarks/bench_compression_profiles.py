@@ -0,0 +1,51 @@
+"""Benchmark : temps CPU et taille du XLSX par profil de compression
+
+    cd backend && python -m benchmarks.bench_compression_profiles
+"""
+import argparse
+import csv
+import time
+from io import StringIO
+
+from openpyxl import Workbook
+
+from app.services.csv_parser import CSVParser
+from app.services.xlsx_writer import PROFILS_COMPRESSION, save_workbook
+from app.utils.synthetic import generer_csv
+
+
+def construire_classeur(parser: CSVParser, data) -> Workbook:
+    wb = Workbook()
+    wb.remove(wb.active)
+    parser.generer_xlxs_quotation(data, wb)
+    parser.generer_excel_tr_n(data, wb)
+    parser.generate_excel_tr_c(data, wb)
+    parser.generer_xlxs_ta(data, wb)
+    parser.generer_xlxs_voix(data, wb)
+    return wb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tailles", default="5x6,20x20,60x30", help="étages x lots par étage")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_parser = CSVParser()
+    print(f"{'immeuble':<10} {'lots':>6} {'profil':<8} {'CPU ms':>9} {'taille Ko':>10}")
+    for taille in args.tailles.split(","):
+        nb_etages, lots = (int(v) for v in taille.split("x"))
+        data = csv_parser._parse_rows(csv.reader(StringIO(generer_csv(nb_etages, lots)), delimiter=";"))
+        nb_lots = sum(len(etage.lots) for etage in data.etages)
+        wb = construire_classeur(csv_parser, data)
+
+        for profil in PROFILS_COMPRESSION:
+            start = time.process_time()
+            for _ in range(args.repeat):
+                buffer = save_workbook(wb, profil)
+            cpu = (time.process_time() - start) / args.repeat * 1000
+            print(f"{taille:<10} {nb_lots:>6} {profil:<8} {cpu:>9.1f} {len(buffer.getvalue()) / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
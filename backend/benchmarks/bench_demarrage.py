@@ -0,0 +1,82 @@
+"""Benchmark : démarrage à froid et première requête, uvicorn contre serveur pré-forké
+
+Pour chaque mode de démarrage (load_test.SERVEURS), mesure le temps
+jusqu'à ce que /health réponde, la latence de la première puis de la
+deuxième génération des cinq feuilles, et la mémoire des processus (RSS
+cumulée, et PSS, qui compte une seule fois les pages partagées en copie
+sur écriture). Le temps d'import de l'application est mesuré à part dans
+un interpréteur neuf.
+
+    cd backend && python -m benchmarks.bench_demarrage --workers 2
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.utils.synthetic import generer_csv
+from benchmarks.load_test import BACKEND_DIR, FICHIERS, SERVEURS, Serveur, _descendants, _rss_ko
+
+
+def _pss_ko(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for ligne in smaps:
+                if ligne.startswith("Pss:"):
+                    return int(ligne.split()[1])
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return 0
+
+
+def temps_import() -> float:
+    """Import de app.main dans un interpréteur neuf (ms)"""
+    code = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+    sortie = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return float(sortie.stdout.strip())
+
+
+def generer(url: str, csv: bytes) -> float:
+    debut = time.perf_counter()
+    reponse = httpx.post(
+        f"{url}/api/fichiers-copropriete", data={"fichiersAGenerer": FICHIERS},
+        files={"file": ("tb.csv", csv, "text/csv")}, timeout=120,
+    )
+    reponse.raise_for_status()
+    return (time.perf_counter() - debut) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--serveurs", default=",".join(SERVEURS))
+    parser.add_argument("--taille", default="10x8", help="immeuble synthétique : étages x lots par étage")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    nb_etages, lots = (int(v) for v in args.taille.split("x"))
+    imports = sorted(temps_import() for _ in range(args.repeat))[args.repeat // 2]
+    print(f"import de app.main : {imports:.0f} ms (médiane de {args.repeat})")
+    print(f"{'serveur':<14} {'prêt ms':>8} {'1re req ms':>11} {'2e req ms':>10} {'RSS Mo':>8} {'PSS Mo':>8}")
+    for nom in args.serveurs.split(","):
+        for _ in range(args.repeat):
+            # Contenu distinct à chaque requête : ni cache ni 304
+            csvs = [generer_csv(nb_etages, lots, seed=i).encode("utf-8") for i in (1, 2)]
+            debut = time.perf_counter()
+            serveur = Serveur(args.workers, {"CACHE_DISQUE_DIR": ""}, nom)
+            try:
+                serveur.attendre()
+                pret = (time.perf_counter() - debut) * 1000
+                premiere, deuxieme = (generer(serveur.url, csv) for csv in csvs)
+                pids = [serveur.process.pid] + _descendants(serveur.process.pid)
+                rss = sum(_rss_ko(pid) for pid in pids) / 1024
+                pss = sum(_pss_ko(pid) for pid in pids) / 1024
+            finally:
+                serveur.arreter()
+            print(f"{nom:<14} {pret:>8.0f} {premiere:>11.0f} {deuxieme:>10.0f} {rss:>8.1f} {pss:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
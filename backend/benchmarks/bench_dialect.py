@@ -0,0 +1,64 @@
+"""Benchmark : détection encodage / délimiteur contre l'ancien chemin csv.Sniffer
+
+    cd backend && python -m benchmarks.bench_dialect
+"""
+import argparse
+import csv
+import time
+from io import BytesIO, TextIOWrapper
+
+from app.services.dialect import detecter_dialecte_flux
+from app.utils.synthetic import generer_csv
+
+
+def sniffer_path(data: bytes):
+    """Ancien chemin de validate_csv : copie complète, UTF-8 seul, Sniffer sur 2 Ko"""
+    file_bytes = BytesIO(BytesIO(data).read())
+    try:
+        sample = TextIOWrapper(file_bytes, encoding="utf-8").read(2048)
+    except UnicodeDecodeError:
+        return None, None
+    try:
+        return "utf-8", csv.Sniffer().sniff(sample).delimiter
+    except csv.Error:
+        return "utf-8", ";"
+
+
+def detection_path(data: bytes):
+    dialecte = detecter_dialecte_flux(BytesIO(data))
+    return dialecte.encoding, dialecte.delimiter
+
+
+def bench(fn, data: bytes, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(data)
+    return (time.perf_counter() - start) / repeat * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--etages", type=int, default=20)
+    parser.add_argument("--lots", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cas = []
+    for delimiter in (";", ","):
+        texte = generer_csv(args.etages, args.lots, delimiter=delimiter)
+        cas.append((f"utf-8 '{delimiter}'", texte.encode("utf-8"), ("utf-8", delimiter)))
+        cas.append((f"utf-8 BOM '{delimiter}'", texte.encode("utf-8-sig"), ("utf-8-sig", delimiter)))
+        cas.append((f"cp1252 '{delimiter}'", texte.encode("cp1252"), ("cp1252", delimiter)))
+
+    print(f"{'cas':<18} {'taille':>9} | {'sniffer µs':>10} {'ok':>3} | {'détection µs':>12} {'ok':>3}")
+    for nom, data, attendu in cas:
+        t_sniff, r_sniff = bench(sniffer_path, data, args.repeat)
+        t_detect, r_detect = bench(detection_path, data, args.repeat)
+        print(
+            f"{nom:<18} {len(data):>9} | {t_sniff:>10.1f} {'oui' if r_sniff == attendu else 'non':>3} | "
+            f"{t_detect:>12.1f} {'oui' if r_detect == attendu else 'non':>3}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark : parsing séquentiel (multipart) contre parsing au fil de l'eau (corps brut)
+
+Le CSV est envoyé à débit limité ; on mesure la latence totale et la latence
+après le dernier octet envoyé, c'est-à-dire le travail qui n'a pas pu être
+recouvert par le transfert. La feuille TR-C, peu coûteuse à générer, laisse
+le parsing dominer.
+
+    cd backend && python -m benchmarks.bench_ingestion --debit 2000
+"""
+import argparse
+import time
+
+import httpx
+
+from app.utils.synthetic import generer_csv
+from benchmarks._server import serveur_local
+from benchmarks.bench_upload_compression import corps_multipart, flux_bride
+
+FICHIERS = ["TR-C"]
+
+
+class Chrono:
+    """Enveloppe un générateur de corps et note l'instant du dernier octet"""
+
+    def __init__(self, blocs):
+        self._blocs = blocs
+        self.dernier_octet = None
+
+    def __iter__(self):
+        yield from self._blocs
+        self.dernier_octet = time.perf_counter()
+
+
+def envoyer(client: httpx.Client, url: str, body, headers, params=None):
+    chrono = Chrono(body)
+    start = time.perf_counter()
+    response = client.post(url, content=chrono, headers=headers, params=params)
+    fin = time.perf_counter()
+    return response.status_code, fin - start, fin - chrono.dernier_octet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debit", type=float, default=2000, help="débit simulé en kbit/s")
+    parser.add_argument("--tailles", default="40x25,100x40", help="étages x lots par étage")
+    args = parser.parse_args()
+
+    with serveur_local() as base_url, httpx.Client(base_url=base_url, timeout=600) as client:
+        print(f"débit simulé : {args.debit:.0f} kbit/s")
+        print(f"{'immeuble':<10} {'mode':<10} {'octets':>9} {'latence s':>10} {'après envoi s':>14} {'statut':>6}")
+        for taille in args.tailles.split(","):
+            nb_etages, lots = (int(v) for v in taille.split("x"))
+            raw = generer_csv(nb_etages, lots).encode("utf-8")
+
+            body, multipart_type = corps_multipart("tb.csv", "text/csv", raw, FICHIERS)
+            mesures = [
+                ("multipart", envoyer(
+                    client, "/api/fichiers-copropriete",
+                    flux_bride(body, args.debit), {"Content-Type": multipart_type},
+                )),
+                ("flux", envoyer(
+                    client, "/api/fichiers-copropriete/flux",
+                    flux_bride(raw, args.debit), {"Content-Type": "text/csv"},
+                    params={"fichiersAGenerer": FICHIERS},
+                )),
+            ]
+            for mode, (statut, latence, apres_envoi) in mesures:
+                print(f"{taille:<10} {mode:<10} {len(raw):>9} {latence:>10.2f} {apres_envoi:>14.3f} {statut:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark : conversion de colonnes de surfaces (100 000 cellules par défaut)
+
+Compare l'ancien _parse_float (float() cellule par cellule, formats
+français refusés), nombre() cellule par cellule et convertir_colonne()
+sur des colonnes de nombres simples, à virgule décimale, avec séparateurs
+de milliers, et mixtes avec 1 % de cellules invalides.
+
+    cd backend && python -m benchmarks.bench_nombres
+"""
+import argparse
+import random
+import time
+from typing import Callable, List, Optional
+
+from app.services.nombres import convertir_colonne, nombre
+
+
+def ancien_parse_float(value: str) -> Optional[float]:
+    """_parse_float avant la prise en charge des formats français"""
+    if not value or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def colonnes(taille: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    surfaces = [rng.randint(1000, 250000) / 100 for _ in range(taille)]
+    francais = [f"{v:,.2f}".replace(",", " ").replace(".", ",") for v in surfaces]
+    mixte = [
+        "12,5x" if rng.random() < 0.01 else rng.choice((f"{v:.2f}", f"{v:.2f}".replace(".", ","), f))
+        for v, f in zip(surfaces, francais)
+    ]
+    return {
+        "simples": [f"{v:.2f}" for v in surfaces],
+        "virgule": [f"{v:.2f}".replace(".", ",") for v in surfaces],
+        "milliers": francais,
+        "mixte 1 % inv.": mixte,
+    }
+
+
+def mesurer(fn: Callable[[], List[Optional[float]]], repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        valeurs = fn()
+    duree = (time.perf_counter() - start) / repeat
+    return duree, sum(v is not None for v in valeurs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cellules", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    methodes = {
+        "ancien": lambda cellules: [ancien_parse_float(c) for c in cellules],
+        "nombre()": lambda cellules: [nombre(c) for c in cellules],
+        "colonne": lambda cellules: convertir_colonne(cellules).valeurs,
+    }
+    print(f"{'colonne':<15} {'méthode':<9} {'ms':>8} {'Mcell/s':>8} {'lues':>8}")
+    for nom, cellules in colonnes(args.cellules).items():
+        for methode, fn in methodes.items():
+            duree, lues = mesurer(lambda: fn(cellules), args.repeat)
+            print(f"{nom:<15} {methode:<9} {duree * 1000:>8.1f} {len(cellules) / duree / 1e6:>8.2f} {lues:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark : rendu séquentiel contre rendu parallèle par blocs d'étages (Quot P CH2, TA)
+
+Temps écoulé de generer_classeur (rendu + sérialisation) selon le nombre de
+processus de rendu. Le gain dépend du nombre de cœurs réellement
+disponibles : sur une machine à un cœur, le mode parallèle ne fait
+qu'ajouter le coût du transfert des blocs.
+
+    cd backend && python -m benchmarks.bench_rendu_parallele --workers 2,4,8
+"""
+import argparse
+import csv
+import os
+import time
+from io import StringIO
+
+from app.services import rendu_parallele
+from app.services.csv_parser import CSVParser
+from app.utils.synthetic import generer_csv
+
+FICHIERS = ["Quot P CH2", "TA"]
+
+
+def mesurer(csv_parser: CSVParser, data, parallele: bool, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        csv_parser.generer_classeur(data, FICHIERS, parallele=parallele)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tailles", default="120x20,200x30", help="étages x lots par étage")
+    parser.add_argument("--workers", default="2,4", help="nombres de processus de rendu")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_parser = CSVParser()
+    print(f"cœurs disponibles : {os.cpu_count()}")
+    print(f"{'immeuble':<10} {'lots':>6} {'mode':<12} {'temps s':>8} {'accélération':>13}")
+    for taille in args.tailles.split(","):
+        nb_etages, lots = (int(v) for v in taille.split("x"))
+        data = csv_parser._parse_rows(csv.reader(StringIO(generer_csv(nb_etages, lots)), delimiter=";"))
+        nb_lots = sum(len(etage.lots) for etage in data.etages)
+
+        sequentiel = mesurer(csv_parser, data, False, args.repeat)
+        print(f"{taille:<10} {nb_lots:>6} {'séquentiel':<12} {sequentiel:>8.2f} {1:>13.2f}")
+        for workers in (int(v) for v in args.workers.split(",")):
+            # Nouveau pool à chaque nombre de processus, démarré hors mesure
+            if rendu_parallele._executeur is not None:
+                rendu_parallele._executeur.shutdown()
+                rendu_parallele._executeur = None
+            rendu_parallele.WORKERS = workers
+            mesurer(csv_parser, data, True, 1)
+
+            duree = mesurer(csv_parser, data, True, args.repeat)
+            print(f"{taille:<10} {nb_lots:>6} {f'{workers} proc.':<12} {duree:>8.2f} {sequentiel / duree:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
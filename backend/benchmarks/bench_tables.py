@@ -0,0 +1,80 @@
+"""Benchmark : export des tableaux en colonnes contre classeur XLSX, côté production et côté chargement
+
+Production : classeur Quot P CH2 + Voix (openpyxl) contre tables lots /
+etages dans chaque format disponible. Chargement : relecture des
+quots-parts depuis le classeur (openpyxl en lecture seule, comme les
+traitements en aval) contre lecture des tables.
+
+    cd backend && python -m benchmarks.bench_tables
+"""
+import argparse
+import csv
+import time
+from io import BytesIO, StringIO, TextIOWrapper
+
+from openpyxl import load_workbook
+
+from app.services.csv_parser import CSVParser
+from app.services.tables import COLONNES_LOTS, FORMATS_TABLES, calculer_tables, ecrire_table, pyarrow
+from app.utils.synthetic import generer_csv
+
+
+def chronometrer(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resultat = fn()
+    return (time.perf_counter() - start) / repeat * 1000, resultat
+
+
+def quots_parts_xlsx(contenu: bytes) -> int:
+    wb = load_workbook(BytesIO(contenu), read_only=True)
+    try:
+        return sum(1 for row in wb["Quot P CH2"].iter_rows(values_only=True) if any(row))
+    finally:
+        wb.close()
+
+
+def quots_parts_table(contenu: bytes, format: str) -> int:
+    if format == "csv":
+        lecteur = csv.DictReader(TextIOWrapper(BytesIO(contenu), encoding="utf-8", newline=""))
+        return sum(1 for ligne in lecteur if ligne["quot_part"])
+    if format == "parquet":
+        table = pyarrow.parquet.read_table(BytesIO(contenu), columns=["quot_part"])
+    else:
+        table = pyarrow.ipc.open_file(BytesIO(contenu)).read_all().select(["quot_part"])
+    return len(table) - table.column("quot_part").null_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tailles", default="20x10,100x30", help="étages x lots par étage")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    formats = [f for f, (_, pyarrow_requis) in FORMATS_TABLES.items() if pyarrow is not None or not pyarrow_requis]
+    csv_parser = CSVParser()
+    print(f"{'immeuble':<10} {'lots':>6} {'sortie':<8} {'production ms':>14} {'Ko':>8} {'chargement ms':>14}")
+    for taille in args.tailles.split(","):
+        nb_etages, lots = (int(v) for v in taille.split("x"))
+        data = csv_parser._parse_rows(csv.reader(StringIO(generer_csv(nb_etages, lots)), delimiter=";"))
+        nb_lots = sum(len(etage.lots) for etage in data.etages)
+
+        production, classeur = chronometrer(
+            lambda: csv_parser.generer_classeur(data, ["Quot P CH2", "Voix"]).getvalue(), args.repeat
+        )
+        chargement, _ = chronometrer(lambda: quots_parts_xlsx(classeur), args.repeat)
+        print(f"{taille:<10} {nb_lots:>6} {'xlsx':<8} {production:>14.1f} {len(classeur) / 1024:>8.1f} {chargement:>14.1f}")
+
+        for format in formats:
+            def produire():
+                sortie = BytesIO()
+                ecrire_table(calculer_tables(data).lots, COLONNES_LOTS, format, sortie)
+                return sortie.getvalue()
+
+            production, contenu = chronometrer(produire, args.repeat)
+            chargement, _ = chronometrer(lambda: quots_parts_table(contenu, format), args.repeat)
+            print(f"{taille:<10} {nb_lots:>6} {format:<8} {production:>14.1f} {len(contenu) / 1024:>8.1f} {chargement:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
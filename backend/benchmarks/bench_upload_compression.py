@@ -0,0 +1,90 @@
+"""Benchmark : uploads compressés (gzip, zstd) sur un lien local bridé
+
+Le corps multipart est envoyé par blocs à débit limité (simulation d'une
+liaison lente de bureau de terrain) ; on mesure les octets transférés et la
+latence de bout en bout de /api/fichiers-copropriete.
+
+    cd backend && python -m benchmarks.bench_upload_compression --debit 512
+"""
+import argparse
+import gzip
+import time
+import uuid
+
+import httpx
+
+from app.utils.synthetic import generer_csv
+from benchmarks._server import serveur_local
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TAILLE_BLOC = 4096
+
+
+def corps_multipart(filename: str, content_type: str, data: bytes, fichiers):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for fichier in fichiers:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="fichiersAGenerer"\r\n\r\n{fichier}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def flux_bride(body: bytes, debit_kbit: float):
+    """Émet le corps par blocs en respectant le débit donné (kbit/s)"""
+    octets_par_seconde = debit_kbit * 1000 / 8
+    start = time.perf_counter()
+    for offset in range(0, len(body), TAILLE_BLOC):
+        bloc = body[offset:offset + TAILLE_BLOC]
+        yield bloc
+        attente = start + (offset + len(bloc)) / octets_par_seconde - time.perf_counter()
+        if attente > 0:
+            time.sleep(attente)
+
+
+def variantes(raw: bytes):
+    yield "csv", "tb.csv", "text/csv", raw
+    yield "gzip", "tb.csv.gz", "application/gzip", gzip.compress(raw)
+    if zstandard is not None:
+        yield "zstd", "tb.csv.zst", "application/zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debit", type=float, default=512, help="débit simulé en kbit/s")
+    parser.add_argument("--tailles", default="10x10,40x25", help="étages x lots par étage")
+    args = parser.parse_args()
+
+    fichiers = ["Quot P CH2", "TA", "Voix"]
+    with serveur_local() as base_url, httpx.Client(base_url=base_url, timeout=600) as client:
+        print(f"débit simulé : {args.debit:.0f} kbit/s")
+        print(f"{'immeuble':<10} {'variante':<6} {'octets':>9} {'ratio':>6} {'latence s':>10} {'statut':>6}")
+        for taille in args.tailles.split(","):
+            nb_etages, lots = (int(v) for v in taille.split("x"))
+            raw = generer_csv(nb_etages, lots).encode("utf-8")
+            for nom, filename, content_type, data in variantes(raw):
+                body, multipart_type = corps_multipart(filename, content_type, data, fichiers)
+                start = time.perf_counter()
+                response = client.post(
+                    "/api/fichiers-copropriete",
+                    content=flux_bride(body, args.debit),
+                    headers={"Content-Type": multipart_type},
+                )
+                latence = time.perf_counter() - start
+                print(
+                    f"{taille:<10} {nom:<6} {len(data):>9} {len(data) / len(raw):>6.2f} "
+                    f"{latence:>10.2f} {response.status_code:>6}"
+                )
+
+
+if __name__ == "__main__":
+    main()
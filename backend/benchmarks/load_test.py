@@ -0,0 +1,269 @@
+"""Test de charge local : débit, latences p50/p95/p99 et mémoire du serveur
+
+Lance `app.main:app` sous uvicorn ou app.serveur (sous-processus, N
+workers), puis rejoue pendant une durée donnée un mélange de requêtes à
+concurrence fixe :
+
+    fichiers : POST /api/fichiers-copropriete avec un CSV synthétique
+    data     : GET  /api/data
+    modele   : GET  /api/modele
+
+La RSS cumulée du serveur (maître + workers) est échantillonnée via /proc.
+Pour comparer des configurations, lancer une exécution par configuration
+et, au besoin, enregistrer les résultats en JSON :
+
+    cd backend && python -m benchmarks.load_test --workers 1 --concurrence 8
+    cd backend && python -m benchmarks.load_test --workers 4 --profil fast --json w4.json
+    cd backend && python -m benchmarks.load_test --env XLSX_COMPRESSION_PROFILE=small
+    cd backend && python -m benchmarks.load_test --workers 4 --serveur prefork
+
+Les données de /api/data sont propres à chaque worker : un préchauffage
+envoie quelques /api/upload pour que chaque worker en ait vraisemblablement
+reçu ; les 400 restants sont comptés comme erreurs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.utils.synthetic import generer_csv
+from benchmarks._server import _port_libre
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+FICHIERS = ["Quot P CH2", "TR-N", "TR-C", "TA", "Voix"]
+
+
+def centile(valeurs: List[float], p: float) -> Optional[float]:
+    """Centile par rang le plus proche (valeurs triées)"""
+    if not valeurs:
+        return None
+    rang = max(0, min(len(valeurs) - 1, round(p / 100 * len(valeurs) + 0.5) - 1))
+    return valeurs[rang]
+
+
+def _rss_ko(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for ligne in status:
+                if ligne.startswith("VmRSS:"):
+                    return int(ligne.split()[1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+def _descendants(pid: int) -> List[int]:
+    enfants = []
+    try:
+        for tache in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tache}/children") as fichier:
+                enfants += [int(enfant) for enfant in fichier.read().split()]
+    except (FileNotFoundError, ProcessLookupError):
+        return []
+    return enfants + [petit for enfant in enfants for petit in _descendants(enfant)]
+
+
+class EchantillonneurRSS(threading.Thread):
+    """Relève périodiquement la RSS cumulée d'un processus et de ses descendants"""
+
+    def __init__(self, pid: int, periode: float):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.periode = periode
+        self.mesures: List[tuple] = []
+        self._arret = threading.Event()
+        self._debut = time.perf_counter()
+
+    def run(self):
+        while not self._arret.is_set():
+            pids = [self.pid] + _descendants(self.pid)
+            self.mesures.append((time.perf_counter() - self._debut, sum(_rss_ko(pid) for pid in pids)))
+            self._arret.wait(self.periode)
+
+    def arreter(self):
+        self._arret.set()
+        self.join()
+
+
+# Serveurs comparables : uvicorn (workers spawn), app.serveur pré-forké, avec ou sans préchauffage
+SERVEURS = {
+    "uvicorn": ["-m", "uvicorn", "app.main:app"],
+    "prefork": ["-m", "app.serveur"],
+    "prefork-froid": ["-m", "app.serveur", "--sans-prechauffage"],
+}
+
+
+class Serveur:
+    """Serveur en sous-processus, pour mesurer plusieurs workers comme en production"""
+
+    def __init__(self, workers: int, env: Dict[str, str], serveur: str = "uvicorn"):
+        self.port = _port_libre()
+        self.url = f"http://127.0.0.1:{self.port}"
+        commande = [
+            sys.executable, *SERVEURS[serveur],
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--workers", str(workers), "--log-level", "warning",
+        ]
+        self.process = subprocess.Popen(commande, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+    def attendre(self, timeout: float = 30):
+        limite = time.perf_counter() + timeout
+        while time.perf_counter() < limite:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"le serveur s'est arrêté (code {self.process.returncode})")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("le serveur n'a pas démarré à temps")
+
+    def arreter(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _melange(spec: str) -> List[str]:
+    """"fichiers=1,data=4" -> liste pondérée d'endpoints tirés à tour de rôle"""
+    tirage = []
+    for element in spec.split(","):
+        nom, _, poids = element.partition("=")
+        tirage += [nom.strip()] * int(poids or 1)
+    return tirage
+
+
+async def _requete(client: httpx.AsyncClient, endpoint: str, csv: bytes, profil: Optional[str]) -> int:
+    if endpoint == "fichiers":
+        data = {"fichiersAGenerer": FICHIERS}
+        if profil:
+            data["profilCompression"] = profil
+        response = await client.post(
+            "/api/fichiers-copropriete", data=data, files={"file": ("tb.csv", csv, "text/csv")}
+        )
+    elif endpoint == "data":
+        response = await client.get("/api/data")
+    elif endpoint == "modele":
+        response = await client.get("/api/modele")
+    else:
+        raise ValueError(f"Endpoint inconnu : {endpoint}")
+    await response.aread()
+    return response.status_code
+
+
+async def _charge(url: str, tirage: List[str], csv: bytes, args) -> Dict[str, list]:
+    """Préchauffe les workers puis maintient `concurrence` requêtes en vol pendant `duree` secondes"""
+    resultats: Dict[str, list] = defaultdict(list)
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout) as client:
+        for _ in range(args.workers * 4):
+            await client.post("/api/upload", files={"file": ("tb.csv", csv, "text/csv")})
+        debut = time.perf_counter()
+        limite = debut + args.duree
+
+        async def utilisateur(rang: int):
+            i = rang
+            while time.perf_counter() < limite:
+                endpoint = tirage[i % len(tirage)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    statut = await _requete(client, endpoint, csv, args.profil)
+                except httpx.HTTPError:
+                    statut = None
+                fin = time.perf_counter()
+                resultats[endpoint].append((fin - start, statut, fin - debut))
+
+        await asyncio.gather(*(utilisateur(rang) for rang in range(args.concurrence)))
+    return resultats
+
+
+def _synthese(resultats: Dict[str, list], duree: float) -> Dict[str, dict]:
+    synthese = {}
+    for endpoint, mesures in sorted(resultats.items()):
+        latences = sorted(latence for latence, _, _ in mesures)
+        erreurs = sum(1 for _, statut, _ in mesures if statut is None or statut >= 400)
+        synthese[endpoint] = {
+            "requetes": len(mesures),
+            "debit_rps": len(mesures) / duree,
+            "taux_erreur": erreurs / len(mesures) if mesures else 0.0,
+            "p50_ms": centile(latences, 50) * 1000,
+            "p95_ms": centile(latences, 95) * 1000,
+            "p99_ms": centile(latences, 99) * 1000,
+        }
+    return synthese
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1, help="workers du serveur")
+    parser.add_argument("--serveur", choices=list(SERVEURS), default="uvicorn", help="mode de démarrage du serveur")
+    parser.add_argument("--concurrence", type=int, default=8, help="requêtes simultanées")
+    parser.add_argument("--duree", type=float, default=30, help="durée de la charge en secondes")
+    parser.add_argument("--melange", default="fichiers=1,data=4,modele=1", help="endpoints et poids")
+    parser.add_argument("--taille", default="20x15", help="immeuble synthétique : étages x lots par étage")
+    parser.add_argument("--profil", default=None, help="profil de compression XLSX (fast, default, small, stored)")
+    parser.add_argument("--env", action="append", default=[], help="variable KEY=VAL passée au serveur")
+    parser.add_argument("--periode-rss", type=float, default=0.5, help="période d'échantillonnage RSS (s)")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout par requête (s)")
+    parser.add_argument("--json", help="enregistre les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    nb_etages, lots = (int(v) for v in args.taille.split("x"))
+    csv = generer_csv(nb_etages, lots).encode("utf-8")
+    env = dict(element.split("=", 1) for element in args.env)
+
+    serveur = Serveur(args.workers, env, args.serveur)
+    try:
+        serveur.attendre()
+        rss = EchantillonneurRSS(serveur.process.pid, args.periode_rss)
+        rss.start()
+        resultats = asyncio.run(_charge(serveur.url, _melange(args.melange), csv, args))
+        rss.arreter()
+    finally:
+        serveur.arreter()
+
+    duree = max(args.duree, max((fin for mesures in resultats.values() for _, _, fin in mesures), default=0))
+    synthese = _synthese(resultats, duree)
+    print(f"serveur={args.serveur} workers={args.workers} concurrence={args.concurrence} durée={duree:.1f}s "
+          f"immeuble={args.taille} profil={args.profil or 'serveur'} env={env or '-'}")
+    print(f"{'endpoint':<10} {'requêtes':>9} {'req/s':>8} {'erreurs':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in synthese.items():
+        print(
+            f"{endpoint:<10} {stats['requetes']:>9} {stats['debit_rps']:>8.1f} {stats['taux_erreur']:>8.1%} "
+            f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}"
+        )
+
+    print("RSS serveur (Mo) :")
+    pas = max(1, len(rss.mesures) // 20)
+    for instant, ko in rss.mesures[::pas]:
+        print(f"  t={instant:6.1f}s  {ko / 1024:8.1f}")
+    print(f"  pic : {max((ko for _, ko in rss.mesures), default=0) / 1024:.1f}")
+
+    if args.json:
+        with open(args.json, "w") as fichier:
+            json.dump({
+                "configuration": {
+                    "serveur": args.serveur, "workers": args.workers, "concurrence": args.concurrence, "duree": duree,
+                    "melange": args.melange, "taille": args.taille, "profil": args.profil, "env": env,
+                },
+                "endpoints": synthese,
+                "rss_ko": rss.mesures,
+            }, fichier, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,3 +32,75 @@ export const getFichiersCopropriete = async (
     } catch (error) {}
   }
 };
+
+const GET_APERCU_URL = "/apercu";
+
+export type LigneQuotation = {
+  indice_privative: string | null;
+  indice_commune: string | null;
+  consistance: string;
+  surface_interieure: number;
+  surface_avec_surplomb: number;
+  quot_part: string | null;
+  indivision: string | null;
+  observations: string | null;
+};
+
+export type EtageQuotation = {
+  nom: string;
+  cotes: string;
+  lignes: LigneQuotation[];
+  total_surface_interieure: number | null;
+  total_surface_avec_surplomb: number | null;
+  total_quots_parts: string | null;
+  total_indivision: string | null;
+};
+
+export type LigneVoix = {
+  num_ordre: number;
+  indice_privative: string;
+  consistance: string;
+  surface: number;
+  nvi: string;
+};
+
+export type TotauxConsistance = {
+  commerces: string | null;
+  appartements: string | null;
+};
+
+export type Apercu = {
+  titre_foncier: string;
+  quotation: {
+    etages: EtageQuotation[];
+    total_surface_interieure: number;
+    total_surface_avec_surplomb: number;
+    total_quots_parts: string;
+    total_indivision: string;
+  } | null;
+  tr_n: (TotauxConsistance & { nom: string })[] | null;
+  tr_c: TotauxConsistance | null;
+  ta: { nom: string; lignes: { propriete: string; indice_privative: string; surface_avec_surplomb: number; consistance: string; observations: string | null }[] }[] | null;
+  voix: {
+    etages: { nom: string; lignes: LigneVoix[] }[];
+    surface_totale: number;
+    somme_nvi: string;
+  } | null;
+};
+
+export const getApercu = async (
+  fichiersAGenerer: string[],
+  file: File | null,
+): Promise<Apercu | undefined> => {
+  if (file) {
+    const formData = new FormData();
+    formData.append("file", file);
+    fichiersAGenerer.forEach((f) => formData.append("fichiersAGenerer", f));
+
+    try {
+      return await axiosInstance
+        .post(GET_APERCU_URL, formData)
+        .then((response) => response.data);
+    } catch (error) {}
+  }
+};
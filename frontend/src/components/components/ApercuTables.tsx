@@ -0,0 +1,100 @@
+import type { Apercu } from "@/api/api";
+
+const cellule = "border px-2 py-1 text-center";
+
+export default function ApercuTables({ apercu }: { apercu: Apercu }) {
+  return (
+    <div className="flex flex-col gap-6 text-sm">
+      {apercu.quotation && (
+        <div className="overflow-x-auto">
+          <h3 className="font-bold mb-2">Quot P CH2</h3>
+          <table className="w-full border-collapse">
+            <thead>
+              <tr>
+                <th className={cellule}>Privative</th>
+                <th className={cellule}>Commune</th>
+                <th className={cellule}>Consistance</th>
+                <th className={cellule}>Intérieure</th>
+                <th className={cellule}>Avec surplomb</th>
+                <th className={cellule}>Quote-part (m²)</th>
+                <th className={cellule}>Indivision (1/10000)</th>
+              </tr>
+            </thead>
+            <tbody>
+              {apercu.quotation.etages.map((etage) => [
+                <tr key={`${etage.nom}-titre`}>
+                  <td className={`${cellule} font-bold`} colSpan={7}>
+                    {etage.nom} : {etage.cotes}
+                  </td>
+                </tr>,
+                ...etage.lignes.map((ligne, i) => (
+                  <tr key={`${etage.nom}-${i}`}>
+                    <td className={cellule}>{ligne.indice_privative}</td>
+                    <td className={cellule}>{ligne.indice_commune}</td>
+                    <td className={cellule}>{ligne.consistance}</td>
+                    <td className={cellule}>{ligne.surface_interieure}</td>
+                    <td className={cellule}>{ligne.surface_avec_surplomb}</td>
+                    <td className={cellule}>{ligne.quot_part}</td>
+                    <td className={cellule}>{ligne.indivision}</td>
+                  </tr>
+                )),
+                <tr key={`${etage.nom}-total`} className="font-bold">
+                  <td className={cellule} colSpan={3}>Total</td>
+                  <td className={cellule}>{etage.total_surface_interieure}</td>
+                  <td className={cellule}>{etage.total_surface_avec_surplomb}</td>
+                  <td className={`${cellule} text-red-500`}>{etage.total_quots_parts}</td>
+                  <td className={`${cellule} text-red-500`}>{etage.total_indivision}</td>
+                </tr>,
+              ])}
+            </tbody>
+          </table>
+        </div>
+      )}
+
+      {apercu.voix && (
+        <div className="overflow-x-auto">
+          <h3 className="font-bold mb-2">Voix</h3>
+          <table className="w-full border-collapse">
+            <thead>
+              <tr>
+                <th className={cellule}>N° d'ordre</th>
+                <th className={cellule}>Indices</th>
+                <th className={cellule}>Niveau</th>
+                <th className={cellule}>Consistance</th>
+                <th className={cellule}>Si (m²)</th>
+                <th className={cellule}>NVi (%)</th>
+              </tr>
+            </thead>
+            <tbody>
+              {apercu.voix.etages.flatMap((etage) =>
+                etage.lignes.map((ligne) => (
+                  <tr key={ligne.num_ordre}>
+                    <td className={cellule}>{ligne.num_ordre}</td>
+                    <td className={cellule}>{ligne.indice_privative}</td>
+                    <td className={cellule}>{etage.nom}</td>
+                    <td className={cellule}>{ligne.consistance}</td>
+                    <td className={cellule}>{ligne.surface}</td>
+                    <td className={cellule}>{ligne.nvi}</td>
+                  </tr>
+                )),
+              )}
+              <tr className="font-bold">
+                <td className={cellule} colSpan={4}>Total</td>
+                <td className={cellule}>{apercu.voix.surface_totale}</td>
+                <td className={cellule}>{apercu.voix.somme_nvi}</td>
+              </tr>
+            </tbody>
+          </table>
+        </div>
+      )}
+
+      {apercu.tr_c && (
+        <div>
+          <h3 className="font-bold mb-2">TR-C</h3>
+          <p>Commerces : {apercu.tr_c.commerces ?? "-"} m²</p>
+          <p>Appartements : {apercu.tr_c.appartements ?? "-"} m²</p>
+        </div>
+      )}
+    </div>
+  );
+}
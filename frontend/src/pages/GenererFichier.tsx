@@ -1,4 +1,5 @@
-import { getFichiersCopropriete, getModele } from "@/api/api";
+import { getApercu, getFichiersCopropriete, getModele, type Apercu } from "@/api/api";
+import ApercuTables from "@/components/components/ApercuTables";
 import CustomBeadCrumb from "@/components/components/CustomBeadCrumb";
 import { Button } from "@/components/ui/button";
 import {
@@ -9,9 +10,14 @@ import {
   CardTitle,
 } from "@/components/ui/card";
 import { Input } from "@/components/ui/input";
-import { Play, Upload } from "lucide-react";
+import { Eye, Play, Upload } from "lucide-react";
 import { useState } from "react";
 
+const EXTENSIONS_ACCEPTEES = [".csv", ".csv.gz", ".csv.zst", ".xlsx"];
+
+const isFichierAccepte = (file: File) =>
+  EXTENSIONS_ACCEPTEES.some((ext) => file.name.toLowerCase().endsWith(ext));
+
 export default function GenererFichier() {
   const dowloadTemplate = async () => {
     const blob = await getModele();
@@ -28,6 +34,7 @@ export default function GenererFichier() {
     a.remove();
   };
   const [file, setFile] = useState<File | null>(null);
+  const [apercu, setApercu] = useState<Apercu | null>(null);
   const fichiersConfig = [
     {
       key: "Quot P CH2",
@@ -74,13 +81,18 @@ export default function GenererFichier() {
     }
   };
 
+  const afficherApercu = async () => {
+    setApercu((await getApercu(fichiersSelectionnes, file)) ?? null);
+  };
+
   const genererFichiers = async () => {
     const data = await getFichiersCopropriete(fichiersSelectionnes, file);
     const url = URL.createObjectURL(data);
     const a = document.createElement("a");
     a.style.display = "none";
     a.href = url;
-    a.download = "Fichier_de_coproprieté";
+    // PV / Règlement demandés : archive zip du classeur et des documents
+    a.download = data.type === "application/zip" ? "Fichiers_de_coproprieté.zip" : "Fichier_de_coproprieté.xlsx";
     document.body.appendChild(a);
     a.click()
 
@@ -177,7 +189,7 @@ export default function GenererFichier() {
           <CardHeader>
             <CardTitle>Importer le fichier TB</CardTitle>
             <CardDescription>
-              Sélectionnez le fichier CSV TB complété.
+              Sélectionnez le fichier TB complété (CSV ou modèle Excel XLSX).
             </CardDescription>
           </CardHeader>
           <CardContent>
@@ -191,9 +203,10 @@ export default function GenererFichier() {
                 <Input
                   type="file"
                   className="hover:bg-primary-foreground"
-                  accept=".csv"
+                  accept={EXTENSIONS_ACCEPTEES.join(",")}
                   onChange={(e) => {
                     setFile(e.target.files?.[0] || null);
+                    setApercu(null);
                   }}
                 />
               </Button>
@@ -235,27 +248,53 @@ export default function GenererFichier() {
               {!file && (<span className="text-red-400">
                 Aucun fichier sélectionné
               </span>)}
-              {file && !file.name.endsWith(".csv") && (<span className="text-red-400">
-                Le fichier doit être au format <span className="font-bold">CSV</span> 
+              {file && !isFichierAccepte(file) && (<span className="text-red-400">
+                Le fichier doit être au format <span className="font-bold">CSV</span> ou <span className="font-bold">XLSX</span>
               </span>)}
               {fichiersSelectionnes.length === 0 && (<span className="text-red-400">
                 Sélectionnez <span className="font-bold">au moins un</span> fichier à générer
               </span>)}
             </div>
-            <Button
-              disabled={
-                !file ||
-                !file.name.endsWith(".csv") ||
-                fichiersSelectionnes.length === 0
-              }
-              onClick={genererFichiers}
-              size="lg"
-            >
-              <Play className="mr-2 h-4 w-4" />
-              Générer les fichiers
-            </Button>
+            <div className="flex gap-2">
+              <Button
+                variant="outline"
+                disabled={!file || !isFichierAccepte(file)}
+                onClick={afficherApercu}
+                size="lg"
+              >
+                <Eye className="mr-2 h-4 w-4" />
+                Aperçu
+              </Button>
+              <Button
+                disabled={
+                  !file ||
+                  !isFichierAccepte(file) ||
+                  fichiersSelectionnes.length === 0
+                }
+                onClick={genererFichiers}
+                size="lg"
+              >
+                <Play className="mr-2 h-4 w-4" />
+                Générer les fichiers
+              </Button>
+            </div>
           </CardContent>
         </Card>
+
+        {/* 👁️ Aperçu */}
+        {apercu && (
+          <Card>
+            <CardHeader>
+              <CardTitle>Aperçu — TF {apercu.titre_foncier}</CardTitle>
+              <CardDescription>
+                Valeurs calculées, avant génération des fichiers.
+              </CardDescription>
+            </CardHeader>
+            <CardContent>
+              <ApercuTables apercu={apercu} />
+            </CardContent>
+          </Card>
+        )}
       </div>
     </CustomBeadCrumb>
 